@@ -0,0 +1,96 @@
+import hashlib
+import asyncio
+from typing import Awaitable, Callable
+
+FIRST_DIGITS = 5
+FEISTEL_ROUNDS = 4
+
+
+def _tier(seq: int) -> tuple[int, int, int]:
+    """Для порядкового номера -> (начало диапазона, размер диапазона, смещение внутри него).
+
+    Сначала расходуются все 5-значные номера, потом 6-значные и т.д.
+    """
+    digits = FIRST_DIGITS
+    while True:
+        low = 10 ** (digits - 1)
+        size = 9 * low
+        if seq < size:
+            return low, size, seq
+        seq -= size
+        digits += 1
+
+
+class FeistelPermutation:
+    """Биекция [0, n) -> [0, n) на сбалансированной сети Фейстеля с cycle-walking."""
+
+    def __init__(self, key: bytes, n: int):
+        self.key = key
+        self.n = n
+        bits = max(2, (n - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+
+    def _round(self, i: int, r: int) -> int:
+        h = hashlib.blake2b(r.to_bytes(8, "little"), digest_size=8, key=self.key, person=bytes([i]) + self.n.to_bytes(8, "little"))
+        return int.from_bytes(h.digest(), "little") & self.mask
+
+    def _encrypt(self, x: int) -> int:
+        left, right = x >> self.half, x & self.mask
+        for i in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self.half) | right
+
+    def __call__(self, x: int) -> int:
+        # домен сети — степень двойки; выпавшие за n значения прогоняем ещё раз
+        x = self._encrypt(x)
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+
+class TicketAllocator:
+    """Уникальные и трудноугадываемые номера заявок из общего счётчика.
+
+    reserve(n) атомарно сдвигает счётчик в хранилище на n и возвращает начало блока,
+    поэтому несколько процессов на одном хранилище никогда не получат один номер.
+    """
+
+    def __init__(
+        self,
+        key: bytes,
+        reserve: Callable[[int], Awaitable[int]],
+        exists: Callable[[str], Awaitable[bool]] | None = None,
+        block: int = 32,
+    ):
+        self.key = key
+        self.reserve = reserve
+        # номера, выданные ещё старым random-генератором, могут совпасть — их пропускаем
+        self.exists = exists
+        self.block = block
+        self._perms: dict[int, FeistelPermutation] = {}
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    def encode(self, seq: int) -> int:
+        low, size, offset = _tier(seq)
+        perm = self._perms.get(size)
+        if perm is None:
+            perm = self._perms[size] = FeistelPermutation(self.key, size)
+        return low + perm(offset)
+
+    async def _next_seq(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                self._next = await self.reserve(self.block)
+                self._end = self._next + self.block
+            seq = self._next
+            self._next += 1
+            return seq
+
+    async def next(self) -> int:
+        while True:
+            ticket = self.encode(await self._next_seq())
+            if self.exists is None or not await self.exists(str(ticket)):
+                return ticket
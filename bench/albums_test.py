@@ -0,0 +1,205 @@
+"""Альбомы пруфов от многих пользователей сразу: части разных альбомов перемешаны.
+
+Каждый пользователь проходит мастер выплаты до шага пруфа и присылает альбом из 1–10 фото
+(1 — обычное фото без media_group_id); части всех альбомов приходят вперемешку, внутри
+альбома — с паузами до --gap (меньше ALBUM_DEBOUNCE). Проверяется, что на каждого пользователя:
+один ответ «пруф получен» и ни одного отказа, в группу — один sendMediaGroup ровно с его файлами плюс одно сообщение
+с подписью и кнопками, а в заявке сохранены ключи всех файлов. --late — доля альбомов, у которых
+после сборки приходит ещё одна запоздавшая часть: она отбрасывается и не становится реквизитами.
+
+    python bench/albums_test.py --users 300
+    python bench/albums_test.py --users 300 --redis   # буфер альбомов в (заглушке) Redis
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+GROUP_ID = -100500
+
+
+def schedule(albums: list[list], spread: float, gap: float, rng: random.Random) -> list[tuple[float, dict]]:
+    """Время прихода каждой части: альбом начинается в случайный момент из [0, spread),
+    его части идут с паузами до gap (клиент шлёт их подряд) — альбомы разных людей перекрываются."""
+    out = []
+    for parts in albums:
+        t = rng.uniform(0, spread)
+        for raw in parts:
+            out.append((t, raw))
+            t += rng.uniform(0, gap)
+    out.sort(key=lambda x: x[0])
+    return out
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp()
+    env = {
+        "BOT_TOKEN": "42:BENCH",
+        "SUPPORT_GROUP_ID": str(GROUP_ID),
+        "TICKETS_FILE": os.path.join(tmp, "tickets.json"),
+        "USERS_FILE": os.path.join(tmp, "users.jsonl"),
+        "ALBUM_DEBOUNCE": str(args.debounce),
+        "SEND_GLOBAL_RATE": "1e9",
+        "SEND_CHAT_RATE": "1e9",
+        "SEND_GROUP_RATE": "1e9",
+    }
+    for var in ("THROTTLE_MENU", "THROTTLE_CONTACT", "THROTTLE_PAYOUT", "THROTTLE_MESSAGE"):
+        env[var] = "1e9/1"
+    fake_redis = None
+    if args.redis:
+        from fake_redis import FakeRedis
+
+        fake_redis = FakeRedis()
+        env["REDIS_URL"] = await fake_redis.start()
+    os.environ.update(env)
+
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import updates
+    from fake_api import FakeBotAPI
+    import main
+
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    await main.load_tickets()
+    await main.users.load()
+
+    rng = random.Random(args.seed)
+    update_ids = iter(range(1, 10**9))
+
+    async def feed(raw: dict):
+        update = Update.model_validate(dict(raw, update_id=next(update_ids)), context={"bot": main.bot})
+        await main.dp.feed_update(main.bot, update)
+
+    async def drain():
+        while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+            await asyncio.sleep(0.01)
+
+    uids = list(range(500_000, 500_000 + args.users))
+    sizes = {uid: rng.randint(1, 10) for uid in uids}
+
+    # до шага пруфа — все пользователи параллельно, у каждого по порядку
+    async def wizard(uid: int):
+        start, link, _, _ = updates.payout_flow(uid)
+        await feed(start)
+        await feed(link)
+    await asyncio.gather(*(wizard(uid) for uid in uids))
+    await drain()
+    api.calls.clear()
+
+    # части всех альбомов вперемешку: каждая — отдельной задачей, как при polling
+    albums = [
+        updates.album(uid, n, caption=f"стата {uid}") if n > 1 else [updates.photo(uid)]
+        for uid, n in sizes.items()
+    ]
+    t0 = time.perf_counter()
+    tasks = []
+    for at, raw in schedule(albums, args.spread, args.gap, rng):
+        delay = at - (time.perf_counter() - t0)
+        await asyncio.sleep(max(delay, 0))
+        tasks.append(asyncio.create_task(feed(raw)))
+    await asyncio.gather(*tasks)
+    collect_s = time.perf_counter() - t0
+
+    # запоздавшие части уже собранных альбомов; ждём дольше debounce — успей такая часть
+    # начать новый альбом, она дошла бы до хендлера уже на шаге реквизитов
+    late_users = [uid for uid, parts in zip(sizes, albums) if len(parts) > 1 and rng.random() < args.late]
+    groups_of = {uid: parts[0]["message"]["media_group_id"] for uid, parts in zip(sizes, albums) if len(parts) > 1}
+    await asyncio.gather(*(feed(updates.photo(uid, media_group_id=groups_of[uid])) for uid in late_users))
+    await asyncio.sleep(args.debounce * 2)
+
+    await asyncio.gather(*(feed(updates.message(uid, f"UQ-wallet-{uid}")) for uid in uids))
+    await drain()
+
+    to_user = defaultdict(list)
+    groups, photos = defaultdict(list), Counter()
+    for _, method, p in api.calls:
+        chat = int(p.get("chat_id") or 0)
+        if chat > 0:
+            to_user[chat].append(p.get("text") or "")
+        elif method == "sendMediaGroup":
+            files = [m["media"] for m in json.loads(p["media"])]
+            # file_id фото из updates.photo: photo-<uid>-<n>; -1 — в одном альбоме файлы разных людей
+            owners = {int(f.split("-")[1]) for f in files}
+            groups[owners.pop() if len(owners) == 1 else -1].append(len(files))
+        elif method == "sendPhoto":
+            photos[int(p["photo"].split("-")[1])] += 1
+
+    proof_ok = sum(1 for uid in uids if sum("олучен" in t and "Пруф" in t for t in to_user[uid]) == 1)
+    rejects = sum(1 for uid in uids for t in to_user[uid] if "Это только текст" in t or "не похоже" in t)
+    album_users = [uid for uid in uids if sizes[uid] > 1]
+    albums_ok = sum(1 for uid in album_users if groups.get(uid) == [sizes[uid]])
+    singles_ok = sum(1 for uid in uids if sizes[uid] == 1 and photos[uid] == 1)
+
+    # реквизиты попадают только в пост для группы (подпись или сообщение с кнопками)
+    posted = [p.get("text") or p.get("caption") or "" for _, _, p in api.calls if int(p.get("chat_id") or 0) == GROUP_ID]
+    requisites_ok = sum(1 for uid in uids if sum(f"Реквизиты: UQ-wallet-{uid}" in t for t in posted) == 1)
+    stored = 0
+    async for rows in main.store.iter_rows():
+        for _, row in rows:
+            n = len(row.get("proof_keys") or [row.get("proof_key")])
+            stored += n == sizes.get(row.get("user_id"))
+
+    res = {
+        "users": args.users,
+        "redis": bool(args.redis),
+        "album_users": len(album_users),
+        "parts": sum(sizes.values()),
+        "collect_s": round(collect_s, 2),
+        "proof_replies_ok": proof_ok,
+        "rejections": rejects,
+        "albums_ok": albums_ok,
+        "mixed_albums": len(groups.get(-1, ())),
+        "singles_ok": singles_ok,
+        "caption_messages": sum(1 for _, m, p in api.calls if m == "sendMessage" and int(p["chat_id"]) == GROUP_ID),
+        "stored_ok": stored,
+        "late_parts": len(late_users),
+        "requisites_ok": requisites_ok,
+        "collector": main.album_collector.stats(),
+    }
+    print(json.dumps(res, ensure_ascii=False))
+
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+    if fake_redis is not None:
+        await fake_redis.close()
+
+    ok = (
+        proof_ok == args.users
+        and rejects == 0
+        and albums_ok == len(album_users)
+        and not groups.get(-1)
+        and singles_ok == args.users - len(album_users)
+        and res["caption_messages"] == len(album_users)
+        and stored == args.users
+        and requisites_ok == args.users
+        and res["collector"]["late"] == len(late_users)
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--debounce", type=float, default=0.7)
+    ap.add_argument("--spread", type=float, default=2.0, help="за сколько секунд приходят все альбомы")
+    ap.add_argument("--gap", type=float, default=0.1, help="пауза между частями одного альбома, до")
+    ap.add_argument("--late", type=float, default=0.2, help="доля альбомов с запоздавшей частью")
+    ap.add_argument("--redis", action="store_true")
+    ap.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
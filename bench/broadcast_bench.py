@@ -0,0 +1,138 @@
+"""Рассылка /broadcast по реестру пользователей с перезапуском посередине.
+
+Заполняет реестр --users пользователями (часть — с заблокированным ботом), запускает
+рассылку командой из админ-чата, на половине «перезапускает» бота (новый реестр из того же
+файла, новый Broadcaster, resume()) и проверяет: каждый живой пользователь получил сообщение,
+повторов не больше одной пачки, заблокировавшие убраны из реестра, темп не выше BROADCAST_RATE.
+
+    python bench/broadcast_bench.py --users 5000 --rate 200 --blocked 0.05
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+GROUP_ID = -100500
+
+
+async def run(n_users: int, rate: float, blocked_share: float, concurrency: int, seed: int):
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "BOT_TOKEN": "42:BENCH",
+        "SUPPORT_GROUP_ID": str(GROUP_ID),
+        "TICKETS_FILE": os.path.join(tmp, "tickets.json"),
+        "USERS_FILE": os.path.join(tmp, "users.jsonl"),
+        "BROADCAST_RATE": str(rate),
+        "BROADCAST_CONCURRENCY": str(concurrency),
+        "SEND_GLOBAL_RATE": "1e9",
+        "SEND_CHAT_RATE": "1e9",
+        "SEND_GROUP_RATE": "1e9",
+    })
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    from fake_api import FakeBotAPI
+    import main
+    from broadcast import Broadcaster
+    from users import FileUserRegistry
+
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    logging.getLogger("vsrap-bot.sender").setLevel(logging.CRITICAL)
+
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    rng = random.Random(seed)
+    chats = [10_000 + i * 7 for i in range(n_users)]
+    api.blocked = {c for c in chats if rng.random() < blocked_share}
+    await main.users.load()
+    await main.users.add_many(chats)
+    main.broadcaster.report_every = 1.0
+
+    update = Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "text": "/broadcast Новый выпуск подкаста!",
+            "chat": {"id": GROUP_ID, "type": "supergroup"},
+            "from": {"id": 7, "is_bot": False, "first_name": "Admin"},
+        },
+    }, context={"bot": main.bot})
+    t0 = time.perf_counter()
+    await main.dp.feed_update(main.bot, update)
+
+    # «рестарт» на середине: текущая задача отменяется, всё поднимается заново из файлов
+    while (await main.users.get_job() or {}).get("cursor") is None or \
+            main.broadcaster.job["sent"] + main.broadcaster.job["blocked"] < n_users // 2:
+        await asyncio.sleep(0.05)
+    await main.broadcaster.close()
+    await main.users.close()
+    main.users = FileUserRegistry(os.environ["USERS_FILE"])
+    await main.users.load()
+    main.broadcaster = Broadcaster(
+        main.users, main.claims, main.broadcast_send, main.broadcast_report,
+        rate=rate, concurrency=concurrency, report_every=1.0,
+    )
+    resumed = await main.broadcaster.resume()
+    while main.broadcaster.running:
+        await asyncio.sleep(0.05)
+    wall = time.perf_counter() - t0
+
+    sends = [(ts, int(p["chat_id"])) for ts, m, p in api.calls if m == "sendMessage" and int(p["chat_id"]) > 0]
+    got = Counter(c for _, c in sends)
+    alive = [c for c in chats if c not in api.blocked]
+    reports = [p.get("text", "") for _, m, p in api.calls if m in ("sendMessage", "editMessageText") and int(p["chat_id"]) == GROUP_ID]
+    # самый плотный отрезок в 1 с — темп не должен превышать rate (+ запас бакета)
+    times = sorted(ts for ts, _ in sends)
+    peak, j = 0, 0
+    for i, ts in enumerate(times):
+        while times[j] < ts - 1.0:
+            j += 1
+        peak = max(peak, i - j + 1)
+
+    res = {
+        "users": n_users,
+        "blocked": len(api.blocked),
+        "resumed": bool(resumed),
+        "wall_s": round(wall, 2),
+        "sends_per_s": round(len(sends) / wall, 1),
+        "peak_per_1s": peak,
+        "missed": sum(1 for c in alive if not got[c]),
+        "duplicates": sum(n - 1 for n in got.values() if n > 1),
+        "left_in_registry": await main.users.count(),
+        "reports": len(reports),
+        "last_report": reports[-1].splitlines()[0] if reports else "",
+    }
+    print(json.dumps(res, ensure_ascii=False))
+    await main.sender.close()
+    await main.users.close()
+    await main.bot.session.close()
+    await api.close()
+    ok = (
+        res["missed"] == 0
+        and res["duplicates"] <= concurrency
+        and res["left_in_registry"] == len(alive)
+        and peak <= rate + 2
+    )
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--rate", type=float, default=200)
+    ap.add_argument("--blocked", type=float, default=0.05)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    asyncio.run(run(args.users, args.rate, args.blocked, args.concurrency, args.seed))
@@ -0,0 +1,116 @@
+"""Скорость канонизации ссылок на ролики (links.canonical_video) на большом корпусе.
+
+Корпус — варианты ссылок на --videos роликов (www./m./короткие хосты, UTM-метки,
+/shorts/ и ?v= и т.п.); проверяется, что все варианты одного ролика дают один ключ.
+
+    python bench/canonical_bench.py --urls 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from links import canonical_video  # noqa: E402
+
+TRACKING = ["", "?utm_source=tg", "?is_from_webapp=1&sender_device=pc", "?si=AbCdEf123", "#comments", "?feature=share"]
+
+
+def yt_id(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_letters + string.digits + "-_") for _ in range(11))
+
+
+def variants(kind: str, vid: str, rng: random.Random) -> list[str]:
+    t = rng.choice(TRACKING)
+    if kind == "tiktok":
+        user = f"user{rng.randrange(10**6)}"
+        return [
+            f"https://www.tiktok.com/@{user}/video/{vid}{t}",
+            f"https://m.tiktok.com/v/{vid}.html{t}",
+            f"https://tiktok.com/@{user}/video/{vid}/",
+            f"https://www.tiktok.com/embed/v2/{vid}",
+        ]
+    if kind == "youtube":
+        return [
+            f"https://www.youtube.com/shorts/{vid}{t}",
+            f"https://youtu.be/{vid}{t}",
+            f"https://m.youtube.com/watch?v={vid}&feature=share",
+            f"https://youtube.com/shorts/{vid}/",
+        ]
+    if kind == "instagram":
+        return [
+            f"https://www.instagram.com/reel/{vid}/{t}",
+            f"https://instagram.com/reels/{vid}",
+            f"https://www.instagram.com/someone/reel/{vid}/?igsh=xyz",
+        ]
+    return [
+        f"https://vk.com/clip{vid}{t}",
+        f"https://vk.com/clips?z=clip{vid}",
+        f"https://vkvideo.ru/clip{vid}",
+    ]
+
+
+def corpus(n_urls: int, n_videos: int, seed: int) -> tuple[list[str], list[str]]:
+    rng = random.Random(seed)
+    videos = []
+    for i in range(n_videos):
+        kind = ("tiktok", "youtube", "instagram", "vk")[i % 4]
+        if kind == "tiktok":
+            vid = str(7_000_000_000_000_000_000 + i)
+        elif kind == "youtube":
+            vid = yt_id(rng)
+        elif kind == "instagram":
+            vid = "C" + yt_id(rng)[:10]
+        else:
+            vid = f"-{rng.randrange(10**8)}_{i}"
+        videos.append((kind, vid))
+    urls, owners = [], []
+    while len(urls) < n_urls:
+        kind, vid = videos[rng.randrange(n_videos)]
+        url = rng.choice(variants(kind, vid, rng))
+        urls.append(url)
+        owners.append(f"{kind}:{vid}")
+    return urls, owners
+
+
+def main(n_urls: int, n_videos: int, seed: int):
+    t0 = time.perf_counter()
+    urls, owners = corpus(n_urls, n_videos, seed)
+    gen_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    keys = [canonical_video(u) for u in urls]
+    wall = time.perf_counter() - t0
+
+    # все варианты одного ролика -> один ключ, разные ролики -> разные ключи
+    key_of: dict[str, set] = {}
+    for owner, key in zip(owners, keys):
+        key_of.setdefault(owner, set()).add(key)
+    split = sum(1 for ks in key_of.values() if len(ks) > 1)
+    merged = len(key_of) - len({k for ks in key_of.values() for k in ks})
+    res = {
+        "urls": n_urls,
+        "videos": len(key_of),
+        "gen_s": round(gen_s, 2),
+        "wall_s": round(wall, 3),
+        "urls_per_s": round(n_urls / wall),
+        "us_per_url": round(wall / n_urls * 1e6, 2),
+        "videos_with_several_keys": split,
+        "keys_shared_by_videos": merged,
+    }
+    print(json.dumps(res))
+    if split or merged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--urls", type=int, default=1_000_000)
+    ap.add_argument("--videos", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    main(args.urls, args.videos, args.seed)
@@ -0,0 +1,175 @@
+"""Холодный старт хранилища заявок: время до первого ответа и память процесса на 100k/1M.
+
+Пишет tickets.json так же, как JsonTicketStore.save (indent=2), с заявками как у бота
+(выплаты со ссылкой и ключами, обращения, часть — уже рассмотрена). Каждый бэкенд
+запускается в отдельном процессе: load(), затем обычные запросы бота — get по номеру,
+by_user, страница очереди, find_key. RSS — прирост VmRSS от load() (до него процесс уже
+импортировал storage), пик — VmHWM. Для columnar сначала отдельным процессом идёт
+одноразовый импорт tickets.json в снапшот (migrate_s), замер — на следующем старте.
+
+    python bench/coldstart_bench.py --sizes 100000 1000000
+    python bench/coldstart_bench.py --sizes 100000 --backends json journal columnar sqlite
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+STATUSES = ("new", "review", "paid", "rejected")
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def fake_row(i: int, rng: random.Random) -> dict:
+    uid = 100_000_000 + rng.randrange(max(i // 4, 1000))
+    row = {
+        "user_chat_id": uid,
+        "user_id": uid,
+        "username": f"user{uid}" if rng.random() < 0.8 else None,
+        "full_name": f"Пользователь {uid % 100000}",
+        "created_at": (T0 + timedelta(seconds=i * 20, microseconds=rng.randrange(10**6))).isoformat(),
+        "group_message_id": 1000 + i,
+        "sla_at": None,
+    }
+    if rng.random() < 0.3:
+        row["kind"] = "contact"
+        return row
+    status = rng.choice(STATUSES)
+    row.update(
+        kind="payout",
+        link=f"https://www.tiktok.com/@user{uid}/video/{7_300_000_000_000_000_000 + i}",
+        link_key=f"tiktok:{7_300_000_000_000_000_000 + i}",
+        proof_key=f"AgACAgIAAxkBAAI{i:012d}",
+        status=status,
+    )
+    if status != "new":
+        row.update(status_at=(T0 + timedelta(seconds=i * 20 + 3600)).isoformat(), status_by=7)
+    return row
+
+
+def prefill(path: str, n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    tickets = rng.sample(range(10_000_000, 99_999_999), n)
+    data = {str(t): fake_row(i, rng) for i, t in enumerate(tickets)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return [str(t) for t in tickets]
+
+
+def rss_kb(field: str = "VmRSS") -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+async def child(kind: str, path: str, probe: list[str], migrate: bool):
+    from storage import make_store
+
+    store = make_store(kind, path, sqlite_path=path + ".sqlite3", compact_every=10**9, compact_interval=None)
+    rss0 = rss_kb()
+    t0 = time.perf_counter()
+    await store.load()
+    load_s = time.perf_counter() - t0
+    if migrate:
+        await store.close()
+        print(json.dumps({"migrate_s": round(load_s, 2)}))
+        return
+    rss_loaded = rss_kb()
+
+    t0 = time.perf_counter()
+    rows = [await store.get(t) for t in probe]
+    get_us = (time.perf_counter() - t0) / len(probe) * 1e6
+    users = [r["user_id"] for r in rows[:200]]
+    t0 = time.perf_counter()
+    for uid in users:
+        await store.by_user(uid)
+    by_user_us = (time.perf_counter() - t0) / len(users) * 1e6
+    t0 = time.perf_counter()
+    for s in STATUSES:
+        await store.count_status(s)
+        await store.by_status(s, offset=1000, limit=10)
+    queue_ms = (time.perf_counter() - t0) / len(STATUSES) * 1e3
+    keys = [r["link_key"] for r in rows[:200] if r.get("link_key")]
+    t0 = time.perf_counter()
+    found = [await store.find_key(k) for k in keys]
+    find_us = (time.perf_counter() - t0) / max(len(keys), 1) * 1e6
+    count = await store.count()
+    await store.close()
+    print(json.dumps({
+        "load_s": round(load_s, 3),
+        "rss_mb": round((rss_loaded - rss0) / 1024, 1),
+        "peak_rss_mb": round(rss_kb("VmHWM") / 1024, 1),
+        "get_us": round(get_us, 1),
+        "by_user_us": round(by_user_us, 1),
+        "queue_page_ms": round(queue_ms, 2),
+        "find_key_us": round(find_us, 1),
+        "count": count,
+        "found_ok": all(found),
+        "rows_ok": all(rows),
+    }))
+
+
+def spawn(kind: str, path: str, probe_file: str, migrate: bool = False) -> dict:
+    cmd = [sys.executable, __file__, "--child", kind, path, "--probe", probe_file]
+    if migrate:
+        cmd.append("--migrate")
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(args):
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            src = os.path.join(workdir, f"tickets-{size}.json")
+            t0 = time.perf_counter()
+            tickets = prefill(src, size, args.seed)
+            prefill_s = time.perf_counter() - t0
+            probe = os.path.join(workdir, f"probe-{size}.json")
+            with open(probe, "w") as f:
+                json.dump(random.Random(args.seed).sample(tickets, min(args.probe, size)), f)
+            print(json.dumps({
+                "size": size, "json_mb": round(os.path.getsize(src) / 2**20, 1), "prefill_s": round(prefill_s, 1),
+            }), flush=True)
+            for kind in args.backends:
+                # у каждого бэкенда своя копия исходника: json/journal пишут рядом свои файлы
+                path = os.path.join(workdir, f"{kind}-{size}", "tickets.json")
+                os.makedirs(os.path.dirname(path))
+                os.link(src, path)
+                extra = {}
+                if kind in ("columnar", "sqlite"):
+                    extra = spawn(kind, path, probe, migrate=True)
+                res = {"backend": kind, "size": size, **extra, **spawn(kind, path, probe)}
+                ok = ok and res["count"] == size and res["found_ok"] and res["rows_ok"]
+                print(json.dumps(res), flush=True)
+            os.remove(src)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--backends", nargs="+", default=["json", "columnar"])
+    ap.add_argument("--probe", default=2000, help="сколько случайных заявок запросить по номеру")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--child", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    ap.add_argument("--migrate", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        with open(args.probe) as f:
+            probe = json.load(f)
+        asyncio.run(child(*args.child, probe, args.migrate))
+    else:
+        args.probe = int(args.probe)
+        run(args)
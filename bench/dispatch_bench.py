@@ -0,0 +1,135 @@
+"""Цена диспетчеризации одного апдейта: от feed_update до входа в хендлер и целиком.
+
+Гоняет через настоящий dp апдейты нескольких видов (кнопки меню, повторное нажатие на
+уже открытый экран, страница очереди в группе, сообщение админа в группе, /start) по
+одному, без параллельности, и для каждого вида пишет медиану и p95:
+route_us — от feed_update до входа в хендлер (outer-middleware, фильтры, разбор
+callback_data), total_us — вся обработка вместе с запросами к заглушке Bot API, и
+api_calls — сколько запросов к API ушло на апдейт.
+
+    python bench/dispatch_bench.py --n 2000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+from typing import Any
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("SUPPORT_GROUP_ID", "-100500")
+os.environ.setdefault("TICKETS_FILE", os.path.join(tempfile.mkdtemp(), "tickets.json"))
+os.environ.setdefault("USERS_FILE", os.path.join(os.path.dirname(os.environ["TICKETS_FILE"]), "users.jsonl"))
+for var in ("SEND_GLOBAL_RATE", "SEND_CHAT_RATE", "SEND_GROUP_RATE"):
+    os.environ.setdefault(var, "1e9")
+for var in ("THROTTLE_MENU", "THROTTLE_CONTACT", "THROTTLE_PAYOUT", "THROTTLE_MESSAGE"):
+    os.environ.setdefault(var, "1e9/1")
+
+from aiogram import BaseMiddleware  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import main  # noqa: E402
+import updates  # noqa: E402
+from fake_api import FakeBotAPI  # noqa: E402
+
+logging.getLogger("aiogram").setLevel(logging.WARNING)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+ADMIN_ID = 777
+GROUP_ID = int(os.environ["SUPPORT_GROUP_ID"])
+
+
+class Reached(BaseMiddleware):
+    """Последний inner-middleware: фильтры пройдены, дальше только хендлер."""
+
+    def __init__(self):
+        self.at: float | None = None
+
+    async def __call__(self, handler, event, data) -> Any:
+        self.at = time.perf_counter()
+        return await handler(event, data)
+
+
+def main_menu_markup() -> dict:
+    kb = main.MAIN_MENU_KB if hasattr(main, "MAIN_MENU_KB") else main.main_menu_kb()
+    return kb.model_dump(exclude_none=True)
+
+
+def scenarios(n: int) -> dict[str, list[dict]]:
+    uids = range(500_000, 500_000 + n)
+    return {
+        "menu": [updates.callback(uid, "menu:rates") for uid in uids],
+        # сообщение уже показывает главное меню — например, второй тап по «Назад»
+        "menu_same": [
+            updates.callback(uid, "menu:main", text="Главное меню", reply_markup=main_menu_markup())
+            for uid in uids
+        ],
+        "queue": [updates.callback(ADMIN_ID, "admin:queue:new:-:0", chat_id=GROUP_ID) for _ in uids],
+        "group_msg": [updates.message(ADMIN_ID, "обсуждаем в группе", chat_id=GROUP_ID) for _ in uids],
+        "start": [updates.message(uid, "/start") for uid in uids],
+    }
+
+
+def stats(samples: list[float]) -> dict[str, float]:
+    q = statistics.quantiles(samples, n=20)
+    return {"p50": round(statistics.median(samples) * 1e6, 1), "p95": round(q[18] * 1e6, 1)}
+
+
+async def run(args):
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    await main.load_tickets()
+    await main.users.load()
+    reached = Reached()
+    main.dp.message.middleware(reached)
+    main.dp.callback_query.middleware(reached)
+    ids = iter(range(1, 10**9))
+
+    for name, raw in scenarios(args.n).items():
+        parsed = [Update.model_validate(dict(u, update_id=next(ids)), context={"bot": main.bot}) for u in raw]
+        # прогрев: первые вызовы платят за импорты и кэши pydantic
+        for u in parsed[:args.warmup]:
+            await main.dp.feed_update(main.bot, u)
+        route, total = [], []
+        while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+            await asyncio.sleep(0.01)
+        calls = len(api.calls)
+        for u in parsed[args.warmup:]:
+            reached.at = None
+            t0 = time.perf_counter()
+            await main.dp.feed_update(main.bot, u)
+            total.append(time.perf_counter() - t0)
+            if reached.at is not None:
+                route.append(reached.at - t0)
+        # то, что ушло в очередь отправки, тоже считается
+        while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+            await asyncio.sleep(0.01)
+        done = len(parsed) - args.warmup
+        print(json.dumps({
+            "kind": name,
+            "updates": done,
+            "route_us": stats(route) if len(route) > 1 else None,
+            "total_us": stats(total),
+            "api_calls": round((len(api.calls) - calls) / done, 2),
+        }), flush=True)
+
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000, help="апдейтов каждого вида")
+    ap.add_argument("--warmup", type=int, default=100)
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,127 @@
+"""Потоковая выгрузка заявок (export.export_parts) на миллионах строк.
+
+Меряет скорость, пик памяти Python во время выгрузки (tracemalloc — без учёта
+уже загруженной базы; --no-trace отключает), самую долгую паузу цикла событий
+и сверяет число выгруженных строк с фильтром, посчитанным по сгенерированным данным.
+
+    python bench/export_bench.py --size 1000000 --backends sqlite json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from export import export_parts, parse_day  # noqa: E402
+from storage import STATUSES, make_store, row_matches  # noqa: E402
+
+USERS = 50_000
+
+
+def fake_row(i: int) -> dict:
+    return {
+        "user_chat_id": 100000 + i % USERS,
+        "user_id": 100000 + i % USERS,
+        "username": f"user{i % USERS}",
+        "full_name": f"User {i % USERS}",
+        "created_at": f"2026-{1 + i % 9:02d}-{1 + i % 28:02d}T12:{i % 60:02d}:00+00:00",
+        "kind": "contact" if i % 10 == 0 else "payout",
+        "status": STATUSES[i % len(STATUSES)],
+        "link": f"https://www.tiktok.com/@user{i % USERS}/video/{7_000_000_000_000_000_000 + i}",
+    }
+
+
+def prefill(path: str, n: int):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({str(i): fake_row(i) for i in range(n)}, f, ensure_ascii=False)
+
+
+async def max_lag(stop: asyncio.Event) -> float:
+    worst, interval = 0.0, 0.005
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+
+async def bench(
+    kind: str, size: int, fmt: str, filters: dict, workdir: str, part_mb: float, trace: bool
+) -> dict:
+    path = os.path.join(workdir, f"{kind}-{size}.json")
+    if not os.path.exists(path):
+        prefill(path, size)
+    store = make_store(kind, path, sqlite_path=path + ".sqlite3", compact_every=10**9, compact_interval=3600)
+    await store.load()
+    expected = sum(1 for i in range(size) if row_matches(fake_row(i), **filters))
+
+    outdir = os.path.join(workdir, f"out-{kind}")
+    os.makedirs(outdir, exist_ok=True)
+    stop = asyncio.Event()
+    lag = asyncio.create_task(max_lag(stop))
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    parts, rows, gz_bytes = 0, 0, 0
+    async for part, n in export_parts(store, fmt, outdir, filters, int(part_mb * 1024 * 1024)):
+        parts += 1
+        rows += n
+        gz_bytes += os.path.getsize(part)
+        os.remove(part)
+    wall = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    stop.set()
+    await store.close()
+
+    res = {
+        "backend": kind,
+        "size": size,
+        "format": fmt,
+        "rows": rows,
+        "expected": expected,
+        "parts": parts,
+        "gz_mb": round(gz_bytes / 2**20, 1),
+        "wall_s": round(wall, 2),
+        "rows_per_s": round(rows / wall) if wall else 0,
+        "peak_mb": round(peak / 2**20, 1),
+        "max_loop_lag_ms": round(await lag * 1000, 1),
+    }
+    return res
+
+
+async def run(args):
+    filters = {
+        "since": parse_day(args.since),
+        "until": parse_day(args.until),
+        "user_id": args.user,
+        "status": args.status,
+    }
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in args.backends:
+            res = await bench(kind, args.size, args.format, filters, workdir, args.part_mb, not args.no_trace)
+            ok = ok and res["rows"] == res["expected"]
+            print(json.dumps(res), flush=True)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=1_000_000)
+    ap.add_argument("--backends", nargs="+", default=["sqlite", "json"])
+    ap.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    ap.add_argument("--since")
+    ap.add_argument("--until")
+    ap.add_argument("--user", type=int)
+    ap.add_argument("--status", choices=STATUSES)
+    ap.add_argument("--part-mb", type=float, default=45)
+    # tracemalloc замедляет выгрузку в разы — для замера скорости и пауз цикла лучше без него
+    ap.add_argument("--no-trace", action="store_true")
+    asyncio.run(run(ap.parse_args()))
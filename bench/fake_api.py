@@ -0,0 +1,115 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков и нагрузочных прогонов."""
+import time
+import asyncio
+import itertools
+
+from aiohttp import web
+
+# методы, которые в ответ отдают Message
+_MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument", "sendVideo", "sendAnimation",
+    "editMessageText", "editMessageReplyMarkup",
+}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        # искусственная задержка ответа, чтобы имитировать сеть до api.telegram.org
+        self.latency = latency
+        # чаты, где бота заблокировали: отправка в них отвечает 403
+        self.blocked: set[int] = set()
+        self.calls: list[tuple[float, str, dict]] = []
+        self._updates: list[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._new_updates = asyncio.Condition()
+        self._waiters: dict[int, list[asyncio.Future]] = {}
+        self._runner: web.AppRunner | None = None
+        self.base = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://{host}:{port}"
+        return self.base
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # ---------- updates ----------
+
+    async def push_update(self, update: dict) -> dict:
+        update = dict(update, update_id=next(self._update_ids))
+        async with self._new_updates:
+            self._updates.append(update)
+            self._new_updates.notify_all()
+        return update
+
+    def wait_for_chat(self, chat_id: int) -> asyncio.Future:
+        """Future, который завершится при следующем исходящем вызове в этот чат."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append(fut)
+        return fut
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        async with self._new_updates:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self._updates[:100])
+
+    # ---------- methods ----------
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "text": params.get("text") or "",
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls.append((time.perf_counter(), method, params))
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if params.get("chat_id") is not None and int(params["chat_id"]) in self.blocked:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403,
+            )
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        elif method in _MESSAGE_METHODS:
+            result = self._message(params)
+        elif method == "copyMessage":
+            result = {"message_id": next(self._message_ids)}
+        elif method == "sendMediaGroup":
+            result = [self._message(params)]
+        else:
+            result = True
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            for fut in self._waiters.pop(int(chat_id), []):
+                if not fut.done():
+                    fut.set_result((time.perf_counter(), method, params))
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,363 @@
+"""Минимальный Redis (RESP2) в памяти — для проверки нескольких реплик без настоящего сервера.
+
+Поддерживает ровно то, чем пользуются бот и aiogram RedisStorage: строки с EX/PX/NX/XX,
+INCRBY, списки (RPUSH/LRANGE), множества (SADD/SREM), хэши (HGET/HSETNX), sorted set'ы (ZADD NX/XX,
+ZREM, ZCARD, ZCOUNT, ZRANGEBYSCORE с "("-границами), SCAN MATCH, SSCAN/ZSCAN, MGET, MULTI/EXEC и WATCH.
+
+    python bench/fake_redis.py --port 6390
+"""
+import time
+import fnmatch
+import asyncio
+import argparse
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data: dict[bytes, object] = {}
+        self.expires: dict[bytes, float] = {}
+        # версия ключа растёт на каждую запись — для WATCH
+        self.versions: dict[bytes, int] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._client, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # ---------- хранилище ----------
+
+    def _alive(self, key: bytes) -> bool:
+        exp = self.expires.get(key)
+        if exp is not None and exp <= time.monotonic():
+            self._drop(key)
+        return key in self.data
+
+    def _drop(self, key: bytes):
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        self._touch(key)
+
+    def _touch(self, key: bytes):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _put(self, key: bytes, value, ttl_ms: int | None = None):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ttl_ms is not None:
+            self.expires[key] = time.monotonic() + ttl_ms / 1000
+        self._touch(key)
+
+    # ---------- команды ----------
+
+    def execute(self, args: list[bytes]):
+        name = args[0].upper().decode()
+        fn = getattr(self, f"cmd_{name.lower()}", None)
+        if fn is None:
+            return Error(f"ERR unknown command '{name}'")
+        return fn(*args[1:])
+
+    def cmd_ping(self, *args):
+        return Simple("PONG")
+
+    def cmd_client(self, *args):
+        return Simple("OK")
+
+    def cmd_select(self, db):
+        return Simple("OK")
+
+    def cmd_get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(k) for k in keys]
+
+    def cmd_set(self, key, value, *opts):
+        opts = [o.upper() for o in opts]
+        ttl_ms = None
+        if b"EX" in opts:
+            ttl_ms = int(opts[opts.index(b"EX") + 1]) * 1000
+        if b"PX" in opts:
+            ttl_ms = int(opts[opts.index(b"PX") + 1])
+        exists = self._alive(key)
+        if (b"NX" in opts and exists) or (b"XX" in opts and not exists):
+            return None
+        self._put(key, value, ttl_ms)
+        return Simple("OK")
+
+    def cmd_del(self, *keys):
+        n = 0
+        for k in keys:
+            if self._alive(k):
+                self._drop(k)
+                n += 1
+        return n
+
+    def cmd_exists(self, *keys):
+        return sum(1 for k in keys if self._alive(k))
+
+    def cmd_incrby(self, key, n):
+        value = int(self.data[key]) if self._alive(key) else 0
+        value += int(n)
+        ttl = self.expires.get(key)
+        self.data[key] = str(value).encode()
+        self._touch(key)
+        if ttl is not None:
+            self.expires[key] = ttl
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(ms) / 1000
+        return 1
+
+    def cmd_expire(self, key, s):
+        return self.cmd_pexpire(key, int(s) * 1000)
+
+    def cmd_rpush(self, key, *values):
+        lst = self.data.get(key) if self._alive(key) else None
+        if lst is None:
+            lst = self.data[key] = []
+        lst.extend(values)
+        self._touch(key)
+        return len(lst)
+
+    def cmd_lrange(self, key, start, stop):
+        lst = self.data[key] if self._alive(key) else []
+        start, stop = int(start), int(stop)
+        return lst[start:] if stop == -1 else lst[start:stop + 1]
+
+    def cmd_sadd(self, key, *members):
+        s = self.data.get(key) if self._alive(key) else None
+        if s is None:
+            s = self.data[key] = set()
+        before = len(s)
+        s.update(members)
+        self._touch(key)
+        return len(s) - before
+
+    def cmd_srem(self, key, *members):
+        if not self._alive(key):
+            return 0
+        s = self.data[key]
+        n = sum(1 for m in members if m in s)
+        s.difference_update(members)
+        if n:
+            self._touch(key)
+        return n
+
+    def cmd_smembers(self, key):
+        return list(self.data[key]) if self._alive(key) else []
+
+    def cmd_sismember(self, key, member):
+        return int(self._alive(key) and member in self.data[key])
+
+    def cmd_scard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    @staticmethod
+    def _scan(members: list, cursor, opts) -> list:
+        # курсор — позиция в отсортированном списке; MATCH — только у SCAN
+        count = 10
+        opts = [o.upper() if isinstance(o, bytes) else o for o in opts]
+        if b"COUNT" in opts:
+            count = int(opts[opts.index(b"COUNT") + 1])
+        start = int(cursor)
+        page = members[start:start + count]
+        nxt = start + count if start + count < len(members) else 0
+        return [str(nxt).encode(), page]
+
+    def cmd_scan(self, cursor, *opts):
+        keys = sorted(k for k in list(self.data) if self._alive(k))
+        upper = [o.upper() for o in opts]
+        if b"MATCH" in upper:
+            pattern = opts[upper.index(b"MATCH") + 1]
+            keys = [k for k in keys if fnmatch.fnmatchcase(k, pattern)]
+        return self._scan(keys, cursor, opts)
+
+    def cmd_sscan(self, key, cursor, *opts):
+        members = sorted(self.data[key]) if self._alive(key) else []
+        return self._scan(members, cursor, opts)
+
+    def cmd_zscan(self, key, cursor, *opts):
+        z = self._zset(key)
+        members = sorted(z, key=lambda m: (z[m], m))
+        nxt, page = self._scan(members, cursor, opts)
+        return [nxt, [x for m in page for x in (m, repr(z[m]).encode())]]
+
+    def cmd_hsetnx(self, key, field, value):
+        h = self.data.get(key) if self._alive(key) else None
+        if h is None:
+            h = self.data[key] = {}
+        if field in h:
+            return 0
+        h[field] = value
+        self._touch(key)
+        return 1
+
+    def cmd_hget(self, key, field):
+        return self.data[key].get(field) if self._alive(key) else None
+
+    def _zset(self, key) -> dict:
+        return self.data[key] if self._alive(key) else {}
+
+    def cmd_zadd(self, key, *args):
+        z = self.data.get(key) if self._alive(key) else None
+        if z is None:
+            z = self.data[key] = {}
+        flags = set()
+        while args and args[0].upper() in (b"NX", b"XX"):
+            flags.add(args[0].upper())
+            args = args[1:]
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if (b"NX" in flags and member in z) or (b"XX" in flags and member not in z):
+                continue
+            added += member not in z
+            z[member] = float(score)
+        self._touch(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        z = self._zset(key)
+        n = sum(1 for m in members if z.pop(m, None) is not None)
+        if n:
+            self._touch(key)
+        return n
+
+    def cmd_zcard(self, key):
+        return len(self._zset(key))
+
+    @staticmethod
+    def _bound(raw: bytes) -> tuple[float, bool]:
+        # "(5" — строгая граница
+        if raw.startswith(b"("):
+            return float(raw[1:]), True
+        return float(raw), False
+
+    def _zrange(self, key, lo, hi) -> list[bytes]:
+        (lo, lo_open), (hi, hi_open) = self._bound(lo), self._bound(hi)
+        return [
+            m for m, sc in sorted(self._zset(key).items(), key=lambda kv: (kv[1], kv[0]))
+            if (lo < sc if lo_open else lo <= sc) and (sc < hi if hi_open else sc <= hi)
+        ]
+
+    def cmd_zcount(self, key, lo, hi):
+        return len(self._zrange(key, lo, hi))
+
+    def cmd_zrangebyscore(self, key, lo, hi, *opts):
+        out = self._zrange(key, lo, hi)
+        if opts and opts[0].upper() == b"LIMIT":
+            offset, count = int(opts[1]), int(opts[2])
+            out = out[offset:offset + count] if count >= 0 else out[offset:]
+        return out
+
+    # ---------- соединение ----------
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued: list[list[bytes]] | None = None
+        watched: dict[bytes, int] = {}
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                name = args[0].upper()
+                if name == b"MULTI":
+                    queued = []
+                    reply = Simple("OK")
+                elif name == b"DISCARD":
+                    queued, watched = None, {}
+                    reply = Simple("OK")
+                elif name == b"WATCH":
+                    for k in args[1:]:
+                        watched[k] = self.versions.get(k, 0)
+                    reply = Simple("OK")
+                elif name == b"UNWATCH":
+                    watched = {}
+                    reply = Simple("OK")
+                elif name == b"EXEC":
+                    if queued is None:
+                        reply = Error("ERR EXEC without MULTI")
+                    elif any(self.versions.get(k, 0) != v for k, v in watched.items()):
+                        reply = NilArray()
+                    else:
+                        reply = [self.execute(a) for a in queued]
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append(args)
+                    reply = Simple("QUEUED")
+                else:
+                    reply = self.execute(args)
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class Simple(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+class NilArray:
+    pass
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, NilArray):
+        return b"*-1\r\n"
+    if isinstance(value, Error):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, Simple):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, (list, set)):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode(v) for v in value)
+    if isinstance(value, str):
+        value = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+
+    async def serve():
+        url = await FakeRedis().start(args.host, args.port)
+        print(url, flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
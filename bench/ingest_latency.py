@@ -0,0 +1,170 @@
+"""Сквозная задержка polling vs webhook на локальной заглушке Bot API.
+
+Задержка — от момента, когда апдейт стал доступен боту (положен в getUpdates
+или отправлен POST-ом на вебхук), до первого исходящего вызова бота в этот чат.
+
+    python bench/ingest_latency.py --count 500
+    python bench/ingest_latency.py --updates recorded.jsonl --mode webhook
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("SUPPORT_GROUP_ID", "-100500")
+os.environ.setdefault("TICKETS_FILE", os.path.join(tempfile.mkdtemp(), "tickets.json"))
+os.environ.setdefault("SEND_GLOBAL_RATE", "100000")
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import main  # noqa: E402
+from fake_api import FakeBotAPI  # noqa: E402
+from webhook import WebhookIngest, SECRET_HEADER  # noqa: E402
+
+logging.getLogger("aiogram").setLevel(logging.WARNING)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+SECRET = "bench-secret"
+
+
+def start_update(user_id: int) -> dict:
+    return {
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }
+    }
+
+
+def chat_of(update: dict) -> int | None:
+    if "message" in update:
+        return update["message"]["chat"]["id"]
+    if "callback_query" in update:
+        return update["callback_query"]["message"]["chat"]["id"]
+    return None
+
+
+def load_updates(path: str | None, count: int) -> list[dict]:
+    if not path:
+        return [start_update(10_000 + i) for i in range(count)]
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summary(mode: str, lat: list[float], lost: int, wall: float) -> dict:
+    lat = sorted(lat)
+    q = statistics.quantiles(lat, n=100) if len(lat) >= 2 else lat * 99
+    return {
+        "mode": mode,
+        "updates": len(lat) + lost,
+        "lost": lost,
+        "updates_per_s": round(len(lat) / wall, 1) if wall else 0.0,
+        "p50_ms": round(q[49] * 1000, 2),
+        "p95_ms": round(q[94] * 1000, 2),
+        "p99_ms": round(q[98] * 1000, 2),
+    }
+
+
+async def drive(api: FakeBotAPI, updates: list[dict], inject, concurrency: int) -> tuple[list[float], int, float]:
+    lat: list[float] = []
+    lost = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(u: dict):
+        nonlocal lost
+        chat = chat_of(u)
+        async with slots:
+            fut = api.wait_for_chat(chat) if chat is not None else None
+            t0 = time.perf_counter()
+            await inject(u)
+            if fut is None:
+                return
+            try:
+                t1, _, _ = await asyncio.wait_for(fut, 5)
+                lat.append(t1 - t0)
+            except asyncio.TimeoutError:
+                lost += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in updates))
+    return lat, lost, time.perf_counter() - t0
+
+
+async def bench_polling(api: FakeBotAPI, updates: list[dict], concurrency: int) -> dict:
+    task = asyncio.create_task(main.dp.start_polling(main.bot, handle_signals=False, close_bot_session=False))
+    await asyncio.sleep(0.3)
+    lat, lost, wall = await drive(api, updates, api.push_update, concurrency)
+    await main.dp.stop_polling()
+    await asyncio.gather(task, return_exceptions=True)
+    return summary("polling", lat, lost, wall)
+
+
+async def bench_webhook(api: FakeBotAPI, updates: list[dict], concurrency: int) -> dict:
+    ingest = WebhookIngest(main.bot, main.dp, secret=SECRET, concurrency=64)
+    runner = web.AppRunner(ingest.app("/webhook"))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/webhook"
+    ids = iter(range(1, 10**9))
+
+    async with aiohttp.ClientSession() as http:
+        async def post(u: dict):
+            async with http.post(url, json=dict(u, update_id=next(ids)), headers={SECRET_HEADER: SECRET}) as r:
+                assert r.status == 200, r.status
+
+        lat, lost, wall = await drive(api, updates, post, concurrency)
+    await ingest.drain()
+    await runner.cleanup()
+    return summary("webhook", lat, lost, wall)
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency)
+    base = await api.start()
+    main.bot.session.api = TelegramAPIServer.from_base(base)
+    await main.load_tickets()
+
+    updates = load_updates(args.updates, args.count)
+    results = []
+    for mode in args.mode:
+        fn = bench_polling if mode == "polling" else bench_webhook
+        res = await fn(api, updates, args.concurrency)
+        results.append(res)
+        print(json.dumps(res), flush=True)
+
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", help="JSONL с записанными апдейтами (по одному Update на строку)")
+    ap.add_argument("--count", type=int, default=300, help="сколько синтетических /start, если --updates не задан")
+    ap.add_argument("--mode", nargs="+", default=["polling", "webhook"], choices=["polling", "webhook"])
+    ap.add_argument("--concurrency", type=int, default=1, help="сколько апдейтов в полёте одновременно")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушки API, сек")
+    ap.add_argument("--out", help="куда записать результаты JSON")
+    asyncio.run(run(ap.parse_args()))
@@ -0,0 +1,241 @@
+"""Нагрузочный прогон бота на локальной заглушке Bot API.
+
+Гоняет через настоящий dp синтетические потоки (/start, меню, полные заявки на
+выплату, обращения, ответы админов) или записанный JSONL с апдейтами
+(по одному Update на строку, см. UPDATE_LOG в main.py) и пишет результат в JSON.
+
+    python bench/loadtest.py --users 2000 --out results.json
+    python bench/loadtest.py --replay updates.jsonl --out results.json
+    python bench/loadtest.py --users 2000 --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+from typing import Any
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("SUPPORT_GROUP_ID", "-100500")
+os.environ.setdefault("TICKETS_FILE", os.path.join(tempfile.mkdtemp(), "tickets.json"))
+os.environ.setdefault("TICKETS_STORAGE", "journal")
+# лимиты Telegram и антифлуд в прогоне не нужны — меряем сам бот
+for var in ("SEND_GLOBAL_RATE", "SEND_CHAT_RATE", "SEND_GROUP_RATE"):
+    os.environ.setdefault(var, "1e9")
+for var in ("THROTTLE_MENU", "THROTTLE_CONTACT", "THROTTLE_PAYOUT", "THROTTLE_MESSAGE"):
+    os.environ.setdefault(var, "1e9/1")
+
+from aiogram import BaseMiddleware  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import main  # noqa: E402
+import updates  # noqa: E402
+from fake_api import FakeBotAPI  # noqa: E402
+
+logging.getLogger("aiogram").setLevel(logging.WARNING)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+ADMIN_ID = 777
+GROUP_ID = int(os.environ["SUPPORT_GROUP_ID"])
+
+
+class HandlerTimer(BaseMiddleware):
+    """Время обработки каждого апдейта внутри dp (без ожидания в очереди пользователя)."""
+
+    def __init__(self):
+        self.samples: list[float] = []
+
+    async def __call__(self, handler, event, data) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples.append(time.perf_counter() - t0)
+
+
+# ---------- сценарии ----------
+
+def scenario_start(uids: list[int]) -> list[dict]:
+    return [updates.message(uid, "/start") for uid in uids]
+
+
+def scenario_menu(uids: list[int]) -> list[dict]:
+    out = []
+    for uid in uids:
+        for screen in ("rates", "podcasts", "payout", "main"):
+            out.append(updates.callback(uid, f"menu:{screen}"))
+    return out
+
+
+def scenario_payout(uids: list[int]) -> list[dict]:
+    return [u for uid in uids for u in updates.payout_flow(uid)]
+
+
+def scenario_contact(uids: list[int]) -> list[dict]:
+    out = []
+    for uid in uids:
+        out.append(updates.callback(uid, "menu:contact"))
+        out.append(updates.message(uid, f"Вопрос от {uid}: когда выплата?"))
+    return out
+
+
+async def scenario_admin(n: int) -> list[dict]:
+    # ответы по уже созданным заявкам: кнопка «Ответить» и текст в группе
+    tickets = list(getattr(main.store, "rows", {}))[:n]
+    out = []
+    for t in tickets:
+        out.append(updates.callback(ADMIN_ID, f"admin:reply:{t}", chat_id=GROUP_ID))
+        out.append(updates.message(ADMIN_ID, f"Ответ по #{t}", chat_id=GROUP_ID))
+    return out
+
+
+def interleave(stream: list[dict], step: int) -> list[dict]:
+    # перемешиваем пользователей, сохраняя порядок шагов каждого
+    chunks = [stream[i:i + step] for i in range(0, len(stream), step)]
+    random.shuffle(chunks)
+    out = []
+    while chunks:
+        for c in chunks:
+            out.append(c.pop(0))
+        chunks = [c for c in chunks if c]
+    return out
+
+
+# ---------- прогон ----------
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) < 2:
+        samples = samples * 2 or [0.0, 0.0]
+    q = statistics.quantiles(samples, n=100)
+    return {"p50_ms": round(q[49] * 1000, 3), "p95_ms": round(q[94] * 1000, 3), "p99_ms": round(q[98] * 1000, 3)}
+
+
+async def wait_idle():
+    while True:
+        st = main.sender.stats()
+        if not st["queued"] and not st["inflight"]:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def run_stream(name: str, raw: list[dict], timer: HandlerTimer, api: FakeBotAPI, ids) -> dict:
+    parsed = [Update.model_validate(dict(u, update_id=next(ids)), context={"bot": main.bot}) for u in raw]
+    timer.samples = []
+    calls_before = len(api.calls)
+    t0 = time.perf_counter()
+    # как polling-раннер: по задаче на апдейт в порядке поступления
+    tasks = [asyncio.create_task(main.dp.feed_update(main.bot, u)) for u in parsed]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    await wait_idle()
+    wall = time.perf_counter() - t0
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    return {
+        "scenario": name,
+        "updates": len(parsed),
+        "errors": errors,
+        "api_calls": len(api.calls) - calls_before,
+        "wall_s": round(wall, 3),
+        "updates_per_s": round(len(parsed) / wall, 1) if wall else 0.0,
+        **percentiles(timer.samples),
+    }
+
+
+def load_replay(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> list[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = {r["scenario"]: r for r in json.load(f)["scenarios"]}
+    problems = []
+    for r in results["scenarios"]:
+        b = base.get(r["scenario"])
+        if not b:
+            continue
+        if r["updates_per_s"] < b["updates_per_s"] * (1 - tolerance):
+            problems.append(f"{r['scenario']}: updates/s {b['updates_per_s']} -> {r['updates_per_s']}")
+        if r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            problems.append(f"{r['scenario']}: p95 {b['p95_ms']}ms -> {r['p95_ms']}ms")
+    return problems
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    api = FakeBotAPI(latency=args.api_latency)
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    timer = HandlerTimer()
+    main.dp.update.outer_middleware(timer)
+    await main.load_tickets()
+    ids = iter(range(1, 10**12))
+
+    scenarios = []
+    if args.replay:
+        res = await run_stream("replay", load_replay(args.replay), timer, api, ids)
+        scenarios.append(res)
+        print(json.dumps(res), flush=True)
+    else:
+        uids = list(range(200_000, 200_000 + args.users))
+        streams = [
+            ("start", scenario_start(uids), 1),
+            ("menu", scenario_menu(uids), 4),
+            ("payout", scenario_payout(uids), 4),
+            ("contact", scenario_contact(uids), 2),
+        ]
+        for name, stream, step in streams:
+            if name in args.scenarios:
+                res = await run_stream(name, interleave(stream, step), timer, api, ids)
+                scenarios.append(res)
+                print(json.dumps(res), flush=True)
+        if "admin" in args.scenarios:
+            res = await run_stream("admin", await scenario_admin(args.users), timer, api, ids)
+            scenarios.append(res)
+            print(json.dumps(res), flush=True)
+
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+
+    return {
+        "version": os.popen("git rev-parse --short HEAD 2>/dev/null").read().strip() or None,
+        "storage": main.store.name,
+        "users": None if args.replay else args.users,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "scenarios": scenarios,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--scenarios", nargs="+", default=["start", "menu", "payout", "contact", "admin"])
+    ap.add_argument("--replay", help="JSONL с записанными апдейтами вместо синтетики")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушки API, сек")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="куда записать результаты JSON")
+    ap.add_argument("--compare", help="JSON прошлого прогона: вернуть код 1 при регрессии")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    args = ap.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps({k: v for k, v in results.items() if k != "scenarios"}))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        problems = compare(results, args.compare, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        sys.exit(1 if problems else 0)
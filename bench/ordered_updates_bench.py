@@ -0,0 +1,84 @@
+"""Пропускная способность мастера выплаты при тысячах одновременных пользователей.
+
+Каждый пользователь присылает кнопку и три шага сразу, без ожидания ответов.
+С упорядочиванием (по умолчанию) все заявки должны доехать до группы целиком.
+
+    python bench/ordered_updates_bench.py --users 5000
+    python bench/ordered_updates_bench.py --users 5000 --unordered
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--users", type=int, default=2000)
+ap.add_argument("--unordered", action="store_true", help="без PerUserOrderMiddleware")
+args = ap.parse_args()
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("SUPPORT_GROUP_ID", "-100500")
+os.environ.setdefault("TICKETS_FILE", os.path.join(tempfile.mkdtemp(), "tickets.json"))
+os.environ.setdefault("TICKETS_STORAGE", "journal")
+os.environ["SEND_GLOBAL_RATE"] = os.environ["SEND_CHAT_RATE"] = os.environ["SEND_GROUP_RATE"] = "1e9"
+if args.unordered:
+    os.environ["ORDERED_UPDATES"] = "0"
+
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import main  # noqa: E402
+import updates  # noqa: E402
+from fake_api import FakeBotAPI  # noqa: E402
+
+logging.getLogger("aiogram").setLevel(logging.WARNING)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+
+async def run():
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    await main.load_tickets()
+
+    raw = []
+    for uid in range(1, args.users + 1):
+        raw.extend(updates.payout_flow(100_000 + uid))
+    # перемешиваем пользователей, но сохраняем порядок шагов внутри каждого
+    raw = [u for step in zip(*[raw[i::4] for i in range(4)]) for u in step]
+    parsed = [Update.model_validate(dict(u, update_id=i), context={"bot": main.bot}) for i, u in enumerate(raw, 1)]
+
+    t0 = time.perf_counter()
+    # как polling-раннер: по задаче на апдейт в порядке поступления
+    tasks = [asyncio.create_task(main.dp.feed_update(main.bot, u)) for u in parsed]
+    await asyncio.gather(*tasks, return_exceptions=True)
+    while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+        await asyncio.sleep(0.01)
+    wall = time.perf_counter() - t0
+
+    group_posts = sum(1 for _, m, p in api.calls if m == "sendPhoto" and p.get("chat_id") == os.environ["SUPPORT_GROUP_ID"])
+    res = {
+        "ordered": not args.unordered,
+        "users": args.users,
+        "updates": len(parsed),
+        "updates_per_s": round(len(parsed) / wall, 1),
+        "complete_payouts": group_posts,
+        "stuck_wizards": len(main.fsm_storage.map),
+        "order": main.update_order.stats(),
+    }
+    print(json.dumps(res))
+
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+
+
+asyncio.run(run())
@@ -0,0 +1,94 @@
+"""Расчёт ведомости выплат за месяц по тысячам аккаунтов (payouts.compute).
+
+Генерирует CSV с заявками и просмотрами, меряет разбор и расчёт отдельно и
+сверяет результат с наивным перебором тарифов.
+
+    python bench/payouts_bench.py --accounts 5000 --videos-per-account 20
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from payouts import compute, read_submissions  # noqa: E402
+from tariffs import MONTHLY_MIN_VIDEOS, MONTHLY_TIERS, VIDEO_TIERS  # noqa: E402
+
+
+def gen_csv(accounts: int, per_account: int, seed: int) -> str:
+    rng = random.Random(seed)
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow(["ticket", "account", "platform", "link", "views", "date", "exclusive"])
+    ticket = 10_000
+    for a in range(accounts):
+        platform = rng.choice(["tiktok", "tiktok", "youtube", "other"])
+        exclusive = "1" if rng.random() < 0.7 else "0"
+        for _ in range(rng.randint(1, per_account * 2 - 1)):
+            ticket += 1
+            views = int(rng.lognormvariate(11.5, 1.2))
+            day = rng.randint(1, 28)
+            if platform == "tiktok":
+                # часть строк без account/platform — они берутся из ссылки
+                link = f"https://www.tiktok.com/@acc{a}/video/{7_000_000_000_000_000_000 + ticket}"
+                w.writerow([ticket, "", "", link, views, f"2026-09-{day:02d}", exclusive])
+            else:
+                w.writerow([ticket, f"acc{a}", platform, "", views, f"2026-09-{day:02d}", exclusive])
+    return out.getvalue()
+
+
+def naive(subs: list[dict]) -> int:
+    total = 0
+    groups: dict = {}
+    for s in subs:
+        tiers = VIDEO_TIERS.get(s["platform"], VIDEO_TIERS["other"])[2]
+        total += max([amount for threshold, amount in tiers if s["views"] >= threshold] or [0])
+        g = groups.setdefault((s["account"], s["platform"], s["month"]), [0, 0, True])
+        g[0] += 1
+        g[1] += s["views"]
+        g[2] = g[2] and s["exclusive"]
+    for videos, views, exclusive in groups.values():
+        if exclusive and videos >= MONTHLY_MIN_VIDEOS:
+            total += max([amount for threshold, amount in MONTHLY_TIERS if views >= threshold] or [0])
+    return total
+
+
+def main(accounts: int, per_account: int, seed: int):
+    text = gen_csv(accounts, per_account, seed)
+
+    t0 = time.perf_counter()
+    subs, errors = read_submissions(io.StringIO(text))
+    parse_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rows, totals = compute(subs)
+    compute_s = time.perf_counter() - t0
+
+    expected = naive(subs)
+    res = {
+        "accounts": accounts,
+        "submissions": len(subs),
+        "errors": len(errors),
+        "parse_s": round(parse_s, 3),
+        "compute_s": round(compute_s, 3),
+        "sheet_rows": len(rows),
+        **totals,
+        "matches_naive": expected == totals["total_rub"],
+    }
+    print(json.dumps(res, ensure_ascii=False))
+    if not res["matches_naive"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--accounts", type=int, default=5000)
+    ap.add_argument("--videos-per-account", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    main(args.accounts, args.videos_per_account, args.seed)
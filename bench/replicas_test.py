@@ -0,0 +1,176 @@
+"""Несколько реплик бота на общем Redis: шаги одного пользователя попадают на разные реплики.
+
+Родитель поднимает заглушки Redis (bench/fake_redis.py) и Bot API, запускает N реплик
+отдельными процессами и раздаёт им апдейты по кругу: шаг k пользователя u уходит на
+реплику (u + k) % N, а последний шаг мастера доставляется дважды на две разные реплики,
+как при повторе вебхука. Проверяется, что на каждого пользователя в группу ушла ровно
+одна заявка и что номера заявок не повторяются.
+
+    python bench/replicas_test.py --replicas 3 --users 300
+"""
+import os
+import sys
+import re
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+GROUP_ID = "-100500"
+
+
+def replica_env(redis_url: str, api_base: str, tmp: str, n: int) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "42:BENCH",
+        "SUPPORT_GROUP_ID": GROUP_ID,
+        "REDIS_URL": redis_url,
+        "FAKE_API": api_base,
+        "TICKETS_FILE": os.path.join(tmp, f"tickets-{n}.json"),
+        "SEND_GLOBAL_RATE": "1e9",
+        "SEND_CHAT_RATE": "1e9",
+        "SEND_GROUP_RATE": "1e9",
+    })
+    for var in ("THROTTLE_MENU", "THROTTLE_CONTACT", "THROTTLE_PAYOUT", "THROTTLE_MESSAGE"):
+        env[var] = "1e9/1"
+    return env
+
+
+# ---------- реплика ----------
+
+async def replica():
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import main
+
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("vsrap-bot.middlewares").setLevel(logging.WARNING)
+    main.bot.session.api = TelegramAPIServer.from_base(os.environ["FAKE_API"])
+    await main.load_tickets()
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def feed(raw: dict):
+        update = Update.model_validate(raw, context={"bot": main.bot})
+        try:
+            await main.dp.feed_update(main.bot, update)
+            while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+                await asyncio.sleep(0.005)
+        finally:
+            sys.stdout.write(f"{raw['update_id']}\n")
+            sys.stdout.flush()
+
+    tasks = set()
+    while line := await reader.readline():
+        task = asyncio.create_task(feed(json.loads(line)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+
+
+# ---------- родитель ----------
+
+class Replica:
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+        self.pending: dict[int, asyncio.Future] = {}
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while line := await self.proc.stdout.readline():
+            fut = self.pending.pop(int(line), None)
+            if fut is not None and not fut.done():
+                fut.set_result(None)
+
+    async def send(self, update: dict):
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[update["update_id"]] = fut
+        self.proc.stdin.write((json.dumps(update, ensure_ascii=False) + "\n").encode())
+        await self.proc.stdin.drain()
+        await fut
+
+    async def close(self):
+        self.proc.stdin.close()
+        await self.proc.wait()
+        await self._reader
+
+
+async def run(args):
+    import updates
+    from fake_api import FakeBotAPI
+    from fake_redis import FakeRedis
+
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    fake_redis = FakeRedis()
+    redis_url = await fake_redis.start()
+    api = FakeBotAPI()
+    api_base = await api.start()
+
+    tmp = tempfile.mkdtemp()
+    replicas = []
+    for n in range(args.replicas):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--replica",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            env=replica_env(redis_url, api_base, tmp, n),
+        )
+        replicas.append(Replica(proc))
+
+    ids = itertools.count(1)
+
+    async def user_flow(uid: int):
+        steps = [dict(u, update_id=next(ids)) for u in updates.payout_flow(uid)]
+        for k, step in enumerate(steps):
+            r = replicas[(uid + k) % len(replicas)]
+            if k == len(steps) - 1:
+                # повторная доставка того же апдейта на соседнюю реплику
+                twin = replicas[(uid + k + 1) % len(replicas)]
+                await asyncio.gather(r.send(step), twin.send(step))
+            else:
+                await r.send(step)
+
+    uids = range(300_000, 300_000 + args.users)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user_flow(uid) for uid in uids))
+    wall = time.perf_counter() - t0
+    for r in replicas:
+        await r.close()
+
+    posts = [p for _, m, p in api.calls if m == "sendPhoto" and p.get("chat_id") == GROUP_ID]
+    tickets = [int(m.group(1)) for p in posts if (m := re.search(r"#(\d+)", p.get("caption", "")))]
+    res = {
+        "replicas": args.replicas,
+        "users": args.users,
+        "wall_s": round(wall, 3),
+        "group_posts": len(posts),
+        "unique_tickets": len(set(tickets)),
+        "stored_tickets": len(fake_redis.cmd_smembers(b"vsrap:tickets")),
+    }
+    print(json.dumps(res))
+    await api.close()
+    await fake_redis.close()
+
+    ok = res["group_posts"] == res["unique_tickets"] == res["stored_tickets"] == args.users
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replicas", type=int, default=3)
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--replica", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    asyncio.run(replica() if args.replica else run(args))
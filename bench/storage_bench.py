@@ -0,0 +1,79 @@
+"""Сравнение бэкендов хранилища заявок: upsert/s и lookup/s на 10k/100k/1M.
+
+    python bench/storage_bench.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage import make_store  # noqa: E402
+
+
+def fake_row(i: int) -> dict:
+    return {
+        "user_chat_id": 100000 + i % 50000,
+        "user_id": 100000 + i % 50000,
+        "username": f"user{i % 50000}",
+        "full_name": f"User {i % 50000}",
+        "created_at": f"2026-01-01T00:00:{i % 60:02d}+00:00",
+    }
+
+
+def prefill(path: str, n: int):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({str(i): fake_row(i) for i in range(n)}, f, ensure_ascii=False)
+
+
+async def bench_backend(kind: str, size: int, ops: int, workdir: str) -> dict:
+    path = os.path.join(workdir, f"{kind}-{size}.json")
+    prefill(path, size)
+    store = make_store(kind, path, sqlite_path=path + ".sqlite3", compact_every=10**9, compact_interval=3600)
+
+    t0 = time.perf_counter()
+    await store.load()
+    load_s = time.perf_counter() - t0
+
+    # полный rewrite json на 1M занимает секунды — ограничиваем число операций
+    n_up = min(ops, 50) if kind == "json" else ops
+    t0 = time.perf_counter()
+    await asyncio.gather(*(store.upsert(str(size + i), fake_row(size + i)) for i in range(n_up)))
+    up_s = time.perf_counter() - t0
+
+    keys = [str(random.randrange(size)) for _ in range(ops)]
+    t0 = time.perf_counter()
+    for k in keys:
+        await store.get(k)
+    get_s = time.perf_counter() - t0
+
+    await store.close()
+    return {
+        "backend": kind,
+        "size": size,
+        "load_s": round(load_s, 3),
+        "upserts_per_s": round(n_up / up_s, 1),
+        "lookups_per_s": round(ops / get_s, 1),
+    }
+
+
+async def run(sizes: list[int], ops: int, backends: list[str]):
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            for kind in backends:
+                res = await bench_backend(kind, size, ops, workdir)
+                print(json.dumps(res), flush=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--backends", nargs="+", default=["json", "journal", "sqlite"])
+    args = ap.parse_args()
+    asyncio.run(run(args.sizes, args.ops, args.backends))
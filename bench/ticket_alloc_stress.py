@@ -0,0 +1,67 @@
+"""Стресс-тест аллокатора номеров заявок: миллионы номеров, ни одного повтора.
+
+Несколько процессов делят один файл-счётчик, как реплики бота на общем хранилище.
+
+    python bench/ticket_alloc_stress.py --count 2000000 --procs 4
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from allocator import TicketAllocator  # noqa: E402
+from storage import JsonTicketStore  # noqa: E402
+
+KEY = b"stress-key"
+
+
+def worker(path: str, count: int, out: str):
+    async def run():
+        store = JsonTicketStore(path)
+        alloc = TicketAllocator(KEY, reserve=store.reserve_ids, block=256)
+        return [await alloc.next() for _ in range(count)]
+
+    tickets = asyncio.run(run())
+    with open(out, "w") as f:
+        f.write("\n".join(map(str, tickets)))
+
+
+def main(count: int, procs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tickets.json")
+        per = count // procs
+        outs = [os.path.join(tmp, f"out{i}.txt") for i in range(procs)]
+        t0 = time.perf_counter()
+        ps = [mp.Process(target=worker, args=(path, per, outs[i])) for i in range(procs)]
+        for p in ps:
+            p.start()
+        for p in ps:
+            p.join()
+            assert p.exitcode == 0, p.exitcode
+        wall = time.perf_counter() - t0
+
+        seen: set[int] = set()
+        total = 0
+        for out in outs:
+            with open(out) as f:
+                for line in f:
+                    seen.add(int(line))
+                    total += 1
+        dupes = total - len(seen)
+        print(f"allocated={total} unique={len(seen)} dupes={dupes} "
+              f"min={min(seen)} max={max(seen)} rate={total / wall:,.0f}/s")
+        if dupes:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=1_000_000)
+    ap.add_argument("--procs", type=int, default=4)
+    args = ap.parse_args()
+    main(args.count, args.procs)
@@ -0,0 +1,80 @@
+"""Поиск заявки пользователя по номеру (быстрый путь «напишите номер в чате»).
+
+Время user_ticket не должно расти с числом заявок, by_user — только с числом заявок
+у одного пользователя (в прогоне их size / 50 000); для сравнения — прежний полный перебор rows.
+
+    python bench/ticket_lookup_bench.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from storage import make_store  # noqa: E402
+from storage_bench import fake_row, prefill  # noqa: E402
+
+USERS = 50_000
+
+
+def user_of(i: int) -> int:
+    return fake_row(i)["user_id"]
+
+
+async def timed(fn, args: list) -> float:
+    t0 = time.perf_counter()
+    for a in args:
+        await fn(*a)
+    return (time.perf_counter() - t0) / len(args) * 1e6
+
+
+async def bench_backend(kind: str, size: int, ops: int, workdir: str) -> dict:
+    path = os.path.join(workdir, f"{kind}-{size}.json")
+    prefill(path, size)
+    store = make_store(kind, path, sqlite_path=path + ".sqlite3", compact_every=10**9, compact_interval=3600)
+    await store.load()
+
+    tickets = [random.randrange(size) for _ in range(ops)]
+    own = [(user_of(t), str(t)) for t in tickets]
+    foreign = [(user_of(t) + 1, str(t)) for t in tickets]
+    users = [(user_of(t),) for t in tickets]
+
+    res = {
+        "backend": kind,
+        "size": size,
+        "own_us": round(await timed(store.user_ticket, own), 2),
+        "foreign_us": round(await timed(store.user_ticket, foreign), 2),
+        "by_user_us": round(await timed(store.by_user, users), 2),
+    }
+    if hasattr(store, "rows"):
+        async def scan(user_id: int):
+            return [(t, r) for t, r in store.rows.items() if r.get("user_id") == user_id]
+        res["scan_us"] = round(await timed(scan, users[:20]), 2)
+
+    assert all([await store.user_ticket(*a) for a in own[:100]])
+    assert not any([await store.user_ticket(*a) for a in foreign[:100]])
+    await store.close()
+    return res
+
+
+async def run(sizes: list[int], ops: int, backends: list[str]):
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            for kind in backends:
+                print(json.dumps(await bench_backend(kind, size, ops, workdir)), flush=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--ops", type=int, default=20_000)
+    ap.add_argument("--backends", nargs="+", default=["json", "journal", "sqlite"])
+    args = ap.parse_args()
+    asyncio.run(run(args.sizes, args.ops, args.backends))
@@ -0,0 +1,165 @@
+"""TimerWheel против loop.call_later на сотнях тысяч отложенных таймеров.
+
+Заводит --timers таймеров со сроками в пределах --horizon секунд (малая доля — в ближайшие
+--soon секунд), переносит и отменяет по --churn от них и меряет: время операций, память
+(tracemalloc), CPU процесса в простое, пока ждут таймеры, и опоздание срабатывания
+(считается от max(срок, начало ожидания) — пока таймеры заводятся, цикл событий стоит).
+Проверяется, что ни один таймер не сработал раньше срока и все с истёкшим сроком — сработали.
+
+    python bench/timers_bench.py --timers 500000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from timers import TimerWheel  # noqa: E402
+
+
+def plan(n: int, horizon: float, soon: float, soon_share: float, rng: random.Random) -> list[float]:
+    now = time.time()
+    return [
+        now + (rng.uniform(0.5, soon) if rng.random() < soon_share else rng.uniform(soon + 1, horizon))
+        for _ in range(n)
+    ]
+
+
+def firing(fired: list[tuple[float, float]], live: list[float], started: float, tick: float) -> dict:
+    ended = max((at for _, at in fired), default=started)
+    # к концу замера обязаны были сработать все, чей срок прошёл хотя бы на шаг колеса раньше
+    must = sum(1 for d in live if d <= ended - tick - 0.1)
+    return {
+        "fired": len(fired),
+        "must_fire": must,
+        "early": sum(1 for due, at in fired if at < due),
+        "late_max_ms": round(max((at - max(due, started) for due, at in fired), default=0) * 1000, 1),
+    }
+
+
+async def bench_wheel(dues: list[float], churn: float, idle: float, trace: bool, rng: random.Random) -> dict:
+    fired: list[tuple[float, float]] = []
+
+    async def on_fire(key: str, due: float):
+        fired.append((due, time.time()))
+
+    wheel = TimerWheel()
+    wheel.on("t", on_fire)
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    for i, due in enumerate(dues):
+        wheel.schedule(f"t:{i}", due, "t", due)
+    schedule_s = time.perf_counter() - t0
+    mem = tracemalloc.get_traced_memory()[0] if trace else 0
+    tracemalloc.stop()
+
+    picked = rng.sample(range(len(dues)), int(len(dues) * churn))
+    half = len(picked) // 2
+    t0 = time.perf_counter()
+    for i in picked[:half]:
+        dues[i] += 3600
+        wheel.schedule(f"t:{i}", dues[i], "t", dues[i])
+    for i in picked[half:]:
+        wheel.cancel(f"t:{i}")
+    churn_s = time.perf_counter() - t0
+    cancelled = set(picked[half:])
+    live = [d for i, d in enumerate(dues) if i not in cancelled]
+
+    wheel.start()
+    started = time.time()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    await asyncio.sleep(idle)
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    await wheel.close()
+    return {
+        "impl": "wheel",
+        "timers": len(dues),
+        "schedule_us": round(schedule_s / len(dues) * 1e6, 2),
+        "churn_us": round(churn_s / max(len(picked), 1) * 1e6, 2),
+        "mem_mb": round(mem / 2**20, 1),
+        "idle_cpu_pct": round(cpu / wall * 100, 2),
+        **firing(fired, live, started, wheel.tick),
+        "pending": len(wheel),
+    }
+
+
+async def bench_call_later(dues: list[float], churn: float, idle: float, trace: bool, rng: random.Random) -> dict:
+    loop = asyncio.get_running_loop()
+    fired: list[tuple[float, float]] = []
+
+    def on_fire(due: float):
+        fired.append((due, time.time()))
+
+    handles = {}
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    for i, due in enumerate(dues):
+        handles[f"t:{i}"] = loop.call_later(due - time.time(), on_fire, due)
+    schedule_s = time.perf_counter() - t0
+    mem = tracemalloc.get_traced_memory()[0] if trace else 0
+    tracemalloc.stop()
+
+    picked = rng.sample(range(len(dues)), int(len(dues) * churn))
+    half = len(picked) // 2
+    t0 = time.perf_counter()
+    for i in picked[:half]:
+        dues[i] += 3600
+        handles[f"t:{i}"].cancel()
+        handles[f"t:{i}"] = loop.call_later(dues[i] - time.time(), on_fire, dues[i])
+    for i in picked[half:]:
+        handles.pop(f"t:{i}").cancel()
+    churn_s = time.perf_counter() - t0
+    cancelled = set(picked[half:])
+    live = [d for i, d in enumerate(dues) if i not in cancelled]
+
+    started = time.time()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    await asyncio.sleep(idle)
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    for h in handles.values():
+        h.cancel()
+    return {
+        "impl": "call_later",
+        "timers": len(dues),
+        "schedule_us": round(schedule_s / len(dues) * 1e6, 2),
+        "churn_us": round(churn_s / max(len(picked), 1) * 1e6, 2),
+        "mem_mb": round(mem / 2**20, 1),
+        "idle_cpu_pct": round(cpu / wall * 100, 2),
+        **firing(fired, live, started, 0.0),
+    }
+
+
+async def run(args):
+    ok = True
+    for impl in args.impl:
+        rng = random.Random(args.seed)
+        dues = plan(args.timers, args.horizon, args.soon, args.soon_share, rng)
+        fn = bench_wheel if impl == "wheel" else bench_call_later
+        res = await fn(dues, args.churn, args.idle, not args.no_trace, rng)
+        # колесо с шагом 1 с срабатывает не раньше срока и опаздывает меньше чем на шаг (+ задержка цикла)
+        ok = ok and res["fired"] >= res["must_fire"] and not res["early"]
+        print(json.dumps(res), flush=True)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--timers", type=int, default=500_000)
+    ap.add_argument("--horizon", type=float, default=7 * 24 * 3600, help="сроки — в пределах стольких секунд")
+    ap.add_argument("--soon", type=float, default=5.0, help="часть таймеров срабатывает в первые N секунд")
+    ap.add_argument("--soon-share", type=float, default=0.01)
+    ap.add_argument("--churn", type=float, default=0.1, help="доля перенесённых/отменённых таймеров")
+    ap.add_argument("--idle", type=float, default=8.0, help="сколько секунд ждать срабатываний")
+    ap.add_argument("--impl", nargs="+", choices=["wheel", "call_later"], default=["wheel", "call_later"])
+    ap.add_argument("--seed", type=int, default=1)
+    # tracemalloc замедляет заведение таймеров в разы — для замера скорости лучше без него
+    ap.add_argument("--no-trace", action="store_true")
+    asyncio.run(run(ap.parse_args()))
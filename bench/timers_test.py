@@ -0,0 +1,202 @@
+"""Напоминания о заявках без ответа, сброс брошенных мастеров и режима ответа — с рестартом.
+
+С короткими сроками (секунды вместо часов) заводит обращения и заявки на выплату, часть из
+них «отвечает» (reply в группе / /mark review), часть пользователей бросает мастер на шаге
+ссылки, админ жмёт «Ответить» и молчит. Затем «перезапускает» бота: новое колесо таймеров
+и хранилище из того же файла, таймеры поднимаются restore_timers(). Проверяет, что:
+по каждой заявке без ответа ушло ровно SLA_MAX_PINGS напоминаний, по отвеченным — ни
+одного; каждому бросившему мастер — одно сообщение о сбросе; режим ответа сброшен с
+уведомлением в группу.
+
+    python bench/timers_test.py --users 50
+    python bench/timers_test.py --users 50 --redis   # заявки и состояние в (заглушке) Redis
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+GROUP_ID = -100500
+ADMIN = 7
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp()
+    env = {
+        "BOT_TOKEN": "42:BENCH",
+        "SUPPORT_GROUP_ID": str(GROUP_ID),
+        "TICKETS_FILE": os.path.join(tmp, "tickets.json"),
+        "USERS_FILE": os.path.join(tmp, "users.jsonl"),
+        "SLA_HOURS": str(args.sla / 3600),
+        "SLA_MAX_PINGS": str(args.pings),
+        "WIZARD_TTL": str(args.sla),
+        "ADMIN_REPLY_TTL": str(args.sla),
+        "SEND_GLOBAL_RATE": "1e9",
+        "SEND_CHAT_RATE": "1e9",
+        "SEND_GROUP_RATE": "1e9",
+    }
+    for var in ("THROTTLE_MENU", "THROTTLE_CONTACT", "THROTTLE_PAYOUT", "THROTTLE_MESSAGE"):
+        env[var] = "1e9/1"
+    fake_redis = None
+    if args.redis:
+        from fake_redis import FakeRedis
+
+        fake_redis = FakeRedis()
+        env["REDIS_URL"] = await fake_redis.start()
+    os.environ.update(env)
+
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import updates
+    from fake_api import FakeBotAPI
+    import main
+    from storage import make_store
+    from timers import TimerWheel
+
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    await main.load_tickets()
+    await main.users.load()
+    main.timers.start()
+
+    update_ids = iter(range(1, 10**9))
+
+    async def feed(raw: dict):
+        update = Update.model_validate(dict(raw, update_id=next(update_ids)), context={"bot": main.bot})
+        await main.dp.feed_update(main.bot, update)
+
+    async def drain():
+        while main.sender.stats()["queued"] or main.sender.stats()["inflight"]:
+            await asyncio.sleep(0.01)
+
+    n = args.users
+    contacts = list(range(600_000, 600_000 + n))
+    payouts = list(range(700_000, 700_000 + n))
+    abandoned = list(range(800_000, 800_000 + n))
+
+    async def contact(uid: int):
+        await feed(updates.message(uid, "привет"))
+        await feed(updates.message(uid, f"вопрос от {uid}"))
+
+    async def payout(uid: int):
+        for raw in updates.payout_flow(uid):
+            await feed(raw)
+
+    async def abandon(uid: int):
+        for raw in updates.payout_flow(uid)[:2]:
+            await feed(raw)
+
+    await asyncio.gather(*map(contact, contacts), *map(payout, payouts), *map(abandon, abandoned))
+    await drain()
+
+    tickets = {}
+    async for rows in main.store.iter_rows():
+        for t, row in rows:
+            tickets[row["user_id"]] = (t, row)
+
+    # половине обращений отвечаем reply на пост, половину заявок берём в работу
+    answered = [tickets[uid] for uid in contacts[: n // 2]]
+    for t, row in answered:
+        await feed(updates.message(
+            ADMIN, "ответ", chat_id=GROUP_ID,
+            reply_to_message={"message_id": row["group_message_id"], "date": 0, "chat": {"id": GROUP_ID, "type": "supergroup"}},
+        ))
+    reviewed = [tickets[uid][0] for uid in payouts[: n // 2]]
+    await feed(updates.message(ADMIN, "/mark review " + " ".join(reviewed), chat_id=GROUP_ID))
+    # «Ответить» по одному из обращений — и тишина
+    silent = tickets[contacts[-1]][0]
+    await feed(updates.callback(ADMIN, f"admin:reply:{silent}", chat_id=GROUP_ID))
+    await drain()
+    # что ушло до этого момента — могло честно опередить ответ, если прогон долгий
+    answered_at = len(api.calls)
+    pending_before = len(main.timers)
+
+    # «рестарт»: колесо и хранилище заново, таймеры поднимаются из заявок и состояния
+    await main.timers.close()
+    if not args.redis:
+        # с Redis хранилище общее с FSM и claims — его клиент не закрываем
+        await main.store.close()
+        main.store = make_store("json", os.environ["TICKETS_FILE"])
+        await main.store.load()
+    main.timers = TimerWheel()
+    main.timers.on("sla", main.sla_ping)
+    main.timers.on("wizard", main.expire_wizard)
+    main.timers.on("reply", main.expire_admin_reply)
+    await main.restore_timers()
+    pending_after = len(main.timers)
+    main.timers.start()
+
+    await asyncio.sleep(args.sla * (args.pings + 1) + 2)
+    await drain()
+
+    def ping_counts(calls) -> Counter:
+        texts = [p.get("text") or "" for _, m, p in calls if m == "sendMessage" and int(p["chat_id"]) == GROUP_ID]
+        return Counter(m.group(1) for t in texts if "ждёт ответа" in t for m in [re.search(r"#(\d+)", t)] if m)
+
+    group_texts = [p.get("text") or "" for _, m, p in api.calls if m == "sendMessage" and int(p["chat_id"]) == GROUP_ID]
+    pings, late_pings = ping_counts(api.calls), ping_counts(api.calls[answered_at:])
+    expired = Counter(
+        int(p["chat_id"]) for _, m, p in api.calls
+        if m == "sendMessage" and "не была дозаполнена" in (p.get("text") or "")
+    )
+    open_tickets = [tickets[uid][0] for uid in contacts[n // 2:] + payouts[n // 2:]]
+    closed_tickets = [t for t, _ in answered] + reviewed
+    stored_pings = []
+    for t in open_tickets:
+        row = await main.store.get(t)
+        stored_pings.append(row.get("sla_pings"))
+
+    res = {
+        "users": n,
+        "redis": bool(args.redis),
+        "timers_before_restart": pending_before,
+        "timers_restored": pending_after,
+        "open_pinged_ok": sum(1 for t in open_tickets if pings[t] == args.pings),
+        "answered_pinged": sum(1 for t in closed_tickets if late_pings[t]),
+        "stored_pings_ok": sum(1 for p in stored_pings if p == args.pings),
+        "wizard_expired_ok": sum(1 for uid in abandoned if expired[uid] == 1),
+        "wizard_expired_wrong": sum(v for uid, v in expired.items() if uid not in abandoned),
+        "reply_expired": sum(1 for t in group_texts if "Режим ответа" in t and "сброшен" in t),
+        "timers": main.timers.stats(),
+    }
+    print(json.dumps(res, ensure_ascii=False))
+
+    await main.timers.close()
+    await main.sender.close()
+    await main.store.close()
+    await main.bot.session.close()
+    await api.close()
+    if fake_redis is not None:
+        await fake_redis.close()
+
+    ok = (
+        res["open_pinged_ok"] == len(open_tickets)
+        and res["answered_pinged"] == 0
+        and res["stored_pings_ok"] == len(open_tickets)
+        and res["wizard_expired_ok"] == n
+        and not sum(v - 1 for v in expired.values() if v > 1)
+        and res["wizard_expired_wrong"] == 0
+        and res["reply_expired"] == 1
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--sla", type=float, default=2.0, help="срок в секундах вместо SLA_HOURS/WIZARD_TTL/ADMIN_REPLY_TTL")
+    ap.add_argument("--pings", type=int, default=2)
+    ap.add_argument("--redis", action="store_true")
+    asyncio.run(run(ap.parse_args()))
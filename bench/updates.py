@@ -0,0 +1,73 @@
+"""Конструкторы синтетических апдейтов Telegram (в виде dict, как их шлёт Bot API)."""
+import time
+import itertools
+
+_message_ids = itertools.count(1)
+
+
+def user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"User{uid}", "username": f"user{uid}"}
+
+
+def message(uid: int, text: str | None = None, chat_id: int | None = None, **extra) -> dict:
+    chat_id = uid if chat_id is None else chat_id
+    msg = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+        "from": user(uid),
+    }
+    if text is not None:
+        msg["text"] = text
+        if text.startswith("/"):
+            cmd = text.split()[0]
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(cmd)}]
+    msg.update(extra)
+    return {"message": msg}
+
+
+def photo(uid: int, file_id: str | None = None, **extra) -> dict:
+    file_id = file_id or f"photo-{uid}-{next(_message_ids)}"
+    sizes = [{"file_id": file_id, "file_unique_id": "u" + file_id, "width": 1280, "height": 720}]
+    return message(uid, photo=sizes, **extra)
+
+
+def album(uid: int, parts: int, caption: str | None = None) -> list[dict]:
+    """Альбом из parts фото: общий media_group_id, подпись — у первой части, как шлёт клиент."""
+    group_id = f"{uid}{next(_message_ids)}"
+    out = []
+    for i in range(parts):
+        extra = {"caption": caption} if caption and i == 0 else {}
+        out.append(photo(uid, media_group_id=group_id, **extra))
+    return out
+
+
+def callback(uid: int, data: str, chat_id: int | None = None, **message) -> dict:
+    """message — поля сообщения с кнопкой (text, reply_markup), если важно, что в нём сейчас."""
+    chat_id = uid if chat_id is None else chat_id
+    return {
+        "callback_query": {
+            "id": str(next(_message_ids)),
+            "from": user(uid),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "menu",
+                **message,
+            },
+        }
+    }
+
+
+def payout_flow(uid: int) -> list[dict]:
+    """Полная заявка на выплату: кнопка, ссылка, скрин, реквизиты."""
+    return [
+        callback(uid, "payout:start"),
+        message(uid, f"https://www.tiktok.com/@user{uid}/video/{7000000000000000000 + uid}"),
+        photo(uid),
+        message(uid, f"UQ-wallet-{uid}"),
+    ]
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Iterator
+
+log = logging.getLogger("vsrap-bot.bounded")
+
+_MISSING = object()
+
+
+class BoundedMap(MutableMapping):
+    """dict с LRU-лимитом, TTL на запись и ленивым истечением.
+
+    Если задан path, каждая запись/удаление дописывается в JSONL-лог,
+    и при старте таблица восстанавливается из него.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float | None = None,
+        path: str | None = None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        # key -> (expires_at | None, value); порядок — от давно не используемых к свежим
+        self._data: OrderedDict[Any, tuple[float | None, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._fh = None
+        self._log_records = 0
+        if path:
+            self._restore()
+
+    # ---------- mapping ----------
+
+    def __getitem__(self, key):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            raise KeyError(key)
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.time():
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            raise KeyError(key)
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        self._drop(key)
+
+    def __iter__(self) -> Iterator:
+        now = time.time()
+        return iter([k for k, (exp, _) in self._data.items() if exp is None or exp > now])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return False
+        expires_at, _ = item
+        if expires_at is not None and expires_at <= time.time():
+            self._drop(key)
+            self.expirations += 1
+            return False
+        return True
+
+    def set(self, key, value, ttl: float | None = _MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        self._write(["set", key, value, expires_at])
+        while len(self._data) > self.maxsize:
+            old_key, _ = self._data.popitem(last=False)
+            self._write(["del", old_key])
+            self.evictions += 1
+
+    def _drop(self, key):
+        self._data.pop(key, None)
+        self._write(["del", key])
+
+    def sweep(self) -> int:
+        """Удаляет все истёкшие записи; возвращает их число."""
+        now = time.time()
+        dead = [k for k, (exp, _) in self._data.items() if exp is not None and exp <= now]
+        for k in dead:
+            self._drop(k)
+        self.expirations += len(dead)
+        return len(dead)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # ---------- write-through ----------
+
+    def _write(self, rec: list):
+        if self._fh is None:
+            return
+        try:
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+        except Exception as e:
+            log.error(f"Failed to persist {self.name} to {self.path}: {e}")
+            return
+        self._log_records += 1
+        # лог разросся сильно больше живых данных — переписываем его
+        if self._log_records > 2 * self.maxsize + 1000:
+            self._rewrite()
+
+    def _restore(self):
+        now = time.time()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except Exception:
+                        continue
+                    key = rec[1]
+                    if rec[0] == "set":
+                        _, _, value, expires_at = rec
+                        if expires_at is None or expires_at > now:
+                            self._data[key] = (expires_at, value)
+                            self._data.move_to_end(key)
+                        else:
+                            self._data.pop(key, None)
+                    else:
+                        self._data.pop(key, None)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.error(f"Failed to restore {self.name} from {self.path}: {e}")
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self._rewrite()
+        if self._data:
+            log.info(f"Restored {len(self._data)} entries of {self.name}")
+
+    def _rewrite(self):
+        if self._fh is not None:
+            self._fh.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key, (expires_at, value) in self._data.items():
+                f.write(json.dumps(["set", key, value, expires_at], ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._log_records = len(self._data)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
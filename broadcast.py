@@ -0,0 +1,196 @@
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from sender import TokenBucket
+from shared import KV
+from users import UserRegistry
+
+log = logging.getLogger("vsrap-bot.broadcast")
+
+# пользователь закрыл доступ: заблокировал бота, удалил аккаунт, чат не найден
+_GONE = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+
+def is_gone(err: BaseException) -> bool:
+    if isinstance(err, TelegramForbiddenError):
+        return True
+    return isinstance(err, TelegramBadRequest) and any(s in str(err).lower() for s in _GONE)
+
+
+def fmt_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+
+class Broadcaster:
+    """Рассылка всем из UserRegistry: пачками по concurrency, не быстрее rate в секунду.
+
+    После каждой пачки в реестр пишется курсор (последний chat_id) и счётчики —
+    после рестарта рассылка продолжается с него; повторно может уйти максимум одна пачка.
+    Работает одна рассылка на все реплики: аренда в KV продлевается, пока рассылка идёт.
+    """
+
+    LEASE_KEY = "broadcast:lease"
+
+    def __init__(
+        self,
+        users: UserRegistry,
+        locks: KV,
+        send: Callable[[int, dict], Awaitable[Any]],
+        report: Callable[[dict, bool], Awaitable[None]],
+        rate: float = 20.0,
+        concurrency: int = 50,
+        report_every: float = 15.0,
+        lease_ttl: float = 120.0,
+    ):
+        self.users = users
+        self.locks = locks
+        self.send = send
+        self.report = report
+        self.rate = rate
+        self.concurrency = concurrency
+        self.report_every = report_every
+        self.lease_ttl = lease_ttl
+        self.owner = uuid.uuid4().hex
+        self.task: asyncio.Task | None = None
+        self.job: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self, payload: dict, report_message_id: int | None = None) -> dict | None:
+        """Новая рассылка; None — если уже идёт (здесь или на другой реплике).
+
+        report_message_id — сообщение в админ-чате, которое report() правит по ходу рассылки.
+        """
+        if self.running or await self.users.get_job() is not None:
+            return None
+        if not await self.locks.set(self.LEASE_KEY, self.owner, ttl=self.lease_ttl, nx=True):
+            return None
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "payload": payload,
+            "report_message_id": report_message_id,
+            "cursor": None,
+            "total": await self.users.count(),
+            "sent": 0,
+            "blocked": 0,
+            "failed": 0,
+            "started_at": time.time(),
+        }
+        await self.users.save_job(job)
+        self._spawn(job)
+        return job
+
+    async def resume(self) -> dict | None:
+        """При старте бота: подхватить недоделанную рассылку, если её никто не ведёт."""
+        job = await self.users.get_job()
+        if job is None or self.running:
+            return None
+        if not await self.locks.set(self.LEASE_KEY, self.owner, ttl=self.lease_ttl, nx=True):
+            return None
+        log.info(f"Resuming broadcast {job['id']} after chat {job['cursor']}")
+        self._spawn(job)
+        return job
+
+    async def stop(self) -> dict | None:
+        job = await self.users.get_job()
+        await self.users.save_job(None)
+        if self.running:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        # чужую аренду не трогаем: её снимет ведущая реплика, увидев, что рассылки больше нет,
+        # — до тех пор новая рассылка не стартует и вторая отправка не начнётся
+        await self.locks.release(self.LEASE_KEY, self.owner)
+        return job
+
+    async def close(self):
+        # при остановке бота рассылку не сбрасываем — её подхватит следующий запуск
+        if self.running:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            await self.locks.release(self.LEASE_KEY, self.owner)
+
+    def _spawn(self, job: dict):
+        self.job = job
+        self.task = asyncio.create_task(self._run(job))
+
+    async def _send_one(self, chat_id: int, job: dict, bucket: TokenBucket) -> str:
+        while (wait := bucket.delay(time.monotonic())) > 0:
+            await asyncio.sleep(wait)
+        bucket.take()
+        try:
+            await self.send(chat_id, job["payload"])
+        except Exception as e:
+            if is_gone(e):
+                await self.users.remove(chat_id)
+                return "blocked"
+            log.warning(f"Broadcast {job['id']} to {chat_id} failed: {e}")
+            return "failed"
+        return "sent"
+
+    async def _run(self, job: dict):
+        bucket = TokenBucket(self.rate, 1)
+        started = time.monotonic()
+        done_here = 0
+        last_report = 0.0
+        try:
+            while True:
+                batch = await self.users.page(job["cursor"], self.concurrency)
+                if not batch:
+                    break
+                results = await asyncio.gather(*(self._send_one(c, job, bucket) for c in batch))
+                for r in results:
+                    job[r] += 1
+                done_here += len(batch)
+                job["cursor"] = batch[-1]
+
+                # стоп с другой реплики: состояние рассылки удалено, аренду снимаем сами
+                if await self.users.get_job() is None:
+                    await self.locks.release(self.LEASE_KEY, self.owner)
+                    return
+                await self.users.save_job(job)
+                await self.locks.set(self.LEASE_KEY, self.owner, ttl=self.lease_ttl)
+
+                now = time.monotonic()
+                if now - last_report >= self.report_every:
+                    last_report = now
+                    await self._report(job, done_here, now - started, False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception(f"Broadcast {job['id']} crashed")
+            job["error"] = str(e)
+            await self._report(job, done_here, time.monotonic() - started, True)
+            await self.locks.release(self.LEASE_KEY, self.owner)
+            return
+
+        await self.users.save_job(None)
+        await self.locks.release(self.LEASE_KEY, self.owner)
+        await self._report(job, done_here, time.monotonic() - started, True)
+        log.info(f"Broadcast {job['id']} finished: {job['sent']} sent, {job['blocked']} blocked, {job['failed']} failed")
+
+    async def _report(self, job: dict, done_here: int, elapsed: float, final: bool):
+        done = job["sent"] + job["blocked"] + job["failed"]
+        speed = done_here / elapsed if elapsed > 0 else 0.0
+        stats = {
+            **job,
+            "done": done,
+            "left": max(job["total"] - done, 0),
+            "rate": speed,
+            "eta": max(job["total"] - done, 0) / speed if speed else None,
+        }
+        try:
+            await self.report(stats, final)
+        except Exception as e:
+            log.warning(f"Broadcast {job['id']} report failed: {e}")
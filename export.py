@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import IO, AsyncIterator
+
+from storage import TicketStore
+
+log = logging.getLogger("vsrap-bot.export")
+
+FORMATS = ("csv", "jsonl")
+CSV_FIELDS = (
+    "ticket", "created_at", "kind", "status", "status_at", "status_by",
+    "user_id", "user_chat_id", "username", "full_name", "link",
+)
+_ROW_FIELDS = CSV_FIELDS[1:]
+
+
+def parse_day(s: str | None) -> str | None:
+    """ГГГГ-ММ-ДД -> начало суток UTC в формате created_at."""
+    if not s:
+        return None
+    return datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat()
+
+
+def _encode(fmt: str, rows: list[tuple[str, dict]]) -> bytes:
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps({"ticket": t, **r}, ensure_ascii=False) + "\n" for t, r in rows
+        ).encode("utf-8")
+    buf = io.StringIO()
+    # None пишется как пустая ячейка
+    csv.writer(buf).writerows([(t, *map(r.get, _ROW_FIELDS)) for t, r in rows])
+    return buf.getvalue().encode("utf-8")
+
+
+def _header(fmt: str) -> bytes:
+    if fmt != "csv":
+        return b""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(CSV_FIELDS)
+    return buf.getvalue().encode("utf-8")
+
+
+async def _chunks(store: TicketStore, fmt: str, filters: dict, chunk: int) -> AsyncIterator[tuple[bytes, int]]:
+    # форматирование — в потоке, чтобы большая выгрузка не держала цикл событий
+    async for rows in store.iter_rows(**filters, chunk=chunk):
+        yield await asyncio.to_thread(_encode, fmt, rows), len(rows)
+
+
+async def export_stream(
+    store: TicketStore, fmt: str, out: IO[bytes], filters: dict, chunk: int = 5000
+) -> int:
+    """Вся выгрузка одним потоком в out; возвращает число заявок."""
+    out.write(_header(fmt))
+    total = 0
+    async for data, n in _chunks(store, fmt, filters, chunk):
+        out.write(data)
+        total += n
+    return total
+
+
+async def export_parts(
+    store: TicketStore,
+    fmt: str,
+    workdir: str,
+    filters: dict,
+    part_bytes: int = 45 * 1024 * 1024,
+    chunk: int = 5000,
+) -> AsyncIterator[tuple[str, int]]:
+    """gzip-части не больше ~part_bytes (у каждой CSV-части свой заголовок).
+
+    Отдаёт (путь, число заявок) по мере готовности каждой части — её можно
+    отправлять, пока собирается следующая.
+    """
+    part, raw, gz, rows = 0, None, None, 0
+
+    def open_part():
+        nonlocal part, raw, gz, rows
+        part += 1
+        path = os.path.join(workdir, f"tickets-{part:03d}.{fmt}.gz")
+        raw = open(path, "wb")
+        gz = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+        gz.write(_header(fmt))
+        rows = 0
+        return path
+
+    path = open_part()
+    async for data, n in _chunks(store, fmt, filters, chunk):
+        await asyncio.to_thread(gz.write, data)
+        rows += n
+        if raw.tell() >= part_bytes:
+            await asyncio.to_thread(gz.close)
+            raw.close()
+            yield path, rows
+            path = open_part()
+    await asyncio.to_thread(gz.close)
+    raw.close()
+    if rows or part == 1:
+        yield path, rows
+    else:
+        os.remove(path)
+
+
+# =======================
+#   CLI
+# =======================
+
+async def _main(args):
+    from storage import make_store
+    from shared import connect_redis
+
+    redis = connect_redis(args.redis_url) if args.redis_url else None
+    store = make_store(
+        args.storage,
+        args.tickets_file,
+        sqlite_path=args.sqlite_file,
+        redis=redis,
+        redis_prefix=args.redis_prefix,
+    )
+    await store.load()
+    filters = {
+        "since": parse_day(args.since),
+        "until": parse_day(args.until),
+        "user_id": args.user,
+        "status": args.status,
+    }
+    try:
+        if args.out and args.out != "-":
+            opener = gzip.open if args.out.endswith(".gz") else open
+            with opener(args.out, "wb") as out:
+                total = await export_stream(store, args.format, out, filters)
+        else:
+            total = await export_stream(store, args.format, sys.stdout.buffer, filters)
+            sys.stdout.buffer.flush()
+    finally:
+        await store.close()
+    log.info(f"Exported {total} tickets")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from storage import STATUSES
+
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Потоковая выгрузка заявок в CSV/JSONL")
+    ap.add_argument("--format", choices=FORMATS, default="csv")
+    ap.add_argument("--since", help="с даты ГГГГ-ММ-ДД (включительно)")
+    ap.add_argument("--until", help="до даты ГГГГ-ММ-ДД (не включая)")
+    ap.add_argument("--user", type=int, help="только заявки этого user_id")
+    ap.add_argument("--status", choices=STATUSES)
+    ap.add_argument("-o", "--out", help="файл (.gz — со сжатием); по умолчанию stdout")
+    ap.add_argument("--storage", default=os.getenv("TICKETS_STORAGE", "json"))
+    ap.add_argument("--tickets-file", default=os.getenv("TICKETS_FILE", "tickets.json"))
+    ap.add_argument("--sqlite-file", default=os.getenv("TICKETS_SQLITE_FILE", "tickets.sqlite3"))
+    ap.add_argument("--redis-url", default=os.getenv("REDIS_URL", ""))
+    ap.add_argument("--redis-prefix", default=os.getenv("REDIS_PREFIX", "vsrap:"))
+    asyncio.run(_main(ap.parse_args()))
@@ -0,0 +1,102 @@
+import re
+from urllib.parse import parse_qs, urlsplit
+
+# =======================
+#   VIDEO LINKS
+# =======================
+
+# мобильные и служебные поддомены, которые ведут на тот же ролик
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "vm.", "vt.", "music.")
+
+_YT_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_TT_PATH = re.compile(r"/(?:@[^/]+/(?:video|photo)|v|embed(?:/v2)?|share/video)/(\d{8,25})")
+_IG_PATH = re.compile(r"^/(?:[^/]+/)?(?:reels?|p|tv)/([A-Za-z0-9_-]+)")
+_VK_ID = re.compile(r"(?:clip|video)(-?\d+_\d+)")
+
+
+def _host(netloc: str) -> tuple[str, str]:
+    """(хост без порта и служебных поддоменов, первый поддомен или "")."""
+    host = netloc.rsplit("@", 1)[-1].split(":", 1)[0].lower().rstrip(".")
+    sub = ""
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            sub = prefix[:-1]
+            host = host[len(prefix):]
+            break
+    return host, sub
+
+
+def _youtube(host: str, path: str, query: str) -> str | None:
+    if host == "youtu.be":
+        vid = path.strip("/").split("/", 1)[0]
+    elif host in ("youtube.com", "youtube-nocookie.com"):
+        parts = path.strip("/").split("/")
+        if parts[0] in ("shorts", "embed", "live", "v") and len(parts) > 1:
+            vid = parts[1]
+        elif parts[0] == "watch":
+            vid = (parse_qs(query).get("v") or [""])[0]
+        else:
+            return None
+    else:
+        return None
+    return f"youtube:{vid}" if _YT_ID.match(vid) else None
+
+
+def _tiktok(host: str, sub: str, path: str) -> str | None:
+    if host != "tiktok.com":
+        return None
+    m = _TT_PATH.search(path)
+    if m:
+        return f"tiktok:{m.group(1)}"
+    # vm./vt.tiktok.com/<код> — короткая ссылка, без сети id ролика не узнать
+    code = path.strip("/").split("/", 1)[0]
+    if sub in ("vm", "vt") and code:
+        return f"tiktok-short:{code}"
+    if code == "t" and path.count("/") >= 2:
+        return f"tiktok-short:{path.strip('/').split('/')[1]}"
+    return None
+
+
+def _instagram(host: str, path: str) -> str | None:
+    if host not in ("instagram.com", "instagr.am"):
+        return None
+    m = _IG_PATH.match(path)
+    return f"instagram:{m.group(1)}" if m else None
+
+
+def _vk(host: str, path: str, query: str) -> str | None:
+    if host not in ("vk.com", "vk.ru", "vkvideo.ru"):
+        return None
+    # vk.com/clip-1_2, vk.com/video-1_2, vk.com/clips?z=clip-1_2, vkvideo.ru/video-1_2
+    m = _VK_ID.search(path) or _VK_ID.search(" ".join(parse_qs(query).get("z", [])))
+    return f"vk:{m.group(1)}" if m else None
+
+
+def canonical_video(url: str) -> str | None:
+    """Ключ ролика «площадка:id» — одинаковый для всех вариантов ссылки на один и тот же ролик.
+
+    www./m./мобильные хосты, youtu.be, /shorts/ и ?v=, UTM-метки и прочие параметры
+    не влияют на ключ. Для других сайтов — хост и путь без параметров. None — не ссылка.
+    """
+    try:
+        p = urlsplit(url.strip())
+    except ValueError:
+        return None
+    if p.scheme not in ("http", "https") or not p.netloc:
+        return None
+    host, sub = _host(p.netloc)
+    path = p.path or "/"
+    key = (
+        _youtube(host, path, p.query)
+        or _tiktok(host, sub, path)
+        or _instagram(host, path)
+        or _vk(host, path, p.query)
+    )
+    if key:
+        return key
+    return f"url:{host}{path.rstrip('/') or '/'}"
+
+
+def proof_key(unique_id: str) -> str:
+    # file_unique_id одинаков у одного и того же файла, кем бы и когда он ни был отправлен
+    return f"file:{unique_id}"
@@ -1,13 +1,22 @@
 import os
+import re
 import asyncio
 import logging
-import random
-import json
-from datetime import datetime, timezone
+import hashlib
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Literal
 from urllib.parse import urlparse
 
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher
 from aiogram.types import (
+    BufferedInputFile,
+    FSInputFile,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
     Message,
     CallbackQuery,
     InlineKeyboardMarkup,
@@ -15,9 +24,43 @@ from aiogram.types import (
     ReplyKeyboardRemove
 )
 from aiogram.filters import CommandStart, Command
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
+from storage import STATUSES, TicketStore, make_store
+from allocator import TicketAllocator
+from links import canonical_video, proof_key
+from payouts import INPUT_COLUMNS, payout_sheet
+from export import FORMATS, export_parts
+from users import FileUserRegistry, RedisUserRegistry
+from broadcast import Broadcaster, fmt_eta
+from tariffs import MONTHLY_MIN_VIDEOS, monthly_tier_lines, video_tier_lines
+from bounded import BoundedMap
+from shared import BoundedMapStorage, MapKV, RedisKV, connect_redis
+from sender import PRIORITY_BULK, PRIORITY_GROUP, SchedulerMiddleware, SendScheduler
+from timers import TimerWheel
+from routing import CallbackRouter, ChatId, PrivateChat, Screen, edit_screen
+from webhook import run_webhook
+from middlewares import (
+    AlbumMiddleware,
+    PerUserOrderMiddleware,
+    ThrottleMiddleware,
+    UpdateDedupMiddleware,
+    UpdateRecorder,
+    parse_limit,
+)
+from metrics import (
+    ApiMetricsMiddleware,
+    HandlerMetricsMiddleware,
+    LoopLagMonitor,
+    SlowUpdateProfiler,
+    registry,
+    start_metrics_server,
+)
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("vsrap-bot")
 
@@ -26,68 +69,188 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPPORT_GROUP_ID_ENV = os.getenv("SUPPORT_GROUP_ID", "").strip()
 SUPPORT_GROUP_ID = int(SUPPORT_GROUP_ID_ENV) if SUPPORT_GROUP_ID_ENV else None
 
+# polling (по умолчанию) или webhook — тогда апдейты принимает aiohttp-сервер
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip() or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080")
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "64"))
+
+# REDIS_URL — общее состояние для нескольких реплик (FSM, forward_map, заявки, счётчик номеров)
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "vsrap:")
+redis = connect_redis(REDIS_URL) if REDIS_URL else None
+
 # ====== STORAGE ======
 TICKETS_FILE = os.getenv("TICKETS_FILE", "tickets.json")
-tickets_lock = asyncio.Lock()
+# json — переписывать весь файл на каждую заявку; journal — снапшот + журнал с групповым fsync;
+# columnar — колоночный снапшот в mmap + журнал: старт без разбора всей истории, заявки не держатся
+# в памяти dict'ами; sqlite — WAL-база с индексами; redis — общая для реплик
+# (columnar, sqlite и redis при первом запуске импортируют TICKETS_FILE)
+TICKETS_STORAGE = os.getenv("TICKETS_STORAGE", "redis" if redis else "json").strip().lower()
+TICKETS_SQLITE_FILE = os.getenv("TICKETS_SQLITE_FILE", "tickets.sqlite3")
+TICKETS_COMPACT_EVERY = int(os.getenv("TICKETS_COMPACT_EVERY", "5000"))
+TICKETS_COMPACT_INTERVAL = float(os.getenv("TICKETS_COMPACT_INTERVAL", "600"))
+# реестр пользователей для /broadcast (с Redis — общий sorted set)
+USERS_FILE = os.getenv("USERS_FILE", "users.jsonl")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "50"))
+# лимит на документ у Bot API — 50 МБ; части /export берём с запасом
+EXPORT_PART_MB = float(os.getenv("EXPORT_PART_MB", "45"))
+
+# ticket(str) -> dict with user_chat_id, user_id, username, full_name, created_at
+# компакцию по времени запускает общий планировщик (timers), по числу записей — само хранилище
+store: TicketStore = make_store(
+    TICKETS_STORAGE,
+    TICKETS_FILE,
+    sqlite_path=TICKETS_SQLITE_FILE,
+    compact_every=TICKETS_COMPACT_EVERY,
+    compact_interval=None,
+    redis=redis,
+    redis_prefix=REDIS_PREFIX,
+)
 
-# ticket_db: ticket(str) -> dict with user_chat_id, user_id, username, full_name, created_at
-ticket_db: dict[str, dict] = {}
+users = RedisUserRegistry(redis, REDIS_PREFIX) if redis is not None else FileUserRegistry(USERS_FILE)
+
+# номер заявки = перестановка порядкового номера: уникален без повторов и не угадывается подряд;
+# ключ общий для всех реплик с одним токеном, если не задан TICKET_SECRET
+TICKET_SECRET = os.getenv("TICKET_SECRET") or f"ticket:{BOT_TOKEN}"
+ticket_allocator = TicketAllocator(
+    key=hashlib.blake2b(TICKET_SECRET.encode()).digest()[:32],
+    reserve=store.reserve_ids,
+    exists=store.exists,
+)
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 async def load_tickets():
-    global ticket_db
-    async with tickets_lock:
-        try:
-            with open(TICKETS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    ticket_db = data
-                else:
-                    ticket_db = {}
-        except FileNotFoundError:
-            ticket_db = {}
-        except Exception as e:
-            log.error(f"Failed to load {TICKETS_FILE}: {e}")
-            ticket_db = {}
+    with registry.timer("storage_seconds", "Время операций хранилища заявок", op="load"):
+        await store.load()
 
 async def save_tickets():
-    async with tickets_lock:
-        try:
-            with open(TICKETS_FILE, "w", encoding="utf-8") as f:
-                json.dump(ticket_db, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            log.error(f"Failed to save {TICKETS_FILE}: {e}")
+    with registry.timer("storage_seconds", "Время операций хранилища заявок", op="save"):
+        await store.save()
 
-async def upsert_ticket(ticket: int, msg: Message, user_chat_id: int):
-    ticket_db[str(ticket)] = {
+async def upsert_ticket(ticket: int, msg: Message, user_chat_id: int, **extra):
+    row = {
         "user_chat_id": user_chat_id,
         "user_id": msg.from_user.id if msg.from_user else None,
         "username": msg.from_user.username if msg.from_user else None,
         "full_name": msg.from_user.full_name if msg.from_user else None,
         "created_at": now_iso(),
+        **extra,
     }
-    await save_tickets()
+    with registry.timer("storage_seconds", "Время операций хранилища заявок", op="upsert"):
+        await store.upsert(str(ticket), row)
+    await users.add(user_chat_id)
 
-def get_user_chat_id_by_ticket(ticket: int) -> int | None:
-    row = ticket_db.get(str(ticket))
+async def get_user_chat_id_by_ticket(ticket: int) -> int | None:
+    row = await store.get(str(ticket))
     if not row:
         return None
     return row.get("user_chat_id")
 
+# ====== STATE TABLES ======
+# STATE_DIR — куда писать таблицы, чтобы пережить рестарт (пусто — только в памяти; с Redis не нужен)
+STATE_DIR = os.getenv("STATE_DIR", "").strip()
+STATES_MAX = int(os.getenv("STATES_MAX", "50000"))
+STATES_TTL = float(os.getenv("STATES_TTL", str(24 * 3600)))
+FORWARD_MAP_MAX = int(os.getenv("FORWARD_MAP_MAX", "200000"))
+FORWARD_MAP_TTL = float(os.getenv("FORWARD_MAP_TTL", str(30 * 24 * 3600)))
+ADMIN_REPLY_TTL = float(os.getenv("ADMIN_REPLY_TTL", str(3600)))
+# брошенный мастер выплаты/обращения сбрасывается через WIZARD_TTL после последнего шага
+WIZARD_TTL = float(os.getenv("WIZARD_TTL", str(2 * 3600)))
+# заявка без ответа SLA_HOURS часов — напоминание в группу, и так до SLA_MAX_PINGS раз (0 — выключено)
+SLA_HOURS = float(os.getenv("SLA_HOURS", "12"))
+SLA_MAX_PINGS = int(os.getenv("SLA_MAX_PINGS", "3"))
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "300"))
+CLAIM_TTL = 7 * 24 * 3600
+# альбом: сколько ждать следующую часть и сколько максимум собирать весь
+ALBUM_DEBOUNCE = float(os.getenv("ALBUM_DEBOUNCE", "0.7"))
+ALBUM_MAX_WAIT = float(os.getenv("ALBUM_MAX_WAIT", "5"))
+
+def state_path(name: str) -> str | None:
+    if not STATE_DIR:
+        return None
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, f"{name}.jsonl")
+
+# состояние мастера — FSM aiogram, data = {"mode": "payout"|"contact", "stage": "...", ...}
+# forward_map: message_id in support group -> user_chat_id (fallback reply mode)
+# awaiting_admin_reply: admin_id -> {"user_chat_id": int, "ticket": int, "at": int} (after pressing "reply" button);
+#   сбрасывает таймер через ADMIN_REPLY_TTL, TTL самой записи вдвое дольше — на случай, если таймер потерялся
+# claims: одноразовые отметки «заявка уже отправлена» / «апдейт уже обработан»
+# albums: части альбомов, пока AlbumMiddleware ждёт остальные
+if redis is not None:
+    from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+    fsm_storage = RedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(prefix=REDIS_PREFIX + "fsm"),
+        state_ttl=int(STATES_TTL),
+        data_ttl=int(STATES_TTL),
+    )
+    forward_map = RedisKV(redis, REDIS_PREFIX + "fwd:", FORWARD_MAP_TTL)
+    awaiting_admin_reply = RedisKV(redis, REDIS_PREFIX + "reply:", ADMIN_REPLY_TTL * 2)
+    claims = RedisKV(redis, REDIS_PREFIX + "claim:", CLAIM_TTL)
+    albums = RedisKV(redis, REDIS_PREFIX, ALBUM_MAX_WAIT * 4)
+else:
+    fsm_storage = BoundedMapStorage(BoundedMap("states", STATES_MAX, STATES_TTL, state_path("states")))
+    forward_map = MapKV(BoundedMap("forward_map", FORWARD_MAP_MAX, FORWARD_MAP_TTL, state_path("forward_map")))
+    awaiting_admin_reply = MapKV(BoundedMap("awaiting_admin_reply", 1000, ADMIN_REPLY_TTL * 2, state_path("awaiting_admin_reply")))
+    claims = MapKV(BoundedMap("claims", 100_000, CLAIM_TTL))
+    albums = MapKV(BoundedMap("albums", 10_000, ALBUM_MAX_WAIT * 4))
+
+async def get_st(state: FSMContext) -> dict | None:
+    return await state.get_data() or None
+
 # ====== Bot ======
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
-
-# states[user_id] = {"mode": "payout"|"contact", "stage": "...", ...}
-states: dict[int, dict] = {}
+dp = Dispatcher(storage=fsm_storage)
+
+# все исходящие вызовы идут через очередь с лимитами (общий, на чат, на группу — в минуту)
+sender = SendScheduler(
+    global_rate=float(os.getenv("SEND_GLOBAL_RATE", "25")),
+    chat_rate=float(os.getenv("SEND_CHAT_RATE", "1")),
+    group_rate=float(os.getenv("SEND_GROUP_RATE", "20")) / 60,
+    max_retries=int(os.getenv("SEND_MAX_RETRIES", "5")),
+)
+bot.session.middleware(SchedulerMiddleware(sender))
+# регистрируется после планировщика — меряет сам вызов API, без ожидания в очереди
+bot.session.middleware(ApiMetricsMiddleware())
+
+# все отложенные действия: напоминания по заявкам, сброс брошенных мастеров, периодические задачи
+timers = TimerWheel()
+
+# UPDATE_LOG — писать все входящие апдейты в JSONL (для bench/loadtest.py --replay)
+UPDATE_LOG = os.getenv("UPDATE_LOG", "").strip()
+if UPDATE_LOG:
+    dp.update.outer_middleware(UpdateRecorder(UPDATE_LOG))
+
+# части альбома собираются в один вызов хендлера — до очереди пользователя, чтобы не ждать в ней самих себя
+album_collector = AlbumMiddleware(
+    albums,
+    describe=lambda m: media_of(m),
+    debounce=ALBUM_DEBOUNCE,
+    max_wait=ALBUM_MAX_WAIT,
+    ttl=ALBUM_MAX_WAIT * 4,
+)
+dp.update.outer_middleware(album_collector)
 
-# message_id in support group -> user_chat_id (fallback reply mode)
-forward_map: dict[int, int] = {}
+# апдейты одного пользователя — по очереди (мастер выплаты меняет состояние между await-ами);
+# с Redis — ещё и распределённый лок, чтобы реплики не обрабатывали одного пользователя одновременно
+update_order = PerUserOrderMiddleware(locks=RedisKV(redis, REDIS_PREFIX) if redis is not None else None)
+if os.getenv("ORDERED_UPDATES", "1") != "0":
+    dp.update.outer_middleware(update_order)
 
-# admin_id -> {"user_chat_id": int, "ticket": int} (after pressing "reply" button)
-awaiting_admin_reply: dict[int, dict] = {}
+# с несколькими репликами один и тот же апдейт может прийти дважды — второй отбрасываем;
+# уже внутри очереди пользователя: SET NX в Redis — await, и два быстрых апдейта одного
+# пользователя, проверяемые до очереди, могли бы встать в неё в обратном порядке
+if redis is not None:
+    dp.update.outer_middleware(UpdateDedupMiddleware(claims))
 
 # =======================
 #   TEXTS
@@ -101,13 +264,10 @@ WELCOME_TEXT = (
     "Выбирай нужный раздел и поехали."
 )
 
+# строки с тарифами собираются из tariffs.py — по тем же таблицам считаются выплаты
 RATES_TEXT = (
     "<b>Тарифы:</b>\n\n"
-    "• TikTok от 100 000 просмотров — 500 ₽\n"
-    "• TikTok от 200 000 просмотров — 1 000 ₽\n"
-    "• TikTok от 1 000 000 — 4 000 ₽\n"
-    "• YouTube Shorts от 100 000 вовлечённых — 700 ₽\n"
-    "• Другие площадки от 100 000 — 500 ₽\n\n"
+    + "\n".join(video_tier_lines()) + "\n\n"
 
     "<blockquote>"
     "<b>❗ Условия для выплаты за короткое видео:</b>\n"
@@ -117,16 +277,13 @@ RATES_TEXT = (
 
     "Если вы ведёте аккаунт, который публикует исключительно контент с видео VSRAP, "
     "мы рассматриваем суммарную статистику аккаунта за месяц и выплачиваем дополнительное вознаграждение.\n\n"
-    "• от 500 000 суммарных просмотров за месяц — 1 000 ₽\n"
-    "• от 1 000 000 суммарных просмотров за месяц — 3 000 ₽\n"
-    "• от 3 000 000 суммарных просмотров за месяц — 5 000 ₽\n"
-    "• от 5 000 000 суммарных просмотров за месяц — 10 000 ₽\n\n"
+    + "\n".join(monthly_tier_lines()) + "\n\n"
 
     "<blockquote expandable>"
     "<b>❗ Условия для месячного вознаграждения:</b>\n"
     "• Аккаунт публикует ТОЛЬКО контент с видео VSRAP\n"
     "• Учитываются только ролики с нашими выпусками\n"
-    "• Минимум 5 роликов за месяц\n"
+    f"• Минимум {MONTHLY_MIN_VIDEOS} роликов за месяц\n"
     "• Просмотры считаются суммарно за календарный месяц\n"
     "• Подтверждение — скрин(ы) аналитики аккаунта за период\n"
     "• Модерация вправе отказать, если аккаунт смешанный или данные некорректны"
@@ -172,51 +329,208 @@ PAYOUT_INFO_TEXT = (
 
 CONTACT_TEXT = "Напишите ваш вопрос — мы ответим вам в ближайшее время."
 
-# =======================
-#   KEYBOARDS
-# =======================
-
-def main_menu_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Тарифы и условия", callback_data="menu:rates")],
-        [InlineKeyboardButton(text="Подкасты для нарезок", callback_data="menu:podcasts")],
-        [InlineKeyboardButton(text="Запросить выплату", callback_data="menu:payout")],
-        [InlineKeyboardButton(text="Связаться с админом", callback_data="menu:contact")],
-    ])
+THROTTLE_TEXT = "Слишком много сообщений подряд. Подождите немного и попробуйте снова."
+STALE_BUTTON_TEXT = "Эта кнопка больше не работает. Откройте меню заново: /start"
+
+# статус заявки -> как его видит пользователь
+TICKET_STATUS_TEXT = {
+    "new": "принята и ждёт проверки",
+    "review": "на проверке у модератора",
+    "paid": "выплачено",
+    "rejected": "отклонена",
+}
+
+# статус -> кнопка в админ-чате
+STATUS_LABELS = {
+    "new": "🆕 Новая",
+    "review": "👀 В работе",
+    "paid": "✅ Выплачено",
+    "rejected": "❌ Отклонено",
+}
+
+# уведомление пользователю о смене статуса (для new не шлём)
+STATUS_NOTICE = {
+    "review": "👀 Заявка <b>#{ticket}</b> взята в работу.",
+    "paid": "✅ Заявка <b>#{ticket}</b> выплачена. Спасибо за нарезку!",
+    "rejected": "❌ Заявка <b>#{ticket}</b> отклонена. Если есть вопросы — напишите нам через меню.",
+}
+
+QUEUE_PAGE = 10
+
+PAYOUT_SENT_TEXT = (
+    "✅ Заявка отправлена. Ваш номер: <b>#{ticket}</b>\n"
+    "Если нужно уточнить статус — просто напишите номер в чате.\n\n"
+    "Если у вас есть ещё видео — подайте новую заявку."
+)
 
-def back_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu:main")]
-    ])
+DUPLICATE_LINK_TEXT = (
+    "Это видео уже подано в заявке <b>#{dup}</b> — повторно его подать нельзя.\n"
+    "Пришлите ссылку на другое видео."
+)
+DUPLICATE_PROOF_TEXT = (
+    "Этот файл уже прикладывали к заявке <b>#{dup}</b>.\n"
+    "Пришлите свежий скрин аналитики именно для этого видео."
+)
+REQUISITES_TEXT = "Пришлите реквизиты для выплаты текстом — кошелёк USDT (TON/TRC20) или другой способ связи."
 
-def payout_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Подать заявку", callback_data="payout:start")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu:main")],
-    ])
+WIZARD_EXPIRED_TEXT = (
+    "Заявка <b>#{ticket}</b> так и не была дозаполнена — сбросил её.\n"
+    "Когда будете готовы, подайте заявку заново."
+)
+SLA_TEXT = "⏰ {what} <b>#{ticket}</b> ждёт ответа уже {age}."
+REPLY_EXPIRED_TEXT = "Режим ответа по заявке <b>#{ticket}</b> сброшен — сообщение так и не пришло."
 
-def reply_user_kb(ticket: int) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Ответить пользователю", callback_data=f"admin:reply:{ticket}")]
-    ])
+# =======================
+#   KEYBOARDS
+# =======================
 
-def again_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Подать заявку", callback_data="payout:start")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu:main")],
-    ])
+# формат callback_data прежний («menu:rates», «admin:reply:123») — кнопки под старыми постами работают
+
+class MenuCb(CallbackData, prefix="menu"):
+    screen: str
+
+class PayoutCb(CallbackData, prefix="payout"):
+    action: Literal["start"] = "start"
+
+class ReplyCb(CallbackData, prefix="admin"):
+    action: Literal["reply"] = "reply"
+    ticket: int
+
+class StatusCb(CallbackData, prefix="admin"):
+    action: Literal["status"] = "status"
+    ticket: int
+    status: str
+
+class QueueCb(CallbackData, prefix="admin"):
+    action: Literal["queue"] = "queue"
+    status: Literal[*STATUSES]  # чужой статус не пройдёт разбор — render_queue его не увидит
+    since: str  # ГГГГ-ММ-ДД или «-»
+    offset: int
+
+# статичные клавиатуры собираются один раз: aiogram их не меняет, делить между ответами можно
+MAIN_MENU_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Тарифы и условия", callback_data=MenuCb(screen="rates").pack())],
+    [InlineKeyboardButton(text="Подкасты для нарезок", callback_data=MenuCb(screen="podcasts").pack())],
+    [InlineKeyboardButton(text="Запросить выплату", callback_data=MenuCb(screen="payout").pack())],
+    [InlineKeyboardButton(text="Связаться с админом", callback_data=MenuCb(screen="contact").pack())],
+])
+
+BACK_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data=MenuCb(screen="main").pack())]
+])
+
+# и под описанием выплат, и после сброса брошенной заявки
+PAYOUT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Подать заявку", callback_data=PayoutCb().pack())],
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data=MenuCb(screen="main").pack())],
+])
+
+def reply_user_kb(ticket: int, status: str | None = None) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text="Ответить пользователю", callback_data=ReplyCb(ticket=ticket).pack())]]
+    # у заявок на выплату — ещё и статусы; текущий отмечен галочкой
+    if status is not None:
+        rows.append([
+            InlineKeyboardButton(
+                text=("• " if s == status else "") + STATUS_LABELS[s],
+                callback_data=StatusCb(ticket=ticket, status=s).pack(),
+            )
+            for s in STATUSES if s != "new"
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def queue_kb(status: str, since: str | None, offset: int, total: int) -> InlineKeyboardMarkup:
+    since_arg = since or "-"
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(
+            text="⬅️", callback_data=QueueCb(status=status, since=since_arg, offset=max(0, offset - QUEUE_PAGE)).pack()
+        ))
+    if offset + QUEUE_PAGE < total:
+        nav.append(InlineKeyboardButton(
+            text="➡️", callback_data=QueueCb(status=status, since=since_arg, offset=offset + QUEUE_PAGE).pack()
+        ))
+    tabs = [
+        InlineKeyboardButton(text=STATUS_LABELS[s], callback_data=QueueCb(status=s, since=since_arg, offset=0).pack())
+        for s in STATUSES if s != status
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in (nav, tabs) if row])
+
+# экраны меню по MenuCb.screen
+SCREENS = {
+    "main": Screen("Главное меню", MAIN_MENU_KB),
+    "rates": Screen(RATES_TEXT, BACK_KB),
+    "podcasts": Screen(PODCASTS_TEXT, BACK_KB),
+    "payout": Screen(PAYOUT_INFO_TEXT, PAYOUT_KB),
+    "contact": Screen(CONTACT_TEXT, BACK_KB),
+}
 
 # =======================
 #   HELPERS
 # =======================
 
-def gen_ticket() -> int:
-    # стараемся избегать коллизий с тем, что уже в базе
-    for _ in range(20):
-        t = random.randint(10000, 99999)
-        if str(t) not in ticket_db:
-            return t
-    return random.randint(10000, 99999)
+async def gen_ticket() -> int:
+    return await ticket_allocator.next()
+
+def ticket_posted(ticket: int, msg: Message, **extra):
+    # вызывается, когда пост в группе реально ушёл (в т.ч. после RetryAfter)
+    async def on_sent(sent: Message):
+        await forward_map.set(sent.message_id, msg.chat.id)
+        # срок первого напоминания хранится в самой заявке — после рестарта таймер заводится по нему
+        sla_at = int(time.time() + SLA_HOURS * 3600) if SLA_HOURS else None
+        await upsert_ticket(ticket, msg, msg.chat.id, group_message_id=sent.message_id, sla_at=sla_at, **extra)
+        if sla_at:
+            timers.schedule(f"sla:{ticket}", sla_at, "sla", str(ticket))
+    return on_sent
+
+async def set_ticket_status(ticket: str, status: str, admin_id: int) -> dict | None:
+    """Новая запись заявки или None, если заявки нет, это обращение или статус уже такой."""
+    row = await store.get(ticket)
+    if not row or row.get("kind") == "contact" or (row.get("status") or "new") == status:
+        return None
+    row = {**row, "status": status, "status_at": now_iso(), "status_by": admin_id}
+    with registry.timer("storage_seconds", "Время операций хранилища заявок", op="upsert"):
+        await store.upsert(ticket, row)
+    if status != "new":
+        timers.cancel(f"sla:{ticket}")
+    return row
+
+def notify_status(changed: list[tuple[str, dict]], status: str):
+    """Разослать пользователям смену статуса и обновить кнопки под постами в группе.
+
+    Всё идёт через SendScheduler с низшим приоритетом: массовая отметка не мешает
+    живым диалогам и укладывается в лимиты Telegram. Несколько заявок одного
+    пользователя — одним сообщением.
+    """
+    notice = STATUS_NOTICE.get(status)
+    by_chat: dict[int, list[str]] = {}
+    for ticket, row in changed:
+        if notice and row.get("user_chat_id"):
+            by_chat.setdefault(row["user_chat_id"], []).append(notice.format(ticket=ticket))
+        if row.get("group_message_id"):
+            sender.submit(
+                SUPPORT_GROUP_ID,
+                lambda t=ticket, mid=row["group_message_id"]: bot.edit_message_reply_markup(
+                    chat_id=SUPPORT_GROUP_ID, message_id=mid, reply_markup=reply_user_kb(int(t), status)
+                ),
+                priority=PRIORITY_BULK,
+            )
+    for chat_id, lines in by_chat.items():
+        sender.submit(
+            chat_id,
+            lambda c=chat_id, text="\n".join(lines): bot.send_message(c, text),
+            priority=PRIORITY_BULK,
+        )
+
+# сообщение целиком — номер заявки: «12345», «#12345», «№ 12345»
+TICKET_NUMBER_RE = re.compile(r"^\s*[#№]?\s*(\d{5,12})\s*$")
+
+def ticket_status_text(ticket: str, row: dict) -> str:
+    status = row.get("status") or "new"
+    created = (row.get("created_at") or "")[:10]
+    return (
+        f"Заявка <b>#{ticket}</b>" + (f" от {created}" if created else "") + "\n"
+        f"Статус: <b>{TICKET_STATUS_TEXT.get(status, status)}</b>"
+    )
 
 def user_label(msg: Message) -> str:
     u = msg.from_user
@@ -232,42 +546,203 @@ def extract_url_from_message(msg: Message) -> str | None:
         if p.scheme in ("http", "https") and p.netloc:
             return text
         return None
-    if text.startswith(("t.me/", "www.", "youtu.be/", "youtube.com/", "vk.com/", "instagram.com/", "x.com/", "twitter.com/")):
+    if text.startswith((
+        "t.me/", "www.", "youtu.be/", "youtube.com/", "m.youtube.com/", "vk.com/", "vkvideo.ru/",
+        "instagram.com/", "x.com/", "twitter.com/",
+        "tiktok.com/", "m.tiktok.com/", "vm.tiktok.com/", "vt.tiktok.com/",
+    )):
         text2 = "https://" + text
         p = urlparse(text2)
         if p.netloc:
             return text2
     return None
 
-def has_single_media(msg: Message) -> tuple[bool, dict | None, str | None]:
-    if msg.media_group_id:
-        return False, None, "Пожалуйста, пришлите <b>один</b> скрин/файл, не альбом."
+def media_of(msg: Message) -> dict | None:
     media = None
+    file = None
     if msg.photo:
-        media = {"type": "photo", "file_id": msg.photo[-1].file_id}
+        media, file = {"type": "photo"}, msg.photo[-1]
     elif msg.document:
-        media = {"type": "document", "file_id": msg.document.file_id}
+        media, file = {"type": "document"}, msg.document
     elif msg.video:
-        media = {"type": "video", "file_id": msg.video.file_id}
+        media, file = {"type": "video"}, msg.video
     elif msg.animation:
-        media = {"type": "animation", "file_id": msg.animation.file_id}
+        media, file = {"type": "animation"}, msg.animation
+    if not media:
+        return None
+    # file_unique_id — для поиска повторно приложенных пруфов
+    media.update(file_id=file.file_id, unique_id=file.file_unique_id)
+    return media
+
+def proof_media(msg: Message, album: list[dict] | None) -> tuple[list[dict], str | None]:
+    """Вложения пруфа: одно из сообщения или все части альбома (их собирает AlbumMiddleware)."""
+    media = [p for p in album if p.get("type")] if album else [m for m in [media_of(msg)] if m]
     if not media:
-        return False, None, "Это только текст без вложений. Пришлите один скрин/файл/видео."
-    return True, media, None
+        return [], "Это только текст без вложений. Пришлите скрин(ы)/файл/видео."
+    return media, None
+
+def album_caption(album: list[dict] | None) -> str | None:
+    return next((p["caption"] for p in album or () if p.get("caption")), None)
+
+INPUT_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+
+def post_album(ticket: int, msg: Message, album: list[dict], caption: str, **extra):
+    """Альбом пруфов — одним send_media_group, подпись с кнопками — отдельным сообщением следом."""
+    async def on_album(sent: list[Message]):
+        for part in sent:
+            await forward_map.set(part.message_id, msg.chat.id)
+        sender.submit(
+            SUPPORT_GROUP_ID,
+            lambda: bot.send_message(
+                SUPPORT_GROUP_ID,
+                caption,
+                reply_markup=reply_user_kb(ticket, "new"),
+                reply_to_message_id=sent[0].message_id,
+            ),
+            priority=PRIORITY_GROUP,
+            on_done=ticket_posted(ticket, msg, **extra),
+        )
+
+    media = [INPUT_MEDIA.get(m["type"], InputMediaDocument)(media=m["file_id"]) for m in album]
+    sender.submit(
+        SUPPORT_GROUP_ID,
+        lambda: bot.send_media_group(SUPPORT_GROUP_ID, media=media),
+        priority=PRIORITY_GROUP,
+        on_done=on_album,
+    )
+
+async def find_duplicate(key: str | None, ticket: int) -> str | None:
+    """Номер другой заявки с тем же ключом: из индекса хранилища или из только что отправленных."""
+    if not key:
+        return None
+    dup = await store.find_key(key) or await claims.get(f"key:{key}")
+    return str(dup) if dup is not None and str(dup) != str(ticket) else None
+
+async def claim_keys(ticket: int, keys: list[str | None]) -> tuple[str, str] | None:
+    # между отправкой поста и записью в хранилище ключи держит claims — две заявки
+    # с одним видео, дошедшие до реквизитов одновременно, не пройдут обе
+    for key in keys:
+        if key and not await claims.set(f"key:{key}", ticket, nx=True):
+            dup = await find_duplicate(key, ticket)
+            if dup:
+                return key, dup
+    return None
+
+# =======================
+#   ANTI-FLOOD
+# =======================
+
+async def throttle_action(event, data: dict) -> str | None:
+    # к какому лимиту относится событие; None — не ограничиваем (админ-чат и т.п.)
+    if isinstance(event, CallbackQuery):
+        data = event.data or ""
+        if data.startswith("admin:"):
+            return None
+        return "payout" if data.startswith("payout:") else "menu"
+    if event.chat.type != "private":
+        return None
+    if (event.text or "").startswith("/"):
+        return "menu"
+    state = data.get("state")
+    st = await get_st(state) if state else None
+    if st and st.get("mode") in ("contact", "payout"):
+        return st["mode"]
+    # сообщение вне режимов — откроет режим обращения
+    return "message"
+
+throttle = ThrottleMiddleware(
+    limits={
+        "menu": parse_limit(os.getenv("THROTTLE_MENU", "10/10")),
+        "contact": parse_limit(os.getenv("THROTTLE_CONTACT", "3/60")),
+        "payout": parse_limit(os.getenv("THROTTLE_PAYOUT", "20/60")),
+        "message": parse_limit(os.getenv("THROTTLE_MESSAGE", "5/60")),
+    },
+    classify=throttle_action,
+    notice=THROTTLE_TEXT,
+)
+dp.message.outer_middleware(throttle)
+dp.callback_query.outer_middleware(throttle)
+
+# =======================
+#   CALLBACK ROUTES
+# =======================
+
+# после антифлуда: отброшенные колбэки не разбираем
+callbacks = CallbackRouter(STALE_BUTTON_TEXT)
+dp.callback_query.outer_middleware(callbacks)
+
+# =======================
+#   METRICS
+# =======================
+
+# METRICS_PORT — отдавать метрики Prometheus на METRICS_HOST:METRICS_PORT/metrics (пусто — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+# PROFILE_SLOW_MS — сохранять профиль апдейтов дольше порога в PROFILE_DIR
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS") or "0")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+async def handler_stage(handler: str, event, data: dict) -> str | None:
+    if handler != "handle_private" or "state" not in data:
+        return None
+    st = await get_st(data["state"])
+    if not st:
+        return "none"
+    return f"{st.get('mode')}:{st['stage']}" if st.get("stage") else st.get("mode")
+
+handler_metrics = HandlerMetricsMiddleware(stage_of=handler_stage)
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+
+slow_profiler = None
+if PROFILE_SLOW_MS:
+    slow_profiler = SlowUpdateProfiler(PROFILE_SLOW_MS / 1000, PROFILE_DIR)
+    dp.update.outer_middleware(slow_profiler)
+
+loop_lag = LoopLagMonitor()
+# размеры и счётчики есть только у локальных таблиц; в Redis их смотрят средствами Redis
+tables = {
+    name: t.map
+    for name, t in (
+        ("states", fsm_storage),
+        ("forward_map", forward_map),
+        ("awaiting_admin_reply", awaiting_admin_reply),
+        ("claims", claims),
+        ("albums", albums),
+    )
+    if isinstance(t, (MapKV, BoundedMapStorage))
+}
+
+registry.gauge("table_size", "Размер таблиц в памяти", lambda: {n: len(t) for n, t in tables.items()}, label="table")
+for stat in ("hits", "misses", "evictions", "expirations"):
+    registry.gauge(
+        f"table_{stat}_total", f"Счётчик {stat} таблиц в памяти",
+        lambda stat=stat: {n: t.stats()[stat] for n, t in tables.items()},
+        label="table", kind="counter",
+    )
+registry.gauge("tickets", "Число заявок в хранилище", store.count)
+registry.gauge("users", "Пользователей в реестре для рассылок", users.count)
+registry.gauge("loop_lag_last_seconds", "Последнее измеренное запаздывание event loop", lambda: loop_lag.last)
+registry.gauge("sender", "Очередь исходящих вызовов", sender.stats, label="stat")
+registry.gauge("update_order", "Очереди апдейтов по пользователям", update_order.stats, label="stat")
+registry.gauge("albums", "Сборка альбомов", album_collector.stats, label="stat")
+registry.gauge("timers", "Отложенные задачи", timers.stats, label="stat")
+registry.gauge("throttle", "Антифлуд: пропущено/отброшено", throttle.stats, label="stat")
 
 # =======================
 #   COMMANDS
 # =======================
 
-@dp.message(CommandStart(), F.chat.type == "private")
-async def start_handler(msg: Message):
-    states.pop(msg.from_user.id, None)
-    await msg.answer(WELCOME_TEXT, reply_markup=main_menu_kb())
+@dp.message(CommandStart(), PrivateChat())
+async def start_handler(msg: Message, state: FSMContext):
+    await state.clear()
+    await users.add(msg.chat.id)
+    await msg.answer(WELCOME_TEXT, reply_markup=MAIN_MENU_KB)
 
-@dp.message(Command("cancel"), F.chat.type == "private")
-async def cancel_handler(msg: Message):
-    states.pop(msg.from_user.id, None)
-    await msg.answer("Окей, отменил. Возвращаю в меню.", reply_markup=main_menu_kb())
+@dp.message(Command("cancel"), PrivateChat())
+async def cancel_handler(msg: Message, state: FSMContext):
+    await state.clear()
+    await msg.answer("Окей, отменил. Возвращаю в меню.", reply_markup=MAIN_MENU_KB)
 
 @dp.message(Command("where"))
 async def where(msg: Message):
@@ -277,39 +752,30 @@ async def where(msg: Message):
 #   MENU
 # =======================
 
-@dp.callback_query(F.data.startswith("menu:"))
-async def menu_handler(cq: CallbackQuery):
-    action = cq.data.split(":")[1]
-    uid = cq.from_user.id
+@dp.callback_query(callbacks.route(MenuCb, *(f"menu:{screen}" for screen in SCREENS)))
+async def menu_handler(cq: CallbackQuery, callback_data: MenuCb, state: FSMContext):
+    screen = callback_data.screen
 
     # если человек был в режиме contact — сбросим при выходе в меню
-    if action in ("main", "rates", "podcasts", "payout"):
-        if uid in states and states[uid].get("mode") == "contact":
-            states.pop(uid, None)
-
-    if action == "main":
-        await cq.message.edit_text("Главное меню", reply_markup=main_menu_kb())
-    elif action == "rates":
-        await cq.message.edit_text(RATES_TEXT, reply_markup=back_kb())
-    elif action == "podcasts":
-        await cq.message.edit_text(PODCASTS_TEXT, reply_markup=back_kb())
-    elif action == "payout":
-        await cq.message.edit_text(PAYOUT_INFO_TEXT, reply_markup=payout_kb())
-    elif action == "contact":
-        states[uid] = {"mode": "contact"}
-        await cq.message.edit_text(CONTACT_TEXT, reply_markup=back_kb())
+    if screen == "contact":
+        await save_wizard(state, {"mode": "contact"})
+    else:
+        st = await get_st(state)
+        if st and st.get("mode") == "contact":
+            await state.clear()
 
+    # повторное нажатие (двойной тап, старая кнопка «Назад») не тратит запрос к API
+    await edit_screen(cq.message, SCREENS[screen])
     await cq.answer()
 
 # =======================
 #   PAYOUT FLOW
 # =======================
 
-@dp.callback_query(F.data == "payout:start")
-async def payout_start(cq: CallbackQuery):
-    uid = cq.from_user.id
-    ticket = gen_ticket()
-    states[uid] = {"mode": "payout", "stage": "link", "ticket": ticket}
+@dp.callback_query(callbacks.route(PayoutCb, "payout:start"))
+async def payout_start(cq: CallbackQuery, state: FSMContext):
+    ticket = await gen_ticket()
+    await save_wizard(state, {"mode": "payout", "stage": "link", "ticket": ticket})
     await cq.message.answer(
         f"Заявка <b>#{ticket}</b>\n\nШаг <b>1/3</b> — пришлите <b>ссылку</b> на видео.",
         reply_markup=ReplyKeyboardRemove()
@@ -320,24 +786,22 @@ async def payout_start(cq: CallbackQuery):
 #   ADMIN BUTTON: REPLY
 # =======================
 
-@dp.callback_query(F.data.startswith("admin:reply:"))
-async def admin_reply_btn(cq: CallbackQuery):
+@dp.callback_query(callbacks.route(ReplyCb, "admin:reply"))
+async def admin_reply_btn(cq: CallbackQuery, callback_data: ReplyCb):
     if SUPPORT_GROUP_ID is None or cq.message.chat.id != SUPPORT_GROUP_ID:
         await cq.answer("Кнопка работает только в админ-чате.", show_alert=True)
         return
 
-    try:
-        ticket = int(cq.data.split(":")[2])
-    except Exception:
-        await cq.answer("Некорректный номер заявки.", show_alert=True)
-        return
+    ticket = callback_data.ticket
 
-    user_chat_id = get_user_chat_id_by_ticket(ticket)
+    user_chat_id = await get_user_chat_id_by_ticket(ticket)
     if not user_chat_id:
         await cq.answer("Не нашёл пользователя по этой заявке.", show_alert=True)
         return
 
-    awaiting_admin_reply[cq.from_user.id] = {"user_chat_id": user_chat_id, "ticket": ticket}
+    at = int(time.time())
+    await awaiting_admin_reply.set(cq.from_user.id, {"user_chat_id": user_chat_id, "ticket": ticket, "at": at})
+    timers.schedule(f"reply:{cq.from_user.id}", at + ADMIN_REPLY_TTL, "reply", cq.from_user.id)
     await cq.answer()
 
     await bot.send_message(
@@ -350,45 +814,352 @@ async def admin_reply_btn(cq: CallbackQuery):
 async def cancel_admin_reply(msg: Message):
     if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
         return
-    if msg.from_user.id in awaiting_admin_reply:
-        awaiting_admin_reply.pop(msg.from_user.id, None)
+    timers.cancel(f"reply:{msg.from_user.id}")
+    if await awaiting_admin_reply.pop(msg.from_user.id) is not None:
         await msg.reply("Окей, отменил режим ответа пользователю.")
     else:
         await msg.reply("Режим ответа не активен.")
 
+# =======================
+#   ADMIN: STATUSES & QUEUE
+# =======================
+
+@dp.callback_query(callbacks.route(StatusCb, "admin:status"))
+async def admin_status_btn(cq: CallbackQuery, callback_data: StatusCb):
+    if SUPPORT_GROUP_ID is None or cq.message.chat.id != SUPPORT_GROUP_ID:
+        await cq.answer("Кнопка работает только в админ-чате.", show_alert=True)
+        return
+
+    ticket, status = str(callback_data.ticket), callback_data.status
+    if status not in STATUSES:
+        await cq.answer("Неизвестный статус.", show_alert=True)
+        return
+
+    row = await set_ticket_status(ticket, status, cq.from_user.id)
+    if row is None:
+        await cq.answer("Статус не изменился.")
+        return
+    await cq.answer(f"#{ticket}: {STATUS_LABELS[status]}")
+    # кнопки под этим постом правим сразу, пользователю пишем через общую очередь
+    await cq.message.edit_reply_markup(reply_markup=reply_user_kb(int(ticket), status))
+    notify_status([(ticket, {**row, "group_message_id": None})], status)
+
+def parse_date(s: str | None) -> str | None:
+    if not s or s == "-":
+        return None
+    return datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc).isoformat()
+
+async def render_queue(status: str, since: str | None, offset: int) -> tuple[str, InlineKeyboardMarkup]:
+    since_iso = parse_date(since)
+    total = await store.count_status(status, since_iso)
+    page = await store.by_status(status, since_iso, offset, QUEUE_PAGE)
+    head = f"<b>{STATUS_LABELS[status]}</b> — {total} шт." + (f" с {since}" if since else "")
+    lines = [head]
+    for ticket, row in page:
+        uname = f"@{row['username']}" if row.get("username") else f"id={row.get('user_id')}"
+        lines.append(f"<b>#{ticket}</b> · {(row.get('created_at') or '')[:16].replace('T', ' ')} · {uname}")
+        if row.get("link"):
+            lines.append(f"    {row['link']}")
+    if not page:
+        lines.append("Пусто.")
+    elif total > QUEUE_PAGE:
+        lines.append(f"\n{offset + 1}–{offset + len(page)} из {total}")
+    return "\n".join(lines), queue_kb(status, since, offset, total)
+
+@dp.message(Command("queue"))
+async def queue_cmd(msg: Message):
+    # /queue [new|review|paid|rejected] [YYYY-MM-DD]
+    if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
+        return
+    args = (msg.text or "").split()[1:]
+    status = args[0] if args and args[0] in STATUSES else "new"
+    since = next((a for a in args if a not in STATUSES), None)
+    try:
+        text, kb = await render_queue(status, since, 0)
+    except ValueError:
+        await msg.reply("Формат: <code>/queue [new|review|paid|rejected] [ГГГГ-ММ-ДД]</code>")
+        return
+    await msg.answer(text, reply_markup=kb, disable_web_page_preview=True)
+
+@dp.callback_query(callbacks.route(QueueCb, "admin:queue"))
+async def queue_page_btn(cq: CallbackQuery, callback_data: QueueCb):
+    if SUPPORT_GROUP_ID is None or cq.message.chat.id != SUPPORT_GROUP_ID:
+        await cq.answer("Кнопка работает только в админ-чате.", show_alert=True)
+        return
+    since = None if callback_data.since == "-" else callback_data.since
+    text, kb = await render_queue(callback_data.status, since, callback_data.offset)
+    # та же страница (повторный тап по вкладке) — без правки
+    await edit_screen(cq.message, Screen(text, kb), disable_web_page_preview=True)
+    await cq.answer()
+
+@dp.message(Command("mark"))
+async def mark_cmd(msg: Message):
+    # /mark paid 12345 12346 ... — массовая смена статуса с уведомлением пользователей
+    if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
+        return
+    args = re.split(r"[\s,;#]+", (msg.text or "").strip())[1:]
+    if not args or args[0] not in STATUSES or len(args) < 2:
+        await msg.reply("Формат: <code>/mark paid 12345 12346 ...</code>")
+        return
+    status, tickets = args[0], list(dict.fromkeys(t for t in args[1:] if t.isdigit()))
+
+    changed, skipped = [], []
+    for ticket in tickets:
+        row = await set_ticket_status(ticket, status, msg.from_user.id)
+        if row is None:
+            skipped.append(ticket)
+        else:
+            changed.append((ticket, row))
+    notify_status(changed, status)
+
+    text = f"{STATUS_LABELS[status]}: отмечено {len(changed)} из {len(tickets)}."
+    if skipped:
+        text += "\nНе найдены, обращения или уже с этим статусом: " + ", ".join(f"#{t}" for t in skipped[:50])
+    await msg.reply(text)
+
+@dp.message(Command("payouts"))
+async def payouts_cmd(msg: Message):
+    # CSV с заявками и просмотрами (в подписи /payouts или ответом на файл) -> ведомость по тарифам
+    if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
+        return
+    doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    if doc is None:
+        await msg.reply(
+            "Пришлите CSV с колонками <code>" + ", ".join(INPUT_COLUMNS) + "</code> "
+            "с подписью /payouts или ответьте /payouts на сообщение с файлом."
+        )
+        return
+
+    raw = (await bot.download(doc)).read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # выгрузка из Excel на русской Windows
+        text = raw.decode("cp1251")
+    sheet, totals, errors = await asyncio.to_thread(payout_sheet, text)
+
+    caption = (
+        f"Роликов: {totals['videos']}, аккаунтов: {totals['accounts']} (с бонусом: {totals['bonus_accounts']})\n"
+        f"За ролики: {totals['video_rub']} ₽, бонусы: {totals['bonus_rub']} ₽\n"
+        f"<b>Итого: {totals['total_rub']} ₽</b>"
+    )
+    if errors:
+        caption += f"\n\nПропущено строк: {len(errors)}\n" + "\n".join(errors[:5])
+    name = os.path.splitext(doc.file_name or "submissions")[0]
+    await msg.reply_document(
+        BufferedInputFile(sheet.encode("utf-8"), filename=f"payouts-{name}.csv"),
+        caption=caption[:1024],
+    )
+
+EXPORT_USAGE = (
+    "Формат: <code>/export [csv|jsonl] [new|review|paid|rejected] "
+    "[from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [user=ID]</code>"
+)
+# выгрузки идут фоном (ссылки держим, чтобы задачу не собрал GC); одновременно — одна
+export_tasks: set[asyncio.Task] = set()
+
+async def run_export(fmt: str, filters: dict, reply_to: int):
+    workdir = tempfile.mkdtemp(prefix="vsrap-export-")
+    total = parts = 0
+    try:
+        async for path, rows in export_parts(store, fmt, workdir, filters, int(EXPORT_PART_MB * 1024 * 1024)):
+            parts += 1
+            total += rows
+            # часть уходит через общую очередь отправки, пока следующая ещё собирается
+            await sender.call(
+                SUPPORT_GROUP_ID,
+                lambda path=path, rows=rows, part=parts: bot.send_document(
+                    SUPPORT_GROUP_ID,
+                    FSInputFile(path),
+                    caption=f"Часть {part}: {rows} заявок",
+                    reply_to_message_id=reply_to,
+                ),
+                PRIORITY_BULK,
+            )
+            os.remove(path)
+        await sender.call(
+            SUPPORT_GROUP_ID,
+            lambda: bot.send_message(SUPPORT_GROUP_ID, f"Выгрузка готова: {total} заявок, частей: {parts}."),
+            PRIORITY_BULK,
+        )
+    except Exception as e:
+        log.exception("Export failed")
+        await bot.send_message(SUPPORT_GROUP_ID, f"Выгрузка прервалась: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+@dp.message(Command("export"))
+async def export_cmd(msg: Message):
+    # /export [csv|jsonl] [статус] [from=...] [to=...] [user=...] — потоковая выгрузка заявок в .gz частями
+    if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
+        return
+    if export_tasks:
+        await msg.reply("Предыдущая выгрузка ещё идёт.")
+        return
+
+    fmt, filters = "csv", {"since": None, "until": None, "user_id": None, "status": None}
+    try:
+        for arg in (msg.text or "").split()[1:]:
+            key, _, value = arg.partition("=")
+            if arg in FORMATS:
+                fmt = arg
+            elif arg in STATUSES:
+                filters["status"] = arg
+            elif key == "from":
+                filters["since"] = parse_date(value)
+            elif key == "to":
+                # to= включительно: граница — начало следующих суток
+                filters["until"] = (datetime.fromisoformat(parse_date(value)) + timedelta(days=1)).isoformat()
+            elif key == "user":
+                filters["user_id"] = int(value)
+            else:
+                raise ValueError(arg)
+    except (ValueError, TypeError):
+        await msg.reply(EXPORT_USAGE)
+        return
+
+    task = asyncio.create_task(run_export(fmt, filters, msg.message_id))
+    export_tasks.add(task)
+    task.add_done_callback(export_tasks.discard)
+    await msg.reply("Выгрузка запущена — файлы придут сюда частями.")
+
+# =======================
+#   ADMIN: BROADCAST
+# =======================
+
+BROADCAST_USAGE = (
+    "Рассылка всем, кто писал боту:\n"
+    "• ответьте <code>/broadcast</code> на сообщение в этом чате — оно уйдёт копией (с медиа и форматированием);\n"
+    "• или <code>/broadcast текст</code>;\n"
+    "• <code>/broadcast status</code>, <code>/broadcast stop</code>."
+)
+
+async def broadcast_send(chat_id: int, payload: dict):
+    if payload.get("message_id"):
+        call = lambda: bot.copy_message(chat_id, payload["from_chat_id"], payload["message_id"])
+    else:
+        call = lambda: bot.send_message(chat_id, payload["text"])
+    await sender.call(chat_id, call, PRIORITY_BULK)
+
+def broadcast_text(stats: dict, final: bool) -> str:
+    head = "Рассылка завершена" if final and not stats.get("error") else "Рассылка"
+    if stats.get("error"):
+        head = f"Рассылка прервалась: {stats['error']}\n<code>/broadcast stop</code> — сбросить, иначе продолжится после рестарта"
+    lines = [
+        f"<b>{head}</b> #{stats['id']}",
+        f"Отправлено: {stats['sent']} из {stats['total']}",
+        f"Заблокировали бота: {stats['blocked']} (убраны из списка)",
+        f"Ошибок: {stats['failed']}",
+        f"Скорость: {stats['rate']:.1f} сообщ./с",
+    ]
+    if not final and stats.get("eta") is not None:
+        lines.append(f"Осталось: ~{fmt_eta(stats['eta'])}")
+    return "\n".join(lines)
+
+async def broadcast_report(stats: dict, final: bool):
+    text = broadcast_text(stats, final)
+    if stats.get("report_message_id") and not final:
+        await bot.edit_message_text(text, chat_id=SUPPORT_GROUP_ID, message_id=stats["report_message_id"])
+    else:
+        await bot.send_message(SUPPORT_GROUP_ID, text, reply_to_message_id=stats.get("report_message_id"))
+
+broadcaster = Broadcaster(
+    users,
+    claims,
+    broadcast_send,
+    broadcast_report,
+    rate=BROADCAST_RATE,
+    concurrency=BROADCAST_CONCURRENCY,
+)
+
+@dp.message(Command("broadcast"))
+async def broadcast_cmd(msg: Message):
+    if SUPPORT_GROUP_ID is None or msg.chat.id != SUPPORT_GROUP_ID:
+        return
+    arg = (msg.text or "").split(maxsplit=1)[1:]
+    if arg and arg[0].strip() == "stop":
+        job = await broadcaster.stop()
+        if job is None:
+            await msg.reply("Рассылка не идёт.")
+        else:
+            await msg.reply(f"Рассылка #{job['id']} остановлена: отправлено {job['sent']} из {job['total']}.")
+        return
+    if arg and arg[0].strip() == "status":
+        job = await users.get_job()
+        if job is None:
+            await msg.reply(f"Рассылка не идёт. Пользователей в списке: {await users.count()}.")
+        else:
+            done = job["sent"] + job["blocked"] + job["failed"]
+            await msg.reply(f"Рассылка #{job['id']}: обработано {done} из {job['total']}.")
+        return
+
+    if msg.reply_to_message:
+        payload = {"from_chat_id": msg.chat.id, "message_id": msg.reply_to_message.message_id}
+    elif arg:
+        # html_text сохраняет форматирование; отрезаем саму команду
+        payload = {"text": msg.html_text.split(maxsplit=1)[1]}
+    else:
+        await msg.reply(BROADCAST_USAGE)
+        return
+
+    total = await users.count()
+    status = await msg.reply(f"Рассылка запускается: {total} получателей…")
+    job = await broadcaster.start(payload, report_message_id=status.message_id)
+    if job is None:
+        await status.edit_text("Уже идёт другая рассылка — <code>/broadcast status</code> или <code>/broadcast stop</code>.")
+
 # =======================
 #   PRIVATE MESSAGES
 # =======================
 
-@dp.message(F.chat.type == "private", ~F.from_user.is_bot)
-async def handle_private(msg: Message):
+@dp.message(PrivateChat(bots=False))
+async def handle_private(msg: Message, state: FSMContext, album: list[dict] | None = None):
     if not SUPPORT_GROUP_ID:
         await msg.answer("⚠️ SUPPORT_GROUP_ID не настроен.")
         return
 
-    uid = msg.from_user.id
-    st = states.get(uid)
+    st = await get_st(state)
+
+    # НОМЕР ЗАЯВКИ: ответить статусом, а не открывать новое обращение (вне мастера выплаты)
+    m = TICKET_NUMBER_RE.match(msg.text or "")
+    if m and not (st and st.get("mode") == "payout"):
+        ticket = m.group(1)
+        row = await store.user_ticket(msg.from_user.id, ticket)
+        if row is not None:
+            await msg.answer(ticket_status_text(ticket, row), reply_markup=MAIN_MENU_KB)
+            await state.clear()
+            return
+        # в режиме обращения чужой/несуществующий номер — это просто текст вопроса
+        if not st:
+            text = f"Заявка <b>#{ticket}</b> не найдена среди ваших. Проверьте номер или напишите вопрос текстом."
+            own = await store.by_user(msg.from_user.id)
+            if own:
+                text += "\n\nВаши заявки: " + ", ".join(f"#{t}" for t, _ in own[-5:])
+            await msg.answer(text, reply_markup=MAIN_MENU_KB)
+            return
 
     # CONTACT MODE
     if st and st.get("mode") == "contact":
-        ticket = gen_ticket()
+        ticket = await gen_ticket()
 
-        sent = await bot.send_message(
-            SUPPORT_GROUP_ID,
+        text = (
             f"✉️ <b>Обращение #{ticket}</b>\n"
             f"От: {user_label(msg)}\n\n"
-            f"{(msg.text or msg.caption or '—').strip()}",
-            reply_markup=reply_user_kb(ticket)
+            f"{(msg.text or msg.caption or album_caption(album) or '—').strip()}"
+        )
+        sender.submit(
+            SUPPORT_GROUP_ID,
+            lambda: bot.send_message(SUPPORT_GROUP_ID, text, reply_markup=reply_user_kb(ticket)),
+            priority=PRIORITY_GROUP,
+            on_done=ticket_posted(ticket, msg, kind="contact"),
         )
-        forward_map[sent.message_id] = msg.chat.id
-        await upsert_ticket(ticket, msg, msg.chat.id)
 
         await msg.answer(
             f"Ваше обращение зарегистрировано под номером <b>#{ticket}</b>.\n"
             "Мы ответим вам в ближайшее время.",
-            reply_markup=main_menu_kb()
+            reply_markup=MAIN_MENU_KB
         )
-        states.pop(uid, None)
+        await state.clear()
         return
 
     # PAYOUT MODE
@@ -401,32 +1172,66 @@ async def handle_private(msg: Message):
             if not url:
                 await msg.answer("Это не похоже на ссылку. Пришлите корректный URL (http/https) на ваше видео.")
                 return
+            link_key = canonical_video(url)
+            dup = await find_duplicate(link_key, ticket)
+            if dup:
+                await msg.answer(DUPLICATE_LINK_TEXT.format(dup=dup))
+                return
             st["link"] = url
+            st["link_key"] = link_key
             st["stage"] = "proof"
+            await save_wizard(state, st)
             await msg.answer(
                 "Ссылка принята ✅\n\n"
                 f"Заявка <b>#{ticket}</b>\n"
-                "Шаг <b>2/3</b> — пришлите <b>один</b> скрин/файл подтверждения (фото/документ/PDF/видео). "
-                "Альбомы не принимаются."
+                "Шаг <b>2/3</b> — пришлите скрин(ы)/файл подтверждения (фото/документ/PDF/видео). "
+                "Несколько скринов можно одним альбомом."
             )
             return
 
         if stage == "proof":
-            ok, media, err = has_single_media(msg)
-            if not ok:
+            media, err = proof_media(msg, album)
+            if err:
                 await msg.answer(err)
                 return
-            st["media"] = media
+            keys = list(dict.fromkeys(proof_key(m["unique_id"]) for m in media))
+            for pk in keys:
+                dup = await find_duplicate(pk, ticket)
+                if dup:
+                    await msg.answer(DUPLICATE_PROOF_TEXT.format(dup=dup))
+                    return
+            if len(media) > 1:
+                st["album"] = media
+                st["proof_keys"] = keys
+            else:
+                st["media"] = media[0]
+            st["proof_key"] = keys[0]
             st["stage"] = "requisites"
+            await save_wizard(state, st)
             await msg.answer(
-                "Пруф получен ✅\n\n"
+                ("Пруф получен ✅" if len(media) == 1 else f"Пруфы получены ✅ ({len(media)} шт.)") + "\n\n"
                 f"Заявка <b>#{ticket}</b>\n"
                 "Шаг <b>3/3</b> — укажите реквизиты для выплаты (USDT TON/TRC20) или другой способ связи."
             )
             return
 
         if stage == "requisites":
-            requisites = (msg.text or msg.caption or "").strip() or "—"
+            # медиа без подписи — не реквизиты (часто это запоздавшая часть альбома с пруфами)
+            requisites = (msg.text or msg.caption or "").strip()
+            if not requisites:
+                await msg.answer(REQUISITES_TEXT)
+                return
+            # заявку отправляет ровно одна реплика, даже если шаг пришёл дважды
+            if not await claims.set(f"submit:{ticket}", True, nx=True):
+                await state.clear()
+                return
+            clash = await claim_keys(ticket, [st.get("link_key"), *(st.get("proof_keys") or [st.get("proof_key")])])
+            if clash:
+                key, dup = clash
+                text = DUPLICATE_LINK_TEXT if key == st.get("link_key") else DUPLICATE_PROOF_TEXT
+                await msg.answer(text.format(dup=dup), reply_markup=PAYOUT_KB)
+                await state.clear()
+                return
             st["requisites"] = requisites
 
             caption = (
@@ -436,64 +1241,57 @@ async def handle_private(msg: Message):
                 f"💼 Реквизиты: {st.get('requisites','—')}"
             )
 
-            m = st.get("media")
-            sent_msg = None
+            extra = {
+                "kind": "payout",
+                "status": "new",
+                "link": st.get("link"),
+                "link_key": st.get("link_key"),
+                "proof_key": st.get("proof_key"),
+            }
+            if st.get("proof_keys"):
+                extra["proof_keys"] = st["proof_keys"]
+            if st.get("album"):
+                post_album(ticket, msg, st["album"], caption, **extra)
+                await msg.answer(PAYOUT_SENT_TEXT.format(ticket=ticket), reply_markup=PAYOUT_KB)
+                await state.clear()
+                return
 
-            if m["type"] == "photo":
-                sent_msg = await bot.send_photo(
-                    SUPPORT_GROUP_ID,
-                    m["file_id"],
-                    caption=caption,
-                    reply_markup=reply_user_kb(ticket)
-                )
-            elif m["type"] == "document":
-                sent_msg = await bot.send_document(
-                    SUPPORT_GROUP_ID,
-                    m["file_id"],
-                    caption=caption,
-                    reply_markup=reply_user_kb(ticket)
-                )
-            elif m["type"] == "video":
-                sent_msg = await bot.send_video(
-                    SUPPORT_GROUP_ID,
-                    m["file_id"],
-                    caption=caption,
-                    reply_markup=reply_user_kb(ticket)
-                )
-            elif m["type"] == "animation":
-                sent_msg = await bot.send_animation(
+            m = st.get("media")
+            send_media = {
+                "photo": bot.send_photo,
+                "document": bot.send_document,
+                "video": bot.send_video,
+                "animation": bot.send_animation,
+            }[m["type"]]
+            sender.submit(
+                SUPPORT_GROUP_ID,
+                lambda: send_media(
                     SUPPORT_GROUP_ID,
                     m["file_id"],
                     caption=caption,
-                    reply_markup=reply_user_kb(ticket)
-                )
-
-            if sent_msg:
-                forward_map[sent_msg.message_id] = msg.chat.id
-                await upsert_ticket(ticket, msg, msg.chat.id)
-
-            await msg.answer(
-                f"✅ Заявка отправлена. Ваш номер: <b>#{ticket}</b>\n"
-                "Если нужно уточнить статус — просто напишите номер в чате.\n\n"
-                "Если у вас есть ещё видео — подайте новую заявку.",
-                reply_markup=again_kb()
+                    reply_markup=reply_user_kb(ticket, "new")
+                ),
+                priority=PRIORITY_GROUP,
+                on_done=ticket_posted(ticket, msg, **extra),
             )
 
-            states.pop(uid, None)
+            await msg.answer(PAYOUT_SENT_TEXT.format(ticket=ticket), reply_markup=PAYOUT_KB)
+
+            await state.clear()
             return
 
     # DEFAULT: если вне режимов — уводим в контакт
-    states[uid] = {"mode": "contact"}
-    await msg.answer(CONTACT_TEXT, reply_markup=back_kb())
+    await save_wizard(state, {"mode": "contact"})
+    await msg.answer(CONTACT_TEXT, reply_markup=BACK_KB)
 
 # =======================
 #   GROUP: ADMIN MESSAGES
 # =======================
 
-@dp.message(lambda m: SUPPORT_GROUP_ID is not None and m.chat.id == SUPPORT_GROUP_ID)
+@dp.message(ChatId(SUPPORT_GROUP_ID))
 async def handle_group(msg: Message):
     # 1) Режим ответа после кнопки
-    ar = awaiting_admin_reply.get(msg.from_user.id)
+    ar = await awaiting_admin_reply.get(msg.from_user.id)
     if ar and (msg.text or msg.caption or msg.photo or msg.document or msg.video or msg.animation):
         user_chat_id = ar["user_chat_id"]
         ticket = ar["ticket"]
@@ -507,15 +1305,17 @@ async def handle_group(msg: Message):
             else:
                 await msg.copy_to(user_chat_id)
             await msg.reply(f"Отправил пользователю ответ по заявке #{ticket}.")
+            await mark_answered(str(ticket))
         finally:
-            awaiting_admin_reply.pop(msg.from_user.id, None)
+            timers.cancel(f"reply:{msg.from_user.id}")
+            await awaiting_admin_reply.delete(msg.from_user.id)
         return
 
     # 2) Fallback: reply на сообщение в группе
     if not msg.reply_to_message:
         return
 
-    user_chat_id = forward_map.get(msg.reply_to_message.message_id)
+    user_chat_id = await forward_map.get(msg.reply_to_message.message_id)
     if not user_chat_id:
         return
 
@@ -529,6 +1329,159 @@ async def handle_group(msg: Message):
         await msg.copy_to(user_chat_id, caption=prefix + msg.caption)
     else:
         await msg.copy_to(user_chat_id)
+    await mark_replied(user_chat_id, msg.reply_to_message.message_id)
+
+# =======================
+#   TIMERS
+# =======================
+
+async def save_wizard(state: FSMContext, st: dict):
+    """Записать шаг мастера и перенести таймер его сброса."""
+    st["at"] = int(time.time())
+    await state.set_data(st)
+    chat_id = state.key.chat_id
+    timers.schedule(f"wizard:{chat_id}", st["at"] + WIZARD_TTL, "wizard", chat_id)
+
+async def expire_wizard(key: str, chat_id: int):
+    state = FSMContext(fsm_storage, StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=chat_id))
+    st = await get_st(state)
+    # мастер уже закрыт или был шаг позже — таймер перенесён (возможно, на другой реплике)
+    if not st or st.get("at", 0) + WIZARD_TTL > time.time():
+        return
+    # после рестарта таймер стоит на каждой реплике — сбрасывает и пишет одна
+    if not await claims.set(f"wizard:{chat_id}:{st['at']}", True, nx=True):
+        return
+    await state.clear()
+    if st.get("mode") == "payout":
+        sender.submit(
+            chat_id,
+            lambda: bot.send_message(chat_id, WIZARD_EXPIRED_TEXT.format(ticket=st.get("ticket")), reply_markup=PAYOUT_KB),
+            priority=PRIORITY_BULK,
+        )
+
+async def expire_admin_reply(key: str, admin_id: int):
+    ar = await awaiting_admin_reply.get(admin_id)
+    if not ar or ar.get("at", 0) + ADMIN_REPLY_TTL > time.time():
+        return
+    if not await claims.set(f"reply:{admin_id}:{ar.get('at', 0)}", True, nx=True):
+        return
+    await awaiting_admin_reply.delete(admin_id)
+    sender.submit(
+        SUPPORT_GROUP_ID,
+        lambda: bot.send_message(SUPPORT_GROUP_ID, REPLY_EXPIRED_TEXT.format(ticket=ar["ticket"])),
+        priority=PRIORITY_GROUP,
+    )
+
+def sla_open(row: dict) -> bool:
+    # ждёт ответа: на обращение никто не ответил, заявку на выплату никто не взял в работу
+    if row.get("answered_at"):
+        return False
+    return row.get("kind") == "contact" or (row.get("status") or "new") == "new"
+
+def arm_sla(ticket: str, row: dict):
+    if SLA_HOURS and row.get("sla_at") and sla_open(row):
+        timers.schedule(f"sla:{ticket}", row["sla_at"], "sla", ticket)
+
+async def sla_ping(key: str, ticket: str):
+    row = await store.get(ticket)
+    if not row or not row.get("sla_at") or not sla_open(row):
+        return
+    if row["sla_at"] > time.time():
+        # срок уже перенесла другая реплика
+        arm_sla(ticket, row)
+        return
+    pings = row.get("sla_pings", 0)
+    # таймер по заявке может быть у каждой реплики — в группу пишет одна
+    if not await claims.set(f"sla:{ticket}:{pings}", True, nx=True):
+        timers.schedule(key, time.time() + SLA_HOURS * 3600, "sla", ticket)
+        return
+
+    age = time.time() - datetime.fromisoformat(row["created_at"]).timestamp()
+    what = "Обращение" if row.get("kind") == "contact" else "Заявка"
+    text = SLA_TEXT.format(what=what, ticket=ticket, age=fmt_eta(age))
+    sender.submit(
+        SUPPORT_GROUP_ID,
+        lambda: bot.send_message(
+            SUPPORT_GROUP_ID,
+            text,
+            reply_to_message_id=row.get("group_message_id"),
+            allow_sending_without_reply=True,
+        ),
+        priority=PRIORITY_GROUP,
+    )
+    pings += 1
+    row = {
+        **row,
+        "sla_pings": pings,
+        "sla_at": int(time.time() + SLA_HOURS * 3600) if pings < SLA_MAX_PINGS else None,
+    }
+    with registry.timer("storage_seconds", "Время операций хранилища заявок", op="upsert"):
+        await store.upsert(ticket, row)
+    arm_sla(ticket, row)
+
+async def mark_answered(ticket: str, row: dict | None = None):
+    """Админ ответил пользователю — напоминания по заявке больше не нужны."""
+    timers.cancel(f"sla:{ticket}")
+    row = row or await store.get(ticket)
+    if row and not row.get("answered_at"):
+        with registry.timer("storage_seconds", "Время операций хранилища заявок", op="upsert"):
+            await store.upsert(ticket, {**row, "answered_at": now_iso()})
+
+async def mark_replied(user_chat_id: int, group_message_id: int):
+    # reply на пост заявки — ответ по ней; на часть альбома и прочее — по всем открытым заявкам
+    # пользователя (в личке chat_id = user_id)
+    own = [(t, r) for t, r in await store.by_user(user_chat_id) if sla_open(r)]
+    hit = [(t, r) for t, r in own if r.get("group_message_id") == group_message_id]
+    for ticket, row in hit or own:
+        await mark_answered(ticket, row)
+
+async def sweep_tables():
+    # истёкшие записи иначе лежат в памяти, пока их не спросят или не вытеснит LRU
+    swept = sum(t.sweep() for t in tables.values())
+    if swept:
+        log.debug(f"Swept {swept} expired records")
+
+async def resume_broadcast():
+    # None — рассылки нет, она уже идёт здесь или её ведёт реплика с живой арендой
+    if await broadcaster.resume():
+        await bot.send_message(SUPPORT_GROUP_ID, "Продолжаю рассылку после перезапуска.")
+
+async def restore_timers():
+    """Завести таймеры заново по тому, что пережило рестарт: срокам в заявках и локальному состоянию."""
+    if SLA_HOURS:
+        # после последнего напоминания sla_at пуст — старше этого окна заявки смотреть незачем
+        since = datetime.fromtimestamp(time.time() - SLA_HOURS * 3600 * (SLA_MAX_PINGS + 1), timezone.utc)
+        async for rows in store.iter_rows(since=since.isoformat(), chunk=5000):
+            for ticket, row in rows:
+                arm_sla(ticket, row)
+    # с Redis состояние общее: таймеры поднимает каждая реплика, уведомление отправит одна (claims)
+    async for chat_id, st in saved_wizards():
+        if st.get("at"):
+            timers.schedule(f"wizard:{chat_id}", st["at"] + WIZARD_TTL, "wizard", chat_id)
+    async for admin_id, ar in awaiting_admin_reply.scan():
+        admin_id = int(admin_id)
+        timers.schedule(f"reply:{admin_id}", ar.get("at", 0) + ADMIN_REPLY_TTL, "reply", admin_id)
+    log.info(f"Timers restored: {len(timers)} pending")
+
+async def saved_wizards() -> AsyncIterator[tuple[int, dict]]:
+    """(chat_id, data) всех сохранённых мастеров — из BoundedMap или из ключей RedisStorage."""
+    if isinstance(fsm_storage, BoundedMapStorage):
+        for k, rec in list(fsm_storage.map.items()):
+            yield int(k.split(":")[0]), rec["data"]
+        return
+    # <prefix>:<chat_id>:<user_id>:data — см. DefaultKeyBuilder; значения пачкой через MGET
+    sep = fsm_storage.key_builder.separator
+    head = fsm_storage.key_builder.prefix + sep
+    names = [name async for name in redis.scan_iter(match=head + "*" + sep + "data", count=1000)]
+    for i in range(0, len(names), 1000):
+        batch = names[i:i + 1000]
+        for name, raw in zip(batch, await redis.mget(batch)):
+            if raw:
+                yield int(name.decode()[len(head):].split(sep)[0]), fsm_storage.json_loads(raw)
+
+timers.on("sla", sla_ping)
+timers.on("wizard", expire_wizard)
+timers.on("reply", expire_admin_reply)
 
 # =======================
 #   ENTRY POINT
@@ -541,9 +1494,59 @@ async def main():
         raise RuntimeError("Не задан SUPPORT_GROUP_ID в Variables.")
 
     await load_tickets()
-    log.info(f"✅ Bot starting… tickets loaded: {len(ticket_db)}")
+    log.info(f"✅ Bot starting… tickets loaded: {await store.count()} ({store.name})")
+    await users.load()
+    if not await users.count():
+        # первый запуск с реестром — собираем пользователей из уже накопленных заявок
+        async for rows in store.iter_rows(chunk=5000):
+            await users.add_many(r["user_chat_id"] for _, r in rows if r.get("user_chat_id"))
+        log.info(f"Users registry seeded from tickets: {await users.count()}")
+    await resume_broadcast()
+
+    timers.every("sweep", SWEEP_INTERVAL, sweep_tables)
+    # аренда упавшей реплики живёт до lease_ttl — повторяем, пока рассылку кто-то не подхватит
+    timers.every("broadcast-resume", broadcaster.lease_ttl / 2, resume_broadcast)
+    timers.every("compact", TICKETS_COMPACT_INTERVAL, store.compact)
+    timers.start()
+    # на большой базе обход заявок занимает время — не держим им старт
+    restoring = asyncio.create_task(restore_timers())
+
+    loop_lag.start()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            if not WEBHOOK_URL:
+                raise RuntimeError("Не задан WEBHOOK_URL в Variables.")
+            await run_webhook(
+                bot,
+                dp,
+                WEBHOOK_URL,
+                path=WEBHOOK_PATH,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                secret=WEBHOOK_SECRET,
+                concurrency=WEBHOOK_CONCURRENCY,
+            )
+        else:
+            # вебхук и getUpdates несовместимы — снимаем, если остался после webhook-режима
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if slow_profiler is not None:
+            slow_profiler.close()
+        await loop_lag.close()
+        restoring.cancel()
+        await timers.close()
+        await broadcaster.close()
+        await sender.close()
+        await store.close()
+        await users.close()
+        await fsm_storage.close()
+        for table in (forward_map, awaiting_admin_reply, claims, albums):
+            table.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import asyncio
+import bisect
+import logging
+import threading
+import collections
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+log = logging.getLogger("vsrap-bot.metrics")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels(tuple) -> [counts по бакетам..., sum, count]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        s = self._series.get(key)
+        if s is None:
+            s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            s[i] += 1
+        s[-2] += value
+        s[-1] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, s in self._series.items():
+            labels = dict(key)
+            acc = 0
+            for le, n in zip(self.buckets, s):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels({**labels, 'le': le})} {acc}")
+            out.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {s[-1]}")
+            out.append(f"{self.name}_sum{_labels(labels)} {s[-2]}")
+            out.append(f"{self.name}_count{_labels(labels)} {s[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self, prefix: str = "vsrap"):
+        self.prefix = prefix
+        self.histograms: dict[str, Histogram] = {}
+        # name -> (help, имя метки, callable -> число или {метка: число}, тип)
+        self.gauges: dict[str, tuple[str, str, Callable[[], Any], str]] = {}
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        name = f"{self.prefix}_{name}"
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram(name, help, buckets)
+        return h
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Any], label: str = "name", kind: str = "gauge"):
+        """fn возвращает число или dict {значение метки: число}; может быть корутиной."""
+        self.gauges[f"{self.prefix}_{name}"] = (help, label, fn, kind)
+
+    @contextmanager
+    def timer(self, name: str, help: str = "", **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, help).observe(time.perf_counter() - t0, **labels)
+
+    async def render(self) -> str:
+        lines: list[str] = []
+        for h in self.histograms.values():
+            lines.extend(h.render())
+        for name, (help, label, fn, kind) in self.gauges.items():
+            try:
+                value = fn()
+                if asyncio.iscoroutine(value):
+                    value = await value
+            except Exception as e:
+                log.warning(f"Gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    lines.append(f"{name}{_labels({label: k})} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# =======================
+#   HOOKS
+# =======================
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время хендлера с меткой handler (и stage, если её даёт корутина stage_of)."""
+
+    def __init__(self, stage_of: Callable[[str, TelegramObject, dict[str, Any]], Awaitable[str | None]] | None = None):
+        self.stage_of = stage_of
+        self.hist = registry.histogram("handler_seconds", "Время обработки апдейта хендлером")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        h = data.get("handler")
+        name = getattr(getattr(h, "callback", None), "__name__", "unknown")
+        # стадию нужно снять до вызова — хендлер её меняет
+        stage = await self.stage_of(name, event, data) if self.stage_of else None
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            labels = {"handler": name}
+            if stage:
+                labels["stage"] = stage
+            self.hist.observe(time.perf_counter() - t0, **labels)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время каждого вызова Bot API по методу (без ожидания в очереди отправки)."""
+
+    def __init__(self):
+        self.hist = registry.histogram("api_seconds", "Время вызова Bot API")
+
+    async def __call__(self, make_request, bot, method):
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            self.hist.observe(time.perf_counter() - t0, method=type(method).__name__, status=status)
+
+
+class LoopLagMonitor:
+    """Насколько позже запланированного просыпается цикл событий."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.hist = registry.histogram("loop_lag_seconds", "Запаздывание event loop")
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - t0 - self.interval)
+            self.hist.observe(self.last)
+
+
+# =======================
+#   SLOW UPDATE PROFILER
+# =======================
+
+class SlowUpdateProfiler(BaseMiddleware):
+    """Сэмплирующий профайлер: фоновый поток снимает стек главного потока каждые interval секунд,
+    а для апдейтов дольше threshold сэмплы за время их обработки пишутся в collapsed-формате
+    (flamegraph.pl / speedscope). Цикл событий общий, поэтому в дамп попадает всё,
+    что крутилось в цикле за это время, а не только сам апдейт.
+    """
+
+    def __init__(self, threshold: float, out_dir: str, interval: float = 0.005, keep: float = 60.0):
+        self.threshold = threshold
+        self.out_dir = out_dir
+        self.interval = interval
+        self._samples: collections.deque = collections.deque(maxlen=int(keep / interval))
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self.dumps = 0
+        os.makedirs(out_dir, exist_ok=True)
+        threading.Thread(target=self._sample, name="slow-update-profiler", daemon=True).start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            t1 = time.perf_counter()
+            if t1 - t0 >= self.threshold:
+                self._dump(getattr(event, "update_id", 0), t0, t1)
+
+    def _dump(self, update_id: int, t0: float, t1: float):
+        stacks = collections.Counter(s for ts, s in list(self._samples) if t0 <= ts <= t1 and s)
+        path = os.path.join(self.out_dir, f"update-{update_id}-{int((t1 - t0) * 1000)}ms.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, n in stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+        except Exception as e:
+            log.warning(f"Failed to write profile {path}: {e}")
+            return
+        self.dumps += 1
+        log.info(f"Slow update {update_id}: {(t1 - t0) * 1000:.0f} ms, profile -> {path}")
+
+    def close(self):
+        self._stop.set()
+
+
+# =======================
+#   HTTP
+# =======================
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=await registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f"Metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,290 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bounded import BoundedMap
+from sender import TokenBucket
+from shared import KV
+
+log = logging.getLogger("vsrap-bot.middlewares")
+
+
+class _UserQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class PerUserOrderMiddleware(BaseMiddleware):
+    """Апдейты одного пользователя обрабатываются строго по очереди, разных — параллельно.
+
+    Ставится как outer-middleware на dp.update. asyncio.Lock отдаёт блокировку
+    в порядке ожидания, а задачи на апдейты стартуют в порядке поступления,
+    поэтому порядок внутри пользователя сохраняется. Очередь пользователя
+    удаляется, как только в ней не остаётся апдейтов.
+
+    locks — общая таблица реплик: поверх локальной очереди берётся ещё и её
+    lock("user:<id>"), чтобы одного пользователя не обрабатывали две реплики сразу.
+    """
+
+    def __init__(self, locks: KV | None = None):
+        self.locks = locks
+        self._queues: dict[int, _UserQueue] = {}
+        self.waiting = 0
+        self.max_depth = 0
+        self.processed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        q = self._queues.get(user.id)
+        if q is None:
+            q = self._queues[user.id] = _UserQueue()
+        q.pending += 1
+        self.max_depth = max(self.max_depth, q.pending)
+        self.waiting += 1
+        acquired = False
+        try:
+            async with q.lock:
+                acquired = True
+                self.waiting -= 1
+                if self.locks is None:
+                    return await handler(event, data)
+                async with self.locks.lock(f"user:{user.id}"):
+                    return await handler(event, data)
+        finally:
+            if not acquired:
+                self.waiting -= 1
+            self.processed += 1
+            q.pending -= 1
+            if q.pending == 0:
+                self._queues.pop(user.id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "active_users": len(self._queues),
+            "waiting": self.waiting,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+        }
+
+
+def parse_limit(spec: str) -> tuple[float, float]:
+    """"N/S" -> (скорость в секунду, размер всплеска): не больше N событий за S секунд."""
+    n, _, per = spec.partition("/")
+    n = float(n)
+    return n / float(per or 1), n
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Токен-бакет на пару (пользователь, действие); лишние апдейты не доходят до хендлеров.
+
+    classify(event, data) — корутина, возвращает имя действия или None, если событие не ограничиваем.
+    На первое отброшенное событие пользователь получает одно предупреждение,
+    дальше до конца паузы — тишина.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        classify: Callable[[TelegramObject, dict[str, Any]], Awaitable[str | None]],
+        notice: str,
+        maxsize: int = 100_000,
+    ):
+        self.limits = limits
+        self.classify = classify
+        self.notice = notice
+        self._buckets = BoundedMap("throttle", maxsize, ttl=3600)
+        self._notified = BoundedMap("throttle_notified", maxsize)
+        self.shed: dict[str, int] = {action: 0 for action in limits}
+        self.passed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        action = await self.classify(event, data) if user is not None else None
+        limit = self.limits.get(action)
+        if limit is None:
+            return await handler(event, data)
+
+        key = (user.id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*limit)
+        wait = bucket.delay(time.monotonic())
+        if wait <= 0:
+            bucket.take()
+            self.passed += 1
+            return await handler(event, data)
+
+        self.shed[action] = self.shed.get(action, 0) + 1
+        first = key not in self._notified
+        if first:
+            self._notified.set(key, True, ttl=max(wait, 1 / limit[0]))
+        try:
+            if isinstance(event, CallbackQuery):
+                # ответ на колбэк ничего не стоит и убирает «часики» у кнопки
+                await event.answer(self.notice if first else None)
+            elif first and isinstance(event, Message):
+                await event.answer(self.notice)
+        except Exception as e:
+            log.warning(f"Failed to send throttle notice to {user.id}: {e}")
+        return None
+
+    def stats(self) -> dict[str, int]:
+        return {"passed": self.passed, **{f"shed_{a}": n for a, n in self.shed.items()}}
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """Каждый update_id обрабатывается один раз на все реплики (SET NX в общей таблице).
+
+    Telegram повторяет доставку вебхука, если ответ не пришёл вовремя, и повтор
+    может попасть на другую реплику.
+    """
+
+    def __init__(self, kv: KV, ttl: float = 24 * 3600):
+        self.kv = kv
+        self.ttl = ttl
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not await self.kv.set(f"update:{event.update_id}", True, ttl=self.ttl, nx=True):
+            self.duplicates += 1
+            log.info(f"Skip duplicate update {event.update_id}")
+            return None
+        return await handler(event, data)
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Собирает части альбома (media_group_id) в личке в один вызов хендлера.
+
+    Ставится outer-middleware на dp.update — до PerUserOrderMiddleware, иначе части
+    одного пользователя ждали бы в его очереди, пока первая ждёт остальные.
+    Каждая часть дописывается в список kv["album:<id>"]; та, что создала список, —
+    ведущая: ждёт, пока debounce секунд не придёт новых частей (но не дольше max_wait),
+    и идёт дальше с data["album"] = описания частей по message_id. Остальные части
+    на этом заканчиваются. Через Redis альбом собирается, даже если части пришли
+    на разные реплики; брошенные списки истекают по ttl.
+
+    Собранный альбом оставляет метку kv["album-done:<id>"] на done_ttl: часть, пришедшая
+    после сборки (медленная загрузка, видео дольше debounce), отбрасывается, а не
+    начинает новый альбом посреди следующего шага мастера.
+    """
+
+    def __init__(
+        self,
+        kv: KV,
+        describe: Callable[[Message], dict | None],
+        debounce: float = 0.7,
+        max_wait: float = 5.0,
+        max_parts: int = 10,
+        ttl: float = 60.0,
+        done_ttl: float = 3600.0,
+    ):
+        self.kv = kv
+        self.describe = describe
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.max_parts = max_parts
+        self.ttl = ttl
+        self.done_ttl = done_ttl
+        self.albums = 0
+        self.parts = 0
+        self.dropped = 0
+        self.late = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        msg = getattr(event, "message", None)
+        if msg is None or not msg.media_group_id or msg.chat.type != "private":
+            return await handler(event, data)
+
+        key = f"album:{msg.chat.id}:{msg.media_group_id}"
+        done = f"album-done:{msg.chat.id}:{msg.media_group_id}"
+        part = {**(self.describe(msg) or {}), "message_id": msg.message_id}
+        if msg.caption:
+            part["caption"] = msg.caption
+        self.parts += 1
+        if await self.kv.append(key, part, ttl=self.ttl) > 1:
+            return None
+        # метка ставится до удаления списка — опоздавшая часть, создавшая список заново, её видит
+        if await self.kv.get(done) is not None:
+            await self.kv.delete(key)
+            self.late += 1
+            log.info(f"Drop late part {msg.message_id} of album {msg.media_group_id} from {msg.chat.id}")
+            return None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        seen = 1
+        while True:
+            await asyncio.sleep(max(min(self.debounce, deadline - loop.time()), 0))
+            n = len(await self.kv.items(key))
+            if n == seen or loop.time() >= deadline:
+                break
+            seen = n
+        parts = await self.kv.items(key)
+        await self.kv.set(done, True, ttl=self.done_ttl)
+        await self.kv.delete(key)
+
+        # повторная доставка той же части (ретрай вебхука) — по message_id
+        album = sorted({p["message_id"]: p for p in parts}.values(), key=lambda p: p["message_id"])
+        if len(album) > self.max_parts:
+            self.dropped += len(album) - self.max_parts
+            album = album[:self.max_parts]
+        self.albums += 1
+        data["album"] = album
+        return await handler(event, data)
+
+    def stats(self) -> dict[str, int]:
+        return {"albums": self.albums, "parts": self.parts, "dropped": self.dropped, "late": self.late}
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Пишет входящие апдейты в JSONL — для повторного прогона через bench/loadtest.py --replay."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "a", encoding="utf-8")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            self._fh.write(event.model_dump_json(exclude_none=True, by_alias=True) + "\n")
+            self._fh.flush()
+        except Exception as e:
+            log.warning(f"Failed to record update to {self.path}: {e}")
+        return await handler(event, data)
+
+    def close(self):
+        self._fh.close()
@@ -0,0 +1,226 @@
+import io
+import sys
+import csv
+import bisect
+import logging
+from datetime import datetime
+from typing import IO, Iterable
+
+from links import canonical_video
+from tariffs import MONTHLY_MIN_VIDEOS, MONTHLY_TIERS, PLATFORM_OF_LINK, VIDEO_TIERS
+
+log = logging.getLogger("vsrap-bot.payouts")
+
+# колонки входной таблицы: views и date обязательны, platform/account можно не заполнять, если есть link
+INPUT_COLUMNS = ("ticket", "account", "platform", "link", "views", "date", "exclusive")
+SHEET_COLUMNS = ("kind", "account", "platform", "month", "ticket", "views", "amount_rub", "note")
+
+_PLATFORM_ALIASES = {
+    "tiktok": "tiktok", "tt": "tiktok",
+    "youtube": "youtube", "youtube shorts": "youtube", "shorts": "youtube", "yt": "youtube",
+}
+_FALSE = {"0", "no", "false", "нет", "-"}
+
+# пороги как отсортированные списки — тариф ищется bisect'ом, а не перебором
+_VIDEO_INDEX = {
+    p: ([t for t, _ in tiers], [a for _, a in tiers]) for p, (_, _, tiers) in VIDEO_TIERS.items()
+}
+_MONTHLY_THRESHOLDS = [t for t, _ in MONTHLY_TIERS]
+_MONTHLY_AMOUNTS = [a for _, a in MONTHLY_TIERS]
+
+
+def _tier(thresholds: list[int], amounts: list[int], views: int) -> int:
+    i = bisect.bisect_right(thresholds, views)
+    return amounts[i - 1] if i else 0
+
+
+def video_payout(platform: str, views: int) -> int:
+    thresholds, amounts = _VIDEO_INDEX.get(platform, _VIDEO_INDEX["other"])
+    return _tier(thresholds, amounts, views)
+
+
+def monthly_bonus(videos: int, views: int) -> int:
+    if videos < MONTHLY_MIN_VIDEOS:
+        return 0
+    return _tier(_MONTHLY_THRESHOLDS, _MONTHLY_AMOUNTS, views)
+
+
+# =======================
+#   INPUT
+# =======================
+
+def _month(raw: str) -> str:
+    raw = raw.strip()
+    # быстрый путь для ГГГГ-ММ-... и ДД.ММ.ГГГГ — strptime на каждой строке заметно дороже
+    if len(raw) >= 7 and raw[4] == "-" and raw[:4].isdigit() and raw[5:7].isdigit() and "01" <= raw[5:7] <= "12":
+        return raw[:7]
+    if len(raw) == 10 and raw[2] == raw[5] == "." and raw[6:].isdigit() and "01" <= raw[3:5] <= "12":
+        return f"{raw[6:]}-{raw[3:5]}"
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m"):
+        try:
+            return datetime.strptime(raw[:10], fmt).strftime("%Y-%m")
+        except ValueError:
+            continue
+    # ISO с временем и зоной — как created_at заявок
+    return datetime.fromisoformat(raw).strftime("%Y-%m")
+
+
+def _platform_account(row: dict) -> tuple[str, str]:
+    platform = _PLATFORM_ALIASES.get((row.get("platform") or "").strip().lower(), "")
+    account = (row.get("account") or "").strip().lower().lstrip("@")
+    link = (row.get("link") or "").strip()
+    if link and not platform:
+        key = canonical_video(link) or ""
+        platform = PLATFORM_OF_LINK.get(key.split(":", 1)[0], "other")
+    # у TikTok аккаунт прямо в ссылке: tiktok.com/@user/video/...
+    if link and not account and "/@" in link:
+        account = link.split("/@", 1)[1].split("/", 1)[0].lower()
+    return platform or "other", account
+
+
+def read_submissions(fh: Iterable[str]) -> tuple[list[dict], list[str]]:
+    """CSV (или TSV) с заголовком -> нормализованные заявки и ошибки по строкам."""
+    lines = iter(fh)
+    head = next(lines, "")
+    dialect = "excel-tab" if "\t" in head else "excel"
+    reader = csv.DictReader([head, *lines] if head else [], dialect=dialect)
+    if reader.fieldnames:
+        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+        if "views" not in reader.fieldnames:
+            return [], ["нет колонки views"]
+
+    subs, errors, seen = [], [], set()
+    for lineno, row in enumerate(reader, 2):
+        try:
+            views = int(str(row.get("views") or "0").replace(" ", "").replace("\u00a0", "").replace(",", ""))
+            month = _month(row.get("date") or "")
+        except ValueError:
+            errors.append(f"строка {lineno}: не разобрать views/date")
+            continue
+        ticket = (row.get("ticket") or "").strip().lstrip("#")
+        if ticket and ticket in seen:
+            errors.append(f"строка {lineno}: заявка #{ticket} уже была выше")
+            continue
+        seen.add(ticket)
+        platform, account = _platform_account(row)
+        subs.append({
+            "ticket": ticket,
+            "account": account,
+            "platform": platform,
+            "views": views,
+            "month": month,
+            "exclusive": (row.get("exclusive") or "").strip().lower() not in _FALSE,
+        })
+    return subs, errors
+
+
+# =======================
+#   ENGINE
+# =======================
+
+def compute(subs: list[dict]) -> tuple[list[dict], dict]:
+    """Строки ведомости (по ролику + месячные бонусы аккаунтов) и итоги.
+
+    Один проход: выплата за ролик — bisect по порогам площадки, параллельно копятся
+    суммы по (аккаунт, площадка, месяц); затем бонус на каждую группу.
+    """
+    rows: list[dict] = []
+    groups: dict[tuple[str, str, str], list] = {}
+    video_rub = 0
+    for s in subs:
+        amount = video_payout(s["platform"], s["views"])
+        video_rub += amount
+        rows.append({
+            "kind": "video",
+            "account": s["account"],
+            "platform": s["platform"],
+            "month": s["month"],
+            "ticket": s["ticket"],
+            "views": s["views"],
+            "amount_rub": amount,
+            "note": "" if amount else "ниже порога",
+        })
+        if s["account"]:
+            g = groups.get((s["account"], s["platform"], s["month"]))
+            if g is None:
+                g = groups[(s["account"], s["platform"], s["month"])] = [0, 0, True]
+            g[0] += 1
+            g[1] += s["views"]
+            g[2] = g[2] and s["exclusive"]
+
+    bonus_rub = 0
+    bonus_accounts = 0
+    for (account, platform, month), (videos, views, exclusive) in groups.items():
+        amount = monthly_bonus(videos, views) if exclusive else 0
+        if amount:
+            note = f"{videos} роликов за месяц"
+            bonus_accounts += 1
+        elif not exclusive:
+            note = "аккаунт не только с VSRAP"
+        elif videos < MONTHLY_MIN_VIDEOS:
+            note = f"меньше {MONTHLY_MIN_VIDEOS} роликов"
+        else:
+            note = "ниже порога"
+        bonus_rub += amount
+        rows.append({
+            "kind": "bonus",
+            "account": account,
+            "platform": platform,
+            "month": month,
+            "ticket": "",
+            "views": views,
+            "amount_rub": amount,
+            "note": note,
+        })
+
+    totals = {
+        "videos": len(subs),
+        "accounts": len(groups),
+        "bonus_accounts": bonus_accounts,
+        "video_rub": video_rub,
+        "bonus_rub": bonus_rub,
+        "total_rub": video_rub + bonus_rub,
+    }
+    return rows, totals
+
+
+def write_sheet(rows: list[dict], fh: IO[str]) -> None:
+    w = csv.DictWriter(fh, fieldnames=SHEET_COLUMNS)
+    w.writeheader()
+    w.writerows(rows)
+
+
+def payout_sheet(text: str) -> tuple[str, dict, list[str]]:
+    """Текст входного CSV -> (CSV ведомости, итоги, ошибки разбора)."""
+    subs, errors = read_submissions(io.StringIO(text))
+    rows, totals = compute(subs)
+    out = io.StringIO()
+    write_sheet(rows, out)
+    return out.getvalue(), totals, errors
+
+
+# =======================
+#   CLI
+# =======================
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Ведомость выплат по таблице заявок с просмотрами")
+    ap.add_argument("src", help=f"CSV/TSV с колонками {', '.join(INPUT_COLUMNS)}")
+    ap.add_argument("-o", "--out", help="куда записать ведомость (по умолчанию stdout)")
+    args = ap.parse_args()
+
+    with open(args.src, "r", encoding="utf-8-sig", newline="") as f:
+        subs, errors = read_submissions(f)
+    rows, totals = compute(subs)
+    for e in errors:
+        log.warning(e)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_sheet(rows, f)
+    else:
+        write_sheet(rows, sys.stdout)
+    log.info(json.dumps(totals, ensure_ascii=False))
@@ -0,0 +1,159 @@
+"""Маршрутизация апдейтов без лишней работы на каждый апдейт.
+
+aiogram вызывает синхронные фильтры (F-выражения, lambda) через пул потоков — это
+переход в поток и обратно на каждую проверку каждого хендлера. Поэтому здесь фильтры —
+корутины, а callback_data разбирается один раз: голова («menu:rates», «admin:reply»)
+ищется в таблице, строка распаковывается своей фабрикой CallbackData, хендлеры
+сравнивают только имя маршрута.
+"""
+import re
+import html
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Filter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message, TelegramObject
+
+log = logging.getLogger("vsrap-bot.routing")
+
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def callback_head(data: str) -> str:
+    """Первые два поля callback_data: по ним выбирается маршрут."""
+    i = data.find(":", data.find(":") + 1)
+    return data if i < 0 else data[:i]
+
+
+class CallbackRouter(BaseMiddleware):
+    """Outer-middleware на dp.callback_query: разбор callback_data по таблице маршрутов.
+
+    Маршрут — голова callback_data и фабрика CallbackData, которой распаковывается вся
+    строка. Хендлеру уходят data["route"] и типизированный data["callback_data"];
+    фильтр хендлера — route(...). На незнакомую или битую кнопку (старые посты,
+    ручные запросы) сразу отвечаем и дальше не пускаем.
+    """
+
+    def __init__(self, stale_notice: str):
+        self.stale_notice = stale_notice
+        self.table: dict[str, type[CallbackData]] = {}
+        self.stale = 0
+
+    def route(self, factory: type[CallbackData], *heads: str) -> "Route":
+        for head in heads:
+            if head in self.table:
+                raise ValueError(f"Callback route {head!r} is already registered")
+            self.table[head] = factory
+        return Route(heads)
+
+    def parse(self, data: str | None) -> tuple[str, CallbackData] | None:
+        if not data:
+            return None
+        head = callback_head(data)
+        factory = self.table.get(head)
+        if factory is None:
+            return None
+        try:
+            return head, factory.unpack(data)
+        except (TypeError, ValueError):
+            return None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        parsed = self.parse(event.data)
+        if parsed is None:
+            self.stale += 1
+            log.info(f"Unroutable callback data {event.data!r} from {event.from_user.id}")
+            await event.answer(self.stale_notice, show_alert=True)
+            return None
+        data["route"], data["callback_data"] = parsed
+        return await handler(event, data)
+
+
+class Route(Filter):
+    """Фильтр хендлера колбэков: маршрут, уже найденный CallbackRouter."""
+
+    def __init__(self, heads: tuple[str, ...]):
+        self.heads = frozenset(heads)
+
+    async def __call__(self, cq: CallbackQuery, route: str | None = None) -> bool:
+        return route in self.heads
+
+
+class PrivateChat(Filter):
+    """Личка с ботом; bots=False — ещё и не от бота."""
+
+    def __init__(self, bots: bool = True):
+        self.bots = bots
+
+    async def __call__(self, msg: Message) -> bool:
+        return msg.chat.type == "private" and (self.bots or not msg.from_user.is_bot)
+
+
+class ChatId(Filter):
+    """Конкретный чат; chat_id=None (чат не настроен) не пропускает ничего."""
+
+    def __init__(self, chat_id: int | None):
+        self.chat_id = chat_id
+
+    async def __call__(self, msg: Message) -> bool:
+        return self.chat_id is not None and msg.chat.id == self.chat_id
+
+
+def plain_text(text: str) -> str:
+    """Текст HTML-сообщения, каким его вернёт Telegram: без тегов и сущностей, без краевых пробелов."""
+    return html.unescape(TAG_RE.sub("", text)).strip()
+
+
+def markup_key(kb: InlineKeyboardMarkup | None) -> tuple:
+    """Что видно в клавиатуре: текст и действие кнопок.
+
+    Сравнивать сами модели нельзя — у пришедших в апдейте привязан bot, и pydantic
+    считает их не равными собранным здесь.
+    """
+    if kb is None:
+        return ()
+    return tuple(tuple((b.text, b.callback_data, b.url) for b in row) for row in kb.inline_keyboard)
+
+
+class Screen:
+    """Текст и клавиатура сообщения; экраны меню собираются так один раз при старте.
+
+    plain — тот же текст без разметки: по нему и клавиатуре видно, что сообщение уже
+    показывает этот экран.
+    """
+
+    __slots__ = ("text", "kb", "plain", "buttons")
+
+    def __init__(self, text: str, kb: InlineKeyboardMarkup | None = None):
+        self.text = text
+        self.kb = kb
+        self.plain = plain_text(text)
+        self.buttons = markup_key(kb)
+
+    def shown_in(self, msg: Message) -> bool:
+        return msg.text == self.plain and markup_key(msg.reply_markup) == self.buttons
+
+
+async def edit_screen(msg: Message, screen: Screen, **kwargs) -> bool:
+    """Показать экран в сообщении; False — он уже там, запрос к API не нужен.
+
+    Сравнение по тексту не ловит всё (например, сообщение успели поправить с другого
+    устройства), поэтому ответ Telegram «message is not modified» тоже считается успехом.
+    """
+    if screen.shown_in(msg):
+        return False
+    try:
+        await msg.edit_text(screen.text, reply_markup=screen.kb, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+        return False
+    return True
@@ -0,0 +1,256 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from typing import Any, Awaitable, Callable
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import AnswerCallbackQuery, GetUpdates
+
+from bounded import BoundedMap
+
+log = logging.getLogger("vsrap-bot.sender")
+
+# меньше — раньше
+PRIORITY_USER = 0
+PRIORITY_GROUP = 10
+PRIORITY_BULK = 20
+
+# выставляется в задаче, которая выполняет вызов из очереди, — чтобы middleware не ставил его второй раз
+_in_scheduler: contextvars.ContextVar[bool] = contextvars.ContextVar("_in_scheduler", default=False)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # до этого момента чат заблокирован после RetryAfter
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("chat_id", "priority", "call", "future", "on_done", "attempts", "enqueued")
+
+    def __init__(self, chat_id, priority, call, future, on_done):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.call = call
+        self.future = future
+        self.on_done = on_done
+        self.attempts = 0
+        self.enqueued = time.monotonic()
+
+
+class SendScheduler:
+    """Единая очередь исходящих вызовов Bot API.
+
+    Общий бюджет на бота, отдельный на каждый чат (группы — 20/мин),
+    приоритеты и повторы с учётом RetryAfter.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        max_inflight: int = 16,
+        max_retries: int = 5,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats = BoundedMap("send_buckets", 100_000, ttl=3600)
+        self._ready: list[tuple[int, int, _Job]] = []
+        self._delayed: list[tuple[float, int, _Job]] = []
+        self._seq = itertools.count()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+        self.inflight = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if chat_id < 0:
+                b = TokenBucket(self.group_rate, 3)
+            else:
+                b = TokenBucket(self.chat_rate, 3)
+            self._chats[chat_id] = b
+        return b
+
+    # ---------- API ----------
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(
+        self,
+        chat_id: int,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_USER,
+        on_done: Callable[[Any], Awaitable[None] | None] | None = None,
+    ) -> asyncio.Future:
+        """Ставит вызов в очередь; call — фабрика корутины (вызывается заново на повторе)."""
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self._push(_Job(chat_id, priority, call, fut, on_done))
+        return fut
+
+    async def call(self, chat_id: int, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_USER):
+        return await self.submit(chat_id, call, priority)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queued": len(self._ready) + len(self._delayed),
+            "ready": len(self._ready),
+            "delayed": len(self._delayed),
+            "inflight": self.inflight,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "wait_avg_s": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max_s": self.wait_max,
+        }
+
+    # ---------- internals ----------
+
+    def _push(self, job: _Job, not_before: float = 0.0):
+        if not_before > time.monotonic():
+            heapq.heappush(self._delayed, (not_before, next(self._seq), job))
+        else:
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, job = heapq.heappop(self._ready)
+            bucket = self._bucket(job.chat_id)
+            wait = bucket.delay(now)
+            if wait > 0:
+                heapq.heappush(self._delayed, (now + wait, next(self._seq), job))
+                continue
+
+            wait = self.global_bucket.delay(now)
+            if wait > 0:
+                heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+                await asyncio.sleep(wait)
+                continue
+
+            bucket.take()
+            self.global_bucket.take()
+            await self._inflight.acquire()
+            asyncio.create_task(self._execute(job, bucket))
+
+    async def _execute(self, job: _Job, bucket: TokenBucket):
+        _in_scheduler.set(True)
+        self.inflight += 1
+        try:
+            job.attempts += 1
+            try:
+                result = await job.call()
+            except TelegramRetryAfter as e:
+                bucket.blocked_until = time.monotonic() + e.retry_after
+                self._retry(job, e.retry_after, e)
+                return
+            except (TelegramNetworkError, TelegramServerError) as e:
+                self._retry(job, min(2 ** job.attempts, 60), e)
+                return
+            except Exception as e:
+                self._fail(job, e)
+                return
+
+            waited = time.monotonic() - job.enqueued
+            self.sent += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if not job.future.done():
+                job.future.set_result(result)
+            if job.on_done is not None:
+                try:
+                    res = job.on_done(result)
+                    if asyncio.iscoroutine(res):
+                        await res
+                except Exception as e:
+                    log.error(f"Send callback for chat {job.chat_id} failed: {e}")
+        finally:
+            self.inflight -= 1
+            self._inflight.release()
+
+    def _retry(self, job: _Job, delay: float, err: Exception):
+        if job.attempts > self.max_retries:
+            self._fail(job, err)
+            return
+        self.retries += 1
+        log.warning(f"Send to {job.chat_id} failed ({err}), retry {job.attempts} in {delay:.1f}s")
+        self._push(job, time.monotonic() + delay)
+
+    def _fail(self, job: _Job, err: Exception):
+        self.failed += 1
+        log.error(f"Send to {job.chat_id} failed: {err}")
+        if not job.future.done():
+            job.future.set_exception(err)
+            # future могут и не ждать (submit с on_done) — помечаем исключение как полученное
+            job.future.exception()
+
+
+class SchedulerMiddleware(BaseRequestMiddleware):
+    """Пропускает все отправки бота через SendScheduler."""
+
+    # не относятся к лимитам на сообщения в чат
+    BYPASS = (GetUpdates, AnswerCallbackQuery)
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(method, self.BYPASS) or not isinstance(chat_id, int) or _in_scheduler.get():
+            return await make_request(bot, method)
+        priority = PRIORITY_GROUP if chat_id < 0 else PRIORITY_USER
+        return await self.scheduler.call(chat_id, lambda: make_request(bot, method), priority)
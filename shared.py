@@ -0,0 +1,244 @@
+import json
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from bounded import BoundedMap
+
+log = logging.getLogger("vsrap-bot.shared")
+
+
+def connect_redis(url: str):
+    # redis нужен только для режима с несколькими репликами
+    import redis.asyncio as redis
+
+    return redis.Redis.from_url(url)
+
+
+# =======================
+#   KEY-VALUE TABLES
+# =======================
+
+class KV:
+    """Таблица ключ-значение, общая для реплик (Redis) или локальная (BoundedMap)."""
+
+    async def get(self, key) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key, value, ttl: float | None = None, nx: bool = False) -> bool:
+        """nx=True — записать, только если ключа ещё нет; возвращает, была ли запись."""
+        raise NotImplementedError
+
+    async def delete(self, key) -> None:
+        raise NotImplementedError
+
+    async def pop(self, key) -> Any:
+        value = await self.get(key)
+        if value is not None:
+            await self.delete(key)
+        return value
+
+    async def release(self, key, owner) -> bool:
+        """Удалить key, только если в нём всё ещё owner (аренда не перешла к другому)."""
+        if await self.get(key) != owner:
+            return False
+        await self.delete(key)
+        return True
+
+    async def append(self, key, value, ttl: float | None = None) -> int:
+        """Дописать в список под key; возвращает его новую длину (1 — список только что создан)."""
+        raise NotImplementedError
+
+    async def items(self, key) -> list:
+        raise NotImplementedError
+
+    def scan(self) -> AsyncIterator[tuple[Any, Any]]:
+        """Все записи таблицы (key, value); у Redis key — строка без префикса."""
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, key, ttl: float = 30.0) -> AsyncIterator[None]:
+        yield
+
+    def close(self):
+        pass
+
+
+class MapKV(KV):
+    # в одном процессе пользователя и так сериализует PerUserOrderMiddleware — lock() пустой
+
+    def __init__(self, table: BoundedMap):
+        self.map = table
+
+    async def get(self, key) -> Any:
+        return self.map.get(key)
+
+    async def set(self, key, value, ttl: float | None = None, nx: bool = False) -> bool:
+        if nx and key in self.map:
+            return False
+        if ttl is None:
+            self.map[key] = value
+        else:
+            self.map.set(key, value, ttl=ttl)
+        return True
+
+    async def delete(self, key) -> None:
+        self.map.pop(key, None)
+
+    async def append(self, key, value, ttl: float | None = None) -> int:
+        # новый список, а не append на месте — чтобы запись ушла и в лог BoundedMap
+        items = [*(self.map.get(key) or ()), value]
+        await self.set(key, items, ttl)
+        return len(items)
+
+    async def items(self, key) -> list:
+        return list(self.map.get(key) or ())
+
+    async def scan(self) -> AsyncIterator[tuple[Any, Any]]:
+        for key, value in list(self.map.items()):
+            yield key, value
+
+    def close(self):
+        self.map.close()
+
+
+class RedisKV(KV):
+    """Значения хранятся как JSON; TTL — через EX/PX самого Redis."""
+
+    def __init__(self, redis, prefix: str, ttl: float | None = None):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}{key}"
+
+    async def get(self, key) -> Any:
+        raw = await self.redis.get(self._key(key))
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value, ttl: float | None = None, nx: bool = False) -> bool:
+        ttl = self.ttl if ttl is None else ttl
+        px = int(ttl * 1000) if ttl else None
+        return bool(await self.redis.set(self._key(key), json.dumps(value, ensure_ascii=False), px=px, nx=nx))
+
+    async def delete(self, key) -> None:
+        await self.redis.delete(self._key(key))
+
+    async def release(self, key, owner) -> bool:
+        # как у lock(): сравнение и DEL под WATCH/MULTI — между ними ключ не перехватят
+        name = self._key(key)
+        token = json.dumps(owner, ensure_ascii=False).encode()
+        released = False
+
+        async def release(pipe):
+            nonlocal released
+            released = (await pipe.get(name)) == token
+            if released:
+                pipe.multi()
+                pipe.delete(name)
+
+        await self.redis.transaction(release, name)
+        return released
+
+    async def append(self, key, value, ttl: float | None = None) -> int:
+        ttl = self.ttl if ttl is None else ttl
+        name = self._key(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(name, json.dumps(value, ensure_ascii=False))
+            if ttl:
+                pipe.pexpire(name, int(ttl * 1000))
+            res = await pipe.execute()
+        return res[0]
+
+    async def items(self, key) -> list:
+        return [json.loads(r) for r in await self.redis.lrange(self._key(key), 0, -1)]
+
+    async def scan(self) -> AsyncIterator[tuple[Any, Any]]:
+        # SCAN по префиксу пачками, значения — одним MGET на пачку; истёкшие между ними пропускаем
+        names = []
+        async for name in self.redis.scan_iter(match=self.prefix + "*", count=1000):
+            names.append(name)
+            if len(names) == 1000:
+                async for item in self._scan_batch(names):
+                    yield item
+                names = []
+        async for item in self._scan_batch(names):
+            yield item
+
+    async def _scan_batch(self, names: list[bytes]) -> AsyncIterator[tuple[Any, Any]]:
+        if not names:
+            return
+        for name, raw in zip(names, await self.redis.mget(names)):
+            if raw is not None:
+                yield name.decode()[len(self.prefix):], json.loads(raw)
+
+    @asynccontextmanager
+    async def lock(self, key, ttl: float = 30.0) -> AsyncIterator[None]:
+        # SET NX PX с токеном; снимаем через WATCH/MULTI, только если лок всё ещё наш
+        name = self._key(f"lock:{key}")
+        token = uuid.uuid4().hex
+        delay = 0.002
+        while not await self.redis.set(name, token, px=int(ttl * 1000), nx=True):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            async def release(pipe):
+                if (await pipe.get(name)) == token.encode():
+                    pipe.multi()
+                    pipe.delete(name)
+
+            try:
+                await self.redis.transaction(release, name)
+            except Exception as e:
+                log.warning(f"Failed to release {name}: {e}")
+
+
+# =======================
+#   FSM STORAGE
+# =======================
+
+class BoundedMapStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх BoundedMap: LRU, TTL и запись на диск в одном процессе."""
+
+    def __init__(self, table: BoundedMap):
+        self.map = table
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.chat_id}:{key.user_id}"
+
+    async def set_state(self, key: StorageKey, state: str | State | None = None) -> None:
+        k = self._key(key)
+        rec = self.map.get(k) or {"state": None, "data": {}}
+        rec = {**rec, "state": state.state if isinstance(state, State) else state}
+        self._put(k, rec)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        rec = self.map.get(self._key(key))
+        return rec["state"] if rec else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        k = self._key(key)
+        rec = self.map.get(k) or {"state": None, "data": {}}
+        self._put(k, {**rec, "data": dict(data)})
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        rec = self.map.get(self._key(key))
+        return dict(rec["data"]) if rec else {}
+
+    def _put(self, k: str, rec: dict):
+        if rec["state"] is None and not rec["data"]:
+            self.map.pop(k, None)
+        else:
+            self.map[k] = rec
+
+    async def close(self) -> None:
+        self.map.close()
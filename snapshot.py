@@ -0,0 +1,507 @@
+import os
+import json
+import mmap
+import bisect
+import hashlib
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from storage import STATUSES, dedup_keys
+
+# =======================
+#   FORMAT
+# =======================
+# Колоночный снапшот заявок: файл отображается в память (mmap) и читается как есть —
+# на старте разбирается только заголовок, строка собирается в dict при обращении.
+#
+#   [0:8]    MAGIC
+#   [8:16]   длина заголовка
+#   [16:…]   заголовок JSON: {"rows": n, "garbage": байт, "sections": {имя: [смещение, байт, typecode]}}
+#   [4096:…] секции, каждая выровнена на 8 байт
+#
+# Строки лежат в порядке добавления и своих номеров не меняют: компакция копирует колонки
+# старого снапшота целиком, правит изменённые строки на месте и дописывает новые в конец.
+# Поля из FIELDS — колонки: int — int64, ts — ISO-время UTC как микросекунды от эпохи,
+# code — индекс в CODES (int8), str — номер в общей таблице строк (int32; имена
+# пользователей повторяются из заявки в заявку). Остальное — компактный JSON строки в
+# blob extra (extra_at/extra_len); изменённый JSON дописывается в конец, старый становится
+# мусором (garbage) до переупаковки. Индексы — массивы номеров строк, отсортированные по
+# ключу: by_ticket — по номеру заявки, by_user — (user_id, created_at), queue:<статус> —
+# очередь модерации, key_hash/key_row — хэши ключей повтора. Заявки с нечисловым номером —
+# JSON в секции rest.
+
+MAGIC = b"VSRCOL02"
+HEADER_SPACE = 4096
+NULL = -(2**63)
+# значение есть, но не из CODES — лежит в extra
+OTHER = 127
+
+FIELDS = (
+    ("user_chat_id", "int"),
+    ("user_id", "int"),
+    ("username", "str"),
+    ("full_name", "str"),
+    ("created_at", "ts"),
+    ("kind", "code"),
+    ("status", "code"),
+    ("status_at", "ts"),
+    ("status_by", "int"),
+    ("group_message_id", "int"),
+    ("sla_at", "int"),
+    ("sla_pings", "int"),
+    ("answered_at", "ts"),
+)
+_FIELD_NAMES = frozenset(name for name, _ in FIELDS)
+_TYPECODES = {"int": "q", "ts": "q", "code": "b", "str": "i"}
+_NONE = {"int": NULL, "ts": NULL, "code": -1, "str": -1}
+
+KINDS = ("payout", "contact")
+CODES = {"kind": KINDS, "status": STATUSES}
+_CONTACT = KINDS.index("contact")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+
+def iso_from_us(us: int) -> str:
+    return (EPOCH + timedelta(microseconds=us)).isoformat()
+
+
+def us_from_iso(value) -> int | None:
+    """ISO-время UTC -> микросекунды, только если обратное преобразование даст ту же строку."""
+    if type(value) is not str:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.utcoffset() != timedelta(0):
+        return None
+    us = (dt - EPOCH) // _US
+    return us if iso_from_us(us) == value else None
+
+
+def since_us(value: str | None) -> int:
+    """Граница фильтра (since/until) или нестандартное время в микросекундах; без пояса — UTC."""
+    if not value:
+        return NULL
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return NULL
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // _US
+
+
+def ticket_id(ticket: str) -> int | None:
+    """Номер заявки как int64, если строка его однозначно задаёт."""
+    if not ticket.isdigit():
+        return None
+    n = int(ticket)
+    return n if n < 2**63 and str(n) == ticket else None
+
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def _queue_code(kind: int, status: int) -> int:
+    # см. storage.queue_status: обращения в очередь не попадают, без статуса — new
+    if kind == _CONTACT or status == OTHER:
+        return -1
+    return 0 if status < 0 else status
+
+
+# =======================
+#   READER
+# =======================
+
+class Snapshot:
+    """Снапшот, отображённый в память: колонки и индексы — memoryview поверх mmap, без копирования."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError(f"{path}: not a ticket snapshot")
+        size = int.from_bytes(buf[8:16], "little")
+        head = json.loads(bytes(buf[16:16 + size]))
+        self.n: int = head["rows"]
+        self.garbage: int = head["garbage"]
+        self._raw = {name: buf[off:off + size] for name, (off, size, _) in head["sections"].items()}
+        self._col = {name: self._raw[name].cast(tc) for name, (_, _, tc) in head["sections"].items()}
+        self.tickets = self._col["ticket"]
+        self._created = self._col["created_at"]
+        self._user_id = self._col["user_id"]
+        self._fields = [(name, kind, self._col[name]) for name, kind in FIELDS]
+        self._extra = self._raw["extra"]
+        self._extra_at = self._col["extra_at"]
+        self._extra_len = self._col["extra_len"]
+        self._str_off = self._col["str_off"]
+        self._strs = self._raw["strs"]
+        # строки таблицы декодируются по первому обращению и дальше переиспользуются
+        self._strings: dict[int, str] = {}
+
+    # ---------- rows ----------
+
+    def find(self, ticket: str) -> int:
+        """Номер строки заявки или -1."""
+        t = ticket_id(ticket)
+        if t is None:
+            return -1
+        rows = self._col["by_ticket"]
+        j = bisect.bisect_left(rows, t, key=self.tickets.__getitem__)
+        return rows[j] if j < len(rows) and self.tickets[rows[j]] == t else -1
+
+    def ticket(self, i: int) -> str:
+        return str(self.tickets[i])
+
+    def string(self, idx: int) -> str:
+        s = self._strings.get(idx)
+        if s is None:
+            s = self._strings[idx] = bytes(self._strs[self._str_off[idx]:self._str_off[idx + 1]]).decode()
+        return s
+
+    def extra(self, i: int) -> bytes:
+        at = self._extra_at[i]
+        return bytes(self._extra[at:at + self._extra_len[i]])
+
+    def row(self, i: int) -> dict:
+        row = {}
+        for name, kind, col in self._fields:
+            v = col[i]
+            if kind == "int":
+                if v != NULL:
+                    row[name] = v
+            elif kind == "ts":
+                if v != NULL:
+                    row[name] = iso_from_us(v)
+            elif kind == "str":
+                if v >= 0:
+                    row[name] = self.string(v)
+            elif 0 <= v < OTHER:
+                row[name] = CODES[name][v]
+        if self._extra_len[i]:
+            row.update(json.loads(self.extra(i)))
+        return row
+
+    def created(self, i: int) -> int:
+        """created_at в микросекундах (NULL — нет)."""
+        return self._created[i]
+
+    def created_between(self, i: int, since: int, until: int | None) -> bool:
+        # время не из колонки (нестандартная строка в extra) — решает фильтр по самой строке
+        c = self._created[i]
+        return c == NULL or (c >= since and (until is None or c < until))
+
+    def rest(self) -> dict[str, dict]:
+        raw = self._raw.get("rest")
+        return json.loads(bytes(raw)) if raw else {}
+
+    # ---------- indexes ----------
+
+    def user_rows(self, user_id: int) -> list[int]:
+        """Строки пользователя в порядке создания."""
+        rows = self._col["by_user"]
+        lo = bisect.bisect_left(rows, user_id, key=self._user_id.__getitem__)
+        hi = bisect.bisect_right(rows, user_id, lo=lo, key=self._user_id.__getitem__)
+        return rows[lo:hi].tolist()
+
+    def queue(self, status: str, since: str | None = None) -> memoryview:
+        """Строки очереди status от старых к новым, созданные не раньше since."""
+        q = self._col.get(f"queue:{status}")
+        if q is None:
+            return self._col["by_ticket"][0:0]
+        if since:
+            q = q[bisect.bisect_left(q, since_us(since), key=self._created.__getitem__):]
+        return q
+
+    def in_queue(self, i: int, status: str, since: str | None = None) -> bool:
+        code = _queue_code(self._col["kind"][i], self._col["status"][i])
+        return (
+            code >= 0 and STATUSES[code] == status
+            and (not since or self._created[i] >= since_us(since))
+        )
+
+    def key_rows(self, key: str) -> list[int]:
+        """Строки с этим хэшем ключа повтора, от ранних к поздним (хэш может совпасть — проверять)."""
+        hashes, rows = self._col["key_hash"], self._col["key_row"]
+        h = key_hash(key)
+        lo = bisect.bisect_left(hashes, h)
+        hi = bisect.bisect_right(hashes, h, lo=lo)
+        return rows[lo:hi].tolist()
+
+    # ---------- for the writer ----------
+
+    def strings(self) -> list[str]:
+        return [self.string(i) for i in range(len(self._str_off) - 1)]
+
+
+# =======================
+#   WRITER
+# =======================
+
+def _encode(name: str, kind: str, value, extra: dict, strings: list[str], string_ids: dict[str, int]) -> int:
+    if value is None:
+        return _NONE[kind]
+    if kind == "int":
+        if type(value) is int and NULL < value < 2**63:
+            return value
+    elif kind == "ts":
+        us = us_from_iso(value)
+        if us is not None:
+            return us
+        if type(value) is str:
+            # нестандартная запись времени: строка — в extra, в колонке — то же время для индексов
+            extra[name] = value
+            return since_us(value)
+    elif kind == "code":
+        codes = CODES[name]
+        if value in codes:
+            return codes.index(value)
+        extra[name] = value
+        return OTHER
+    elif type(value) is str:
+        idx = string_ids.get(value)
+        if idx is None:
+            idx = string_ids[value] = len(strings)
+            strings.append(value)
+        return idx
+    # не влезает в колонку — храним как есть
+    extra[name] = value
+    return _NONE[kind]
+
+
+def _splice(old: list[memoryview], drops: list[int], adds: list[tuple[int, tuple]]) -> list[array]:
+    """Копия отсортированного индекса (одна или несколько параллельных колонок) без позиций
+    drops и со вставками adds [(позиция в old, значения)]; между правками — срезы целиком."""
+    out = [array(m.format) for m in old]
+    # на одной позиции вставка идёт перед удалением старого элемента; adds уже по порядку ключа
+    events = sorted([(p, 0, vals) for p, vals in adds] + [(p, 1, ()) for p in drops], key=lambda e: e[:2])
+    prev = 0
+    for p, drop, vals in events:
+        if p > prev:
+            for a, m in zip(out, old):
+                a.frombytes(m[prev:p].cast("B"))
+        prev = max(prev, p + drop)
+        for a, v in zip(out, vals):
+            a.append(v)
+    for a, m in zip(out, old):
+        a.frombytes(m[prev:].cast("B"))
+    return out
+
+
+def _put(f, sections: dict, name: str, data, typecode: str):
+    f.write(bytes(-f.tell() % 8))
+    start = f.tell()
+    f.write(data)
+    sections[name] = [start, f.tell() - start, typecode]
+
+
+def write_snapshot(path: str, base: Snapshot | None, delta: dict[str, dict]) -> int:
+    """Записать снапшот: base с заявками из delta поверх — изменённые строки правятся на
+    месте, новые дописываются в конец.
+
+    Колонки и индексы base копируются срезами, в Python разбираются только строки delta,
+    так что компакция — копирование файла плюс O(len(delta) · log n). Пишется во временный
+    файл и атомарно подменяет path. Возвращает число заявок.
+    """
+    if base is not None and not base.n:
+        base = None
+    strings = base.strings() if base is not None else []
+    string_ids: dict[str, int] = {}
+    for i, s in enumerate(strings):
+        string_ids.setdefault(s, i)
+    n_strings = len(strings)
+
+    tickets = array("q")
+    cols = {name: array(_TYPECODES[kind]) for name, kind in FIELDS}
+    extra_at, extra_len = array("q"), array("i")
+    blob_size = garbage = 0
+    if base is not None:
+        tickets.frombytes(base._raw["ticket"])
+        for name, _ in FIELDS:
+            cols[name].frombytes(base._raw[name])
+        extra_at.frombytes(base._raw["extra_at"])
+        extra_len.frombytes(base._raw["extra_len"])
+        blob_size, garbage = len(base._extra), base.garbage
+    tail_start, tail = blob_size, []
+
+    patched: list[tuple[int, dict]] = []  # (строка, прежняя версия)
+    added: list[int] = []
+    rest: dict[str, dict] = {}
+    for t, row in delta.items():
+        tid = ticket_id(t)
+        if tid is None:
+            rest[t] = row
+            continue
+        extra = {}
+        vals = [_encode(name, kind, row.get(name), extra, strings, string_ids) for name, kind in FIELDS]
+        extra.update((k, v) for k, v in row.items() if k not in _FIELD_NAMES)
+        blob = json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode() if extra else b""
+        i = base.find(t) if base is not None else -1
+        if i >= 0:
+            patched.append((i, base.row(i)))
+            for (name, _), v in zip(FIELDS, vals):
+                cols[name][i] = v
+            if blob == base.extra(i):
+                continue
+            garbage += extra_len[i]
+            extra_at[i], extra_len[i] = blob_size, len(blob)
+        else:
+            i = len(tickets)
+            tickets.append(tid)
+            for (name, _), v in zip(FIELDS, vals):
+                cols[name].append(v)
+            extra_at.append(blob_size)
+            extra_len.append(len(blob))
+            added.append(i)
+        tail.append(blob)
+        blob_size += len(blob)
+    n = len(tickets)
+
+    # позиции в индексах base ищутся по ключам до правок (o_*), вставляемые строки — по новым
+    created, users, kinds, statuses = (cols[c] for c in ("created_at", "user_id", "kind", "status"))
+    if base is not None:
+        o_created, o_users, o_kinds, o_statuses = (base._col[c] for c in ("created_at", "user_id", "kind", "status"))
+
+    def tstr(i: int) -> str:
+        return str(tickets[i])
+
+    def by_keys(rows, *keys) -> list:
+        # устойчивые проходы от младшего ключа — без кортежа на строку (при импорте их миллион)
+        rows = list(rows)
+        for key in reversed(keys):
+            rows.sort(key=key)
+        return rows
+
+    def splice(name: str, drops: list[int], rows: list[int], okey, nkey) -> array:
+        """Индекс name из base без позиций drops и со строками rows (уже по порядку ключа)."""
+        if base is None:
+            return array("i", rows)
+        index = base._col[name]
+        [out] = _splice([index], drops, [(bisect.bisect_left(index, nkey(i), key=okey), (i,)) for i in rows])
+        return out
+
+    moved = {i for i, _ in patched if created[i] != o_created[i]}
+    indexes: dict[str, array] = {}
+
+    ticket = tickets.__getitem__
+    indexes["by_ticket"] = splice("by_ticket", [], by_keys(added, ticket), ticket, ticket)
+
+    okey = lambda i: (o_users[i], o_created[i], tstr(i))  # noqa: E731
+    relocated = [i for i, _ in patched if i in moved or users[i] != o_users[i]]
+    indexes["by_user"] = splice(
+        "by_user",
+        [bisect.bisect_left(base._col["by_user"], okey(i), key=okey) for i in relocated],
+        by_keys(added + relocated, users.__getitem__, created.__getitem__, tstr),
+        okey, lambda i: (users[i], created[i], tstr(i)),
+    )
+
+    # очередь — по (created_at, ticket строкой), как у json
+    okey = lambda i: (o_created[i], tstr(i))  # noqa: E731
+    order = by_keys(added, created.__getitem__, tstr)
+    for s, status in enumerate(STATUSES):
+        drops, rows = [], []
+        for i, _ in patched:
+            was = _queue_code(o_kinds[i], o_statuses[i]) == s
+            now = _queue_code(kinds[i], statuses[i]) == s
+            if was and (not now or i in moved):
+                drops.append(bisect.bisect_left(base._col[f"queue:{status}"], okey(i), key=okey))
+            if now and (not was or i in moved):
+                rows.append(i)
+        fresh = [i for i in order if _queue_code(kinds[i], statuses[i]) == s]
+        rows = by_keys(rows + fresh, created.__getitem__, tstr) if rows else fresh
+        indexes[f"queue:{status}"] = splice(
+            f"queue:{status}", drops, rows, okey, lambda i: (created[i], tstr(i))
+        )
+
+    # ключи повтора только добавляются: исчезнувший из заявки ключ отсеет проверка в find_key
+    new_hashes, new_rows = [], []
+    for i, prev in [(i, None) for i in added] + patched:
+        had = set(dedup_keys(prev)) if prev is not None else ()
+        for k in dedup_keys(delta[tstr(i)]):
+            if k not in had:
+                new_hashes.append(key_hash(k))
+                new_rows.append(i)
+    korder = by_keys(
+        range(len(new_hashes)),
+        new_hashes.__getitem__, lambda j: created[new_rows[j]], lambda j: tstr(new_rows[j]),
+    )
+    if base is None:
+        indexes["key_hash"] = array("q", (new_hashes[j] for j in korder))
+        indexes["key_row"] = array("i", (new_rows[j] for j in korder))
+    else:
+        hashes, key_rows = base._col["key_hash"], base._col["key_row"]
+        okey = lambda j: (hashes[j], o_created[key_rows[j]], tstr(key_rows[j]))  # noqa: E731
+        positions = range(len(hashes))
+        indexes["key_hash"], indexes["key_row"] = _splice([hashes, key_rows], [], [
+            (
+                bisect.bisect_left(positions, (new_hashes[j], created[new_rows[j]], tstr(new_rows[j])), key=okey),
+                (new_hashes[j], new_rows[j]),
+            )
+            for j in korder
+        ])
+
+    str_off = array("q", base._col["str_off"]) if base is not None else array("q", [0])
+    encoded = [s.encode() for s in strings[n_strings:]]
+    total = str_off[-1]
+    for b in encoded:
+        total += len(b)
+        str_off.append(total)
+
+    # мусора больше половины — переупаковываем extra заново, по порядку строк
+    repack = garbage > 1 << 20 and garbage * 2 > blob_size
+    chunks: dict[int, bytes] = {}
+    at = tail_start
+    for b in tail:
+        if b:
+            chunks[at] = b
+        at += len(b)
+
+    tmp = path + ".tmp"
+    sections: dict[str, list] = {}
+    with open(tmp, "wb") as f:
+        f.write(bytes(HEADER_SPACE))
+        start = f.tell()
+        if repack:
+            size = 0
+            for i in range(n):
+                at, ln = extra_at[i], extra_len[i]
+                if ln:
+                    f.write(base._extra[at:at + ln] if at < tail_start else chunks[at])
+                extra_at[i] = size
+                size += ln
+            garbage = 0
+        else:
+            if base is not None:
+                f.write(base._extra)
+            for b in tail:
+                f.write(b)
+        sections["extra"] = [start, f.tell() - start, "B"]
+        _put(f, sections, "extra_at", extra_at, "q")
+        _put(f, sections, "extra_len", extra_len, "i")
+        _put(f, sections, "ticket", tickets, "q")
+        for name, kind in FIELDS:
+            _put(f, sections, name, cols[name], _TYPECODES[kind])
+        _put(f, sections, "strs", base._strs if base is not None else b"", "B")
+        for b in encoded:
+            f.write(b)
+        sections["strs"][1] += total - str_off[n_strings]
+        _put(f, sections, "str_off", str_off, "q")
+        for name, a in indexes.items():
+            _put(f, sections, name, a, a.typecode)
+        if rest:
+            _put(f, sections, "rest", json.dumps(rest, ensure_ascii=False).encode(), "B")
+        head = json.dumps({"rows": n, "garbage": garbage, "sections": sections}).encode()
+        if 16 + len(head) > HEADER_SPACE:
+            raise ValueError(f"snapshot header too large: {len(head)} bytes")
+        f.seek(0)
+        f.write(MAGIC + len(head).to_bytes(8, "little") + head)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return n + len(rest)
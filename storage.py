@@ -0,0 +1,1185 @@
+import os
+import json
+import heapq
+import bisect
+import asyncio
+import itertools
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable
+
+log = logging.getLogger("vsrap-bot.storage")
+
+# жизненный цикл заявки на выплату
+STATUSES = ("new", "review", "paid", "rejected")
+
+
+# поля заявки с ключами для поиска повторов (ссылка на ролик, файл пруфа)
+DEDUP_FIELDS = ("link_key", "proof_key", "proof_keys")
+
+
+def dedup_keys(row: dict) -> list[str]:
+    # proof_keys — список: по ключу на каждый файл альбома
+    keys: dict[str, None] = {}
+    for f in DEDUP_FIELDS:
+        value = row.get(f)
+        for key in value if isinstance(value, list) else [value]:
+            if key:
+                keys[key] = None
+    return list(keys)
+
+
+def queue_status(row: dict) -> str | None:
+    """Статус заявки в очереди модерации; обращения (kind=contact) в очередь не попадают."""
+    if row.get("kind") == "contact":
+        return None
+    return row.get("status") or "new"
+
+
+def row_matches(
+    row: dict,
+    since: str | None = None,
+    until: str | None = None,
+    user_id: int | None = None,
+    status: str | None = None,
+) -> bool:
+    """Фильтр выгрузки: since <= created_at < until, пользователь, статус в очереди."""
+    created = row.get("created_at") or ""
+    if since and created < since:
+        return False
+    if until and created >= until:
+        return False
+    if user_id is not None and row.get("user_id") != user_id:
+        return False
+    return status is None or queue_status(row) == status
+
+
+def _write_snapshot(path: str, data: dict) -> None:
+    # пишем во временный файл и атомарно подменяем, чтобы не остаться с обрезанным снапшотом
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _reserve_file(path: str, n: int) -> int:
+    # счётчик в отдельном файле под flock — общий для всех процессов на этом диске
+    import fcntl
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        raw = os.read(fd, 64).strip()
+        start = int(raw) if raw else 0
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(start + n).encode())
+        os.fsync(fd)
+        return start
+    finally:
+        os.close(fd)
+
+
+def _replay(path: str, data: dict[str, dict]) -> int:
+    applied = 0
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return 0
+    with f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                data[str(rec["t"])] = rec["r"]
+                applied += 1
+            except Exception:
+                # оборванная последняя запись после падения — пропускаем
+                log.warning(f"Skipping broken journal record {path}:{lineno}")
+    return applied
+
+
+class TicketJournal:
+    """Снапшот + append-only журнал тикетов с групповым fsync."""
+
+    def __init__(
+        self,
+        path: str,
+        source: Callable[[], dict[str, dict]],
+        compact_every: int = 5000,
+        compact_interval: float | None = 600.0,
+    ):
+        self.snapshot_path = path
+        self.journal_path = path + ".journal"
+        self.rotated_path = path + ".journal.old"
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        # откуда брать актуальное состояние для компакции
+        self._source = source
+
+        self._pending: list[tuple[str, dict, asyncio.Future]] = []
+        self._fh = None
+        self._since_compact = 0
+        self._wakeup: asyncio.Event | None = None
+        self._compact_due: asyncio.Event | None = None
+        self._io_lock: asyncio.Lock | None = None
+        self._compact_lock: asyncio.Lock | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    # ---------- startup ----------
+
+    def _read_snapshot(self) -> dict[str, dict]:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+                return snap if isinstance(snap, dict) else {}
+        except FileNotFoundError:
+            return {}
+
+    def load(self) -> dict[str, dict]:
+        data = self._read_snapshot()
+        # .old остаётся, если компакция не успела дописать снапшот
+        replayed = _replay(self.rotated_path, data) + _replay(self.journal_path, data)
+        self._since_compact = replayed
+        if replayed:
+            log.info(f"Replayed {replayed} journal records on top of {self.snapshot_path}")
+        return data
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._compact_due = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._compact_lock = asyncio.Lock()
+        self._fh = open(self.journal_path, "a", encoding="utf-8")
+        self._tasks = [
+            asyncio.create_task(self._writer()),
+            asyncio.create_task(self._compactor()),
+        ]
+        if self._since_compact >= self.compact_every:
+            self._compact_due.set()
+
+    async def close(self):
+        if self._pending:
+            await self._flush(self._take_batch())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    # ---------- writes ----------
+
+    async def append(self, ticket: str, row: dict):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((ticket, row, fut))
+        self._wakeup.set()
+        await fut
+
+    def _take_batch(self) -> list[tuple[str, dict, asyncio.Future]]:
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _write_batch(self, payload: str):
+        self._fh.write(payload)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    async def _flush(self, batch: list[tuple[str, dict, asyncio.Future]]):
+        payload = "".join(
+            json.dumps({"t": t, "r": r}, ensure_ascii=False) + "\n"
+            for t, r, _ in batch
+        )
+        async with self._io_lock:
+            try:
+                await asyncio.to_thread(self._write_batch, payload)
+            except Exception as e:
+                log.error(f"Failed to append {len(batch)} records to {self.journal_path}: {e}")
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+        for _, _, fut in batch:
+            if not fut.done():
+                fut.set_result(None)
+        self._since_compact += len(batch)
+        if self._since_compact >= self.compact_every:
+            self._compact_due.set()
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # всё, что накопилось пока писали прошлую пачку, уходит одним fsync
+            batch = self._take_batch()
+            if batch:
+                await self._flush(batch)
+
+    # ---------- compaction ----------
+
+    def _rotate(self):
+        self._fh.close()
+        if os.path.exists(self.rotated_path):
+            # прошлая компакция не завершилась — дописываем хвост к старому журналу
+            with open(self.journal_path, "r", encoding="utf-8") as src, \
+                    open(self.rotated_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        elif os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.rotated_path)
+        self._fh = open(self.journal_path, "a", encoding="utf-8")
+
+    def _save_snapshot(self, data: dict[str, dict]) -> None:
+        # вызывается в потоке
+        _write_snapshot(self.snapshot_path, data)
+
+    def _compacted(self, data: dict[str, dict]) -> None:
+        """Снапшот с data записан (в цикле событий, после _save_snapshot)."""
+        pass
+
+    async def compact(self):
+        # по числу записей и по таймеру компакция может запроситься одновременно
+        async with self._compact_lock:
+            async with self._io_lock:
+                await asyncio.to_thread(self._rotate)
+                # строки в хранилище не меняются на месте, upsert кладёт новый dict — хватает
+                # копии внешнего словаря (C-копия ссылок, без обхода строк в цикле событий)
+                data = dict(self._source())
+                self._since_compact = 0
+            try:
+                await asyncio.to_thread(self._save_snapshot, data)
+                os.remove(self.rotated_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log.error(f"Failed to compact {self.snapshot_path}: {e}")
+                return
+            self._compacted(data)
+            log.info(f"Compacted {len(data)} tickets into {self.snapshot_path}")
+
+    async def _compactor(self):
+        # compact_interval=None — по времени компакцию запускает кто-то снаружи (compact())
+        while True:
+            try:
+                await asyncio.wait_for(self._compact_due.wait(), timeout=self.compact_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._compact_due.clear()
+            if self._since_compact:
+                await self.compact()
+
+
+# =======================
+#   BACKENDS
+# =======================
+
+class TicketStore:
+    """Интерфейс хранилища заявок: ticket(str) -> dict с полями пользователя.
+
+    Отданные get/by_user/... строки не меняют на месте: правка — новый dict через upsert
+    (на этом держатся компакция журнала и снимки для выгрузки).
+    """
+
+    name = "base"
+
+    async def load(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def save(self) -> None:
+        pass
+
+    async def compact(self) -> None:
+        """Периодическое обслуживание: свернуть журнал в снапшот, сбросить WAL и т.п."""
+        pass
+
+    async def get(self, ticket: str) -> dict | None:
+        raise NotImplementedError
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        raise NotImplementedError
+
+    async def exists(self, ticket: str) -> bool:
+        return await self.get(ticket) is not None
+
+    async def by_user(self, user_id: int) -> list[tuple[str, dict]]:
+        raise NotImplementedError
+
+    async def user_ticket(self, user_id: int, ticket: str) -> dict | None:
+        """Заявка, если она принадлежит user_id, иначе None."""
+        row = await self.get(ticket)
+        return row if row and row.get("user_id") == user_id else None
+
+    async def by_status(
+        self, status: str, since: str | None = None, offset: int = 0, limit: int = 10
+    ) -> list[tuple[str, dict]]:
+        """Страница очереди: заявки со статусом status, созданные не раньше since, от старых к новым."""
+        raise NotImplementedError
+
+    async def count_status(self, status: str, since: str | None = None) -> int:
+        raise NotImplementedError
+
+    async def find_key(self, key: str) -> str | None:
+        """Первая заявка с этим ключом повтора (см. DEDUP_FIELDS) или None."""
+        raise NotImplementedError
+
+    def iter_rows(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        user_id: int | None = None,
+        status: str | None = None,
+        chunk: int = 1000,
+    ) -> AsyncIterator[list[tuple[str, dict]]]:
+        """Заявки под фильтром (см. row_matches) пачками по chunk — без загрузки всей базы."""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def reserve_ids(self, n: int) -> int:
+        """Атомарно резервирует n порядковых номеров заявок, возвращает первый."""
+        raise NotImplementedError
+
+
+class JsonTicketStore(TicketStore):
+    """Весь набор в памяти, файл переписывается целиком на каждую запись.
+
+    users — индекс user_id -> номера заявок в порядке создания, queues — статус ->
+    отсортированный список (created_at, ticket), keys — ключ повтора -> первая заявка.
+    Все строятся при load и обновляются в upsert, чтобы by_user, user_ticket, by_status
+    и find_key не перебирали все заявки.
+    """
+
+    name = "json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows: dict[str, dict] = {}
+        self.users: dict[int, dict[str, None]] = {}
+        self.queues: dict[str, list[tuple[str, str]]] = {s: [] for s in STATUSES}
+        self.keys: dict[str, str] = {}
+        self._lock = asyncio.Lock()
+
+    def _reindex(self):
+        self.users = {}
+        self.queues = {s: [] for s in STATUSES}
+        self.keys = {}
+        for t, r in self.rows.items():
+            self._index_user(t, r, None)
+            for k in dedup_keys(r):
+                self.keys.setdefault(k, t)
+            status = queue_status(r)
+            if status is not None:
+                self.queues.setdefault(status, []).append((r.get("created_at") or "", t))
+        for q in self.queues.values():
+            q.sort()
+
+    def _index(self, ticket: str, row: dict, old: dict | None = None):
+        self._index_user(ticket, row, old)
+        for k in dedup_keys(row):
+            self.keys.setdefault(k, ticket)
+        old_status = queue_status(old) if old is not None else None
+        status = queue_status(row)
+        old_key = (old.get("created_at") or "", ticket) if old is not None else None
+        key = (row.get("created_at") or "", ticket)
+        if old_status == status and old_key == key:
+            return
+        if old_status is not None:
+            q = self.queues[old_status]
+            i = bisect.bisect_left(q, old_key)
+            if i < len(q) and q[i] == old_key:
+                del q[i]
+        if status is not None:
+            # новые заявки приходят с растущим created_at — обычно это append в конец
+            bisect.insort(self.queues.setdefault(status, []), key)
+
+    def _index_user(self, ticket: str, row: dict, old: dict | None):
+        if old is not None and old.get("user_id") != row.get("user_id"):
+            self.users.get(old.get("user_id"), {}).pop(ticket, None)
+        if row.get("user_id") is not None:
+            self.users.setdefault(row["user_id"], {})[ticket] = None
+
+    async def load(self) -> None:
+        async with self._lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                    self.rows = data if isinstance(data, dict) else {}
+            except FileNotFoundError:
+                self.rows = {}
+            except Exception as e:
+                log.error(f"Failed to load {self.path}: {e}")
+                self.rows = {}
+            self._reindex()
+
+    async def save(self) -> None:
+        async with self._lock:
+            try:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(self.rows, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                log.error(f"Failed to save {self.path}: {e}")
+
+    async def get(self, ticket: str) -> dict | None:
+        return self.rows.get(ticket)
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        self._index(ticket, row, self.rows.get(ticket))
+        self.rows[ticket] = row
+        await self.save()
+
+    async def exists(self, ticket: str) -> bool:
+        return ticket in self.rows
+
+    async def by_user(self, user_id: int) -> list[tuple[str, dict]]:
+        return [(t, self.rows[t]) for t in self.users.get(user_id, ())]
+
+    async def user_ticket(self, user_id: int, ticket: str) -> dict | None:
+        return self.rows.get(ticket) if ticket in self.users.get(user_id, ()) else None
+
+    def _queue_from(self, status: str, since: str | None) -> tuple[list[tuple[str, str]], int]:
+        q = self.queues.get(status, [])
+        return q, bisect.bisect_left(q, (since, "")) if since else 0
+
+    async def by_status(
+        self, status: str, since: str | None = None, offset: int = 0, limit: int = 10
+    ) -> list[tuple[str, dict]]:
+        q, start = self._queue_from(status, since)
+        return [(t, self.rows[t]) for _, t in q[start + offset:start + offset + limit]]
+
+    async def count_status(self, status: str, since: str | None = None) -> int:
+        q, start = self._queue_from(status, since)
+        return len(q) - start
+
+    async def find_key(self, key: str) -> str | None:
+        return self.keys.get(key)
+
+    async def iter_rows(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        user_id: int | None = None,
+        status: str | None = None,
+        chunk: int = 1000,
+    ) -> AsyncIterator[list[tuple[str, dict]]]:
+        # строки и так в памяти; копируем только список номеров (rows меняется между пачками),
+        # а для пользователя/статуса берём готовые индексы
+        if user_id is not None:
+            tickets = list(self.users.get(user_id, ()))
+        elif status is not None:
+            q, start = self._queue_from(status, since)
+            tickets = [t for _, t in q[start:]]
+        else:
+            tickets = list(self.rows)
+        for i in range(0, len(tickets), chunk):
+            batch = []
+            for t in tickets[i:i + chunk]:
+                row = self.rows.get(t)
+                if row is not None and row_matches(row, since, until, user_id, status):
+                    batch.append((t, row))
+            if batch:
+                yield batch
+            # отдаём цикл событий между пачками
+            await asyncio.sleep(0)
+
+    async def count(self) -> int:
+        return len(self.rows)
+
+    async def reserve_ids(self, n: int) -> int:
+        return await asyncio.to_thread(_reserve_file, self.path + ".seq", n)
+
+
+class JournalTicketStore(JsonTicketStore):
+    """Как json, но запись — одна строка в журнал, полный файл только при компакции."""
+
+    name = "journal"
+
+    def __init__(self, path: str, compact_every: int = 5000, compact_interval: float | None = 600.0):
+        super().__init__(path)
+        self.journal = TicketJournal(
+            path,
+            source=lambda: self.rows,
+            compact_every=compact_every,
+            compact_interval=compact_interval,
+        )
+
+    async def load(self) -> None:
+        try:
+            self.rows = await asyncio.to_thread(self.journal.load)
+        except Exception as e:
+            log.error(f"Failed to load {self.path}: {e}")
+            self.rows = {}
+        self._reindex()
+        await self.journal.start()
+
+    async def close(self) -> None:
+        await self.journal.close()
+
+    async def save(self) -> None:
+        await self.journal.compact()
+
+    async def compact(self) -> None:
+        if self.journal._since_compact:
+            await self.journal.compact()
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        self._index(ticket, row, self.rows.get(ticket))
+        self.rows[ticket] = row
+        try:
+            await self.journal.append(ticket, row)
+        except Exception as e:
+            log.error(f"Failed to journal ticket {ticket}: {e}")
+
+
+class ColumnJournal(TicketJournal):
+    """Журнал поверх колоночного снапшота: при компакции изменения вливаются в новый снапшот."""
+
+    def __init__(self, store: "ColumnarTicketStore", **kwargs):
+        super().__init__(store.snapshot_path, source=lambda: store.rows, **kwargs)
+        self.store = store
+
+    def _read_snapshot(self) -> dict[str, dict]:
+        # в памяти из снапшота — только заявки с нечисловыми номерами, остальное читается из mmap
+        return self.store.base.rest()
+
+    def _save_snapshot(self, data: dict[str, dict]) -> None:
+        from snapshot import write_snapshot
+
+        write_snapshot(self.snapshot_path, self.store.base, data)
+
+    def _compacted(self, data: dict[str, dict]) -> None:
+        self.store._rebase(data)
+
+
+class ColumnarTicketStore(JournalTicketStore):
+    """Колоночный снапшот в mmap (см. snapshot.py) + журнал изменений поверх него.
+
+    base — снапшот: на старте читается только заголовок, заявка собирается в dict при
+    обращении, индексы (пользователь, очереди, ключи повтора) лежат в самом файле. rows и
+    индексы JsonTicketStore держат только изменения после снапшота; shadow — какие из них
+    переписывают заявки base (их строки в base устарели). Компакция пишет новый снапшот
+    из base и rows и подменяет base. Первый запуск импортирует tickets.json (и его журнал).
+    """
+
+    name = "columnar"
+
+    def __init__(self, path: str, compact_every: int = 5000, compact_interval: float | None = 600.0):
+        super().__init__(path, compact_every=compact_every, compact_interval=compact_interval)
+        self.snapshot_path = path + ".cols"
+        self.journal = ColumnJournal(self, compact_every=compact_every, compact_interval=compact_interval)
+        self.base = None
+        self.shadow: dict[str, int] = {}
+
+    def _open_base(self):
+        from snapshot import Snapshot, write_snapshot
+
+        if not os.path.exists(self.snapshot_path):
+            data = TicketJournal(self.path, source=dict).load()
+            write_snapshot(self.snapshot_path, None, data)
+            if data:
+                log.info(f"Migrated {len(data)} tickets from {self.path} into {self.snapshot_path}")
+        return Snapshot(self.snapshot_path)
+
+    def _reindex(self):
+        super()._reindex()
+        self.shadow = {}
+        for t in self.rows:
+            i = self.base.find(t)
+            if i >= 0:
+                self.shadow[t] = i
+
+    def _rebase(self, merged: dict[str, dict]):
+        from snapshot import Snapshot, ticket_id
+
+        # старый mmap закроется сам, когда его отпустят пачки iter_rows, начатые до компакции
+        self.base = Snapshot(self.snapshot_path)
+        for t, row in merged.items():
+            if ticket_id(t) is not None and self.rows.get(t) == row:
+                del self.rows[t]
+        self._reindex()
+
+    async def load(self) -> None:
+        self.base = await asyncio.to_thread(self._open_base)
+        await super().load()
+
+    async def get(self, ticket: str) -> dict | None:
+        row = self.rows.get(ticket)
+        if row is not None:
+            return row
+        i = self.base.find(ticket)
+        return self.base.row(i) if i >= 0 else None
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        if ticket not in self.rows:
+            i = self.base.find(ticket)
+            if i >= 0:
+                self.shadow[ticket] = i
+        await super().upsert(ticket, row)
+
+    async def exists(self, ticket: str) -> bool:
+        return ticket in self.rows or self.base.find(ticket) >= 0
+
+    user_ticket = TicketStore.user_ticket
+
+    async def by_user(self, user_id: int) -> list[tuple[str, dict]]:
+        base = self.base
+        out = [(t, self.rows[t]) for t in self.users.get(user_id, ())]
+        for i in base.user_rows(user_id):
+            t = base.ticket(i)
+            if t not in self.rows:
+                out.append((t, base.row(i)))
+        out.sort(key=lambda tr: (tr[1].get("created_at") or "", tr[0]))
+        return out
+
+    def _merged_queue(self, status: str, since: str | None):
+        # (created_at в мкс, ticket, номер строки в base или -1) — base без устаревших и rows вперемешку
+        from snapshot import since_us
+
+        base = self.base
+        q, start = self._queue_from(status, since)
+        old = (
+            (base.created(i), t, i) for i in base.queue(status, since)
+            if (t := base.ticket(i)) not in self.rows
+        )
+        new = ((since_us(created), t, -1) for created, t in q[start:])
+        return heapq.merge(old, new), base
+
+    async def by_status(
+        self, status: str, since: str | None = None, offset: int = 0, limit: int = 10
+    ) -> list[tuple[str, dict]]:
+        merged, base = self._merged_queue(status, since)
+        page = itertools.islice(merged, offset, offset + limit)
+        return [(t, base.row(i) if i >= 0 else self.rows[t]) for _, t, i in page]
+
+    async def count_status(self, status: str, since: str | None = None) -> int:
+        n = len(self.base.queue(status, since))
+        n -= sum(1 for i in self.shadow.values() if self.base.in_queue(i, status, since))
+        return n + await super().count_status(status, since)
+
+    async def find_key(self, key: str) -> str | None:
+        for i in self.base.key_rows(key):
+            t = self.base.ticket(i)
+            if key in dedup_keys(self.rows.get(t) or self.base.row(i)):
+                return t
+        return self.keys.get(key)
+
+    async def iter_rows(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        user_id: int | None = None,
+        status: str | None = None,
+        chunk: int = 1000,
+    ) -> AsyncIterator[list[tuple[str, dict]]]:
+        from snapshot import since_us
+
+        # изменения берём копией на старте, а base — тот, что был на старте: компакция
+        # между пачками не даст ни пропусков, ни повторов
+        base, fresh = self.base, dict(self.rows)
+        batch = [(t, r) for t, r in fresh.items() if row_matches(r, since, until, user_id, status)]
+        for i in range(0, len(batch), chunk):
+            yield batch[i:i + chunk]
+            await asyncio.sleep(0)
+        if user_id is not None:
+            rows = base.user_rows(user_id)
+        elif status is not None:
+            rows = base.queue(status, since)
+        else:
+            rows = range(base.n)
+        lo, hi = since_us(since), since_us(until) if until else None
+        for i in range(0, len(rows), chunk):
+            batch = []
+            for j in rows[i:i + chunk]:
+                # время создания — из колонки, строку собираем только для подходящих
+                if not base.created_between(j, lo, hi):
+                    continue
+                t = base.ticket(j)
+                if t in fresh:
+                    continue
+                row = base.row(j)
+                if row_matches(row, since, until, user_id, status):
+                    batch.append((t, row))
+            if batch:
+                yield batch
+            await asyncio.sleep(0)
+
+    async def count(self) -> int:
+        return self.base.n - len(self.shadow) + len(self.rows)
+
+
+_SQLITE_COLUMNS = ("user_chat_id", "user_id", "username", "full_name", "created_at", "kind", "status")
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket       TEXT PRIMARY KEY,
+    user_chat_id INTEGER,
+    user_id      INTEGER,
+    username     TEXT,
+    full_name    TEXT,
+    created_at   TEXT,
+    extra        TEXT,
+    kind         TEXT,
+    status       TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_tickets_user_id ON tickets(user_id);
+CREATE INDEX IF NOT EXISTS ix_tickets_username ON tickets(username);
+CREATE INDEX IF NOT EXISTS ix_tickets_created_at ON tickets(created_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ticket_keys (
+    key    TEXT PRIMARY KEY,
+    ticket TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# колонки, добавленные после первой версии схемы: (имя, тип, SQL заполнения старых строк)
+_SQLITE_ADDED_COLUMNS = (
+    ("kind", "TEXT", None),
+    ("status", "TEXT", "UPDATE tickets SET status = 'new' WHERE status IS NULL"),
+)
+
+# частичный индекс очереди: обращения в неё не входят (условие повторяется в запросах)
+_SQLITE_QUEUE_WHERE = "kind IS NOT 'contact'"
+_SQLITE_INDEXES = f"""
+CREATE INDEX IF NOT EXISTS ix_tickets_queue ON tickets(status, created_at, ticket) WHERE {_SQLITE_QUEUE_WHERE};
+CREATE INDEX IF NOT EXISTS ix_tickets_created ON tickets(created_at, ticket);
+"""
+
+_SQLITE_UPSERT = (
+    f"INSERT INTO tickets (ticket, {', '.join(_SQLITE_COLUMNS)}, extra) "
+    f"VALUES ({', '.join('?' * (len(_SQLITE_COLUMNS) + 2))}) "
+    "ON CONFLICT(ticket) DO UPDATE SET "
+    + ", ".join(f"{c}=excluded.{c}" for c in (*_SQLITE_COLUMNS, "extra"))
+)
+
+_SQLITE_ADD_KEY = "INSERT OR IGNORE INTO ticket_keys (key, ticket) VALUES (?, ?)"
+
+_SQLITE_SELECT = f"SELECT ticket, {', '.join(_SQLITE_COLUMNS)}, extra FROM tickets"
+
+
+def _sqlite_params(ticket: str, row: dict) -> tuple:
+    extra = {k: v for k, v in row.items() if k not in _SQLITE_COLUMNS}
+    row = {**row, "status": row.get("status") or "new"}
+    return (
+        ticket,
+        *(row.get(c) for c in _SQLITE_COLUMNS),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _sqlite_row(r: tuple) -> tuple[str, dict]:
+    n = len(_SQLITE_COLUMNS)
+    row = {c: v for c, v in zip(_SQLITE_COLUMNS, r[1:n + 1]) if v is not None or c not in ("kind", "status")}
+    if r[n + 1]:
+        row.update(json.loads(r[n + 1]))
+    return r[0], row
+
+
+class SqliteTicketStore(TicketStore):
+    """SQLite в WAL: запись в одном потоке, чтение — в пуле со своими соединениями."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, migrate_from: str | None = None, readers: int = 4):
+        import sqlite3
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._sqlite3 = sqlite3
+        self.path = path
+        self.migrate_from = migrate_from
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tickets-w")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="tickets-r")
+        self._local = threading.local()
+        self._wconn = None
+
+    def _connect(self):
+        conn = self._sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _rconn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    async def _write(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, fn, *args)
+
+    async def _read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, fn, *args)
+
+    # ---------- writer thread ----------
+
+    def _open(self):
+        self._wconn = self._connect()
+        self._wconn.executescript(_SQLITE_SCHEMA)
+        have = {r[1] for r in self._wconn.execute("PRAGMA table_info(tickets)")}
+        for name, kind, fill in _SQLITE_ADDED_COLUMNS:
+            if name not in have:
+                self._wconn.execute(f"ALTER TABLE tickets ADD COLUMN {name} {kind}")
+                if fill:
+                    self._wconn.execute(fill)
+        self._wconn.executescript(_SQLITE_INDEXES)
+        self._wconn.commit()
+        (n,) = self._wconn.execute("SELECT COUNT(*) FROM tickets").fetchone()
+        if n == 0 and self.migrate_from and os.path.exists(self.migrate_from):
+            migrated = self._import_json(self.migrate_from)
+            log.info(f"Migrated {migrated} tickets from {self.migrate_from} into {self.path}")
+
+    def _import_json(self, src: str) -> int:
+        # снапшот + хвост журнала, если раньше работали в режиме journal
+        data = TicketJournal(src, source=dict).load()
+        with self._wconn:
+            self._wconn.executemany(
+                _SQLITE_UPSERT, (_sqlite_params(str(t), r) for t, r in data.items())
+            )
+            self._wconn.executemany(
+                _SQLITE_ADD_KEY, ((k, str(t)) for t, r in data.items() for k in dedup_keys(r))
+            )
+        return len(data)
+
+    def _upsert(self, ticket: str, row: dict):
+        with self._wconn:
+            self._wconn.execute(_SQLITE_UPSERT, _sqlite_params(ticket, row))
+            for k in dedup_keys(row):
+                self._wconn.execute(_SQLITE_ADD_KEY, (k, ticket))
+
+    def _reserve(self, n: int) -> int:
+        # IMMEDIATE берёт блокировку на запись сразу — другие процессы ждут, а не читают старое значение
+        conn = self._wconn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('ticket_seq', 0)")
+            (start,) = conn.execute("SELECT value FROM counters WHERE name = 'ticket_seq'").fetchone()
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'ticket_seq'", (start + n,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return start
+
+    def _checkpoint(self):
+        self._wconn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _shutdown(self):
+        if self._wconn is not None:
+            self._wconn.close()
+            self._wconn = None
+
+    # ---------- reader threads ----------
+
+    def _get(self, ticket: str):
+        r = self._rconn().execute(_SQLITE_SELECT + " WHERE ticket = ?", (ticket,)).fetchone()
+        return _sqlite_row(r)[1] if r else None
+
+    def _by_user(self, user_id: int):
+        rows = self._rconn().execute(
+            _SQLITE_SELECT + " WHERE user_id = ? ORDER BY created_at", (user_id,)
+        ).fetchall()
+        return [_sqlite_row(r) for r in rows]
+
+    def _count(self) -> int:
+        return self._rconn().execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def _by_status(self, status: str, since: str | None, offset: int, limit: int):
+        rows = self._rconn().execute(
+            _SQLITE_SELECT + f" WHERE status = ? AND created_at >= ? AND {_SQLITE_QUEUE_WHERE} "
+            "ORDER BY created_at, ticket LIMIT ? OFFSET ?",
+            (status, since or "", limit, offset),
+        ).fetchall()
+        return [_sqlite_row(r) for r in rows]
+
+    def _find_key(self, key: str) -> str | None:
+        r = self._rconn().execute("SELECT ticket FROM ticket_keys WHERE key = ?", (key,)).fetchone()
+        return r[0] if r else None
+
+    def _page(self, where: str, params: tuple, after: tuple[str, str], chunk: int):
+        # keyset-пагинация по (created_at, ticket): каждая пачка — отдельный короткий запрос
+        rows = self._rconn().execute(
+            _SQLITE_SELECT + f" WHERE (created_at, ticket) > (?, ?){where} ORDER BY created_at, ticket LIMIT ?",
+            (*after, *params, chunk),
+        ).fetchall()
+        return [_sqlite_row(r) for r in rows]
+
+    def _count_status(self, status: str, since: str | None) -> int:
+        return self._rconn().execute(
+            f"SELECT COUNT(*) FROM tickets WHERE status = ? AND created_at >= ? AND {_SQLITE_QUEUE_WHERE}",
+            (status, since or ""),
+        ).fetchone()[0]
+
+    # ---------- async API ----------
+
+    async def load(self) -> None:
+        await self._write(self._open)
+
+    async def close(self) -> None:
+        await self._write(self._shutdown)
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+    async def save(self) -> None:
+        await self._write(self._checkpoint)
+
+    async def compact(self) -> None:
+        await self._write(self._checkpoint)
+
+    async def get(self, ticket: str) -> dict | None:
+        return await self._read(self._get, ticket)
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        await self._write(self._upsert, ticket, row)
+
+    async def by_user(self, user_id: int) -> list[tuple[str, dict]]:
+        return await self._read(self._by_user, user_id)
+
+    async def by_status(
+        self, status: str, since: str | None = None, offset: int = 0, limit: int = 10
+    ) -> list[tuple[str, dict]]:
+        return await self._read(self._by_status, status, since, offset, limit)
+
+    async def count_status(self, status: str, since: str | None = None) -> int:
+        return await self._read(self._count_status, status, since)
+
+    async def find_key(self, key: str) -> str | None:
+        return await self._read(self._find_key, key)
+
+    async def iter_rows(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        user_id: int | None = None,
+        status: str | None = None,
+        chunk: int = 1000,
+    ) -> AsyncIterator[list[tuple[str, dict]]]:
+        where, params = "", ()
+        if until:
+            where, params = where + " AND created_at < ?", params + (until,)
+        if user_id is not None:
+            where, params = where + " AND user_id = ?", params + (user_id,)
+        if status is not None:
+            where, params = where + f" AND status = ? AND {_SQLITE_QUEUE_WHERE}", params + (status,)
+        after = (since or "", "")
+        while True:
+            batch = await self._read(self._page, where, params, after, chunk)
+            if not batch:
+                return
+            yield batch
+            after = (batch[-1][1]["created_at"], batch[-1][0])
+
+    async def count(self) -> int:
+        return await self._read(self._count)
+
+    async def reserve_ids(self, n: int) -> int:
+        return await self._write(self._reserve, n)
+
+
+def _score(iso: str | None) -> float:
+    if not iso:
+        return 0.0
+    try:
+        return datetime.fromisoformat(iso).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class RedisTicketStore(TicketStore):
+    """Заявки в Redis, общие для всех реплик: строка JSON на заявку + множества-индексы.
+
+    Очередь модерации — sorted set на статус со временем создания в качестве score.
+    """
+
+    name = "redis"
+
+    def __init__(self, redis, prefix: str = "vsrap:", migrate_from: str | None = None):
+        self.redis = redis
+        self.prefix = prefix
+        self.migrate_from = migrate_from
+
+    def _k(self, *parts) -> str:
+        return self.prefix + ":".join(str(p) for p in parts)
+
+    async def load(self) -> None:
+        if not self.migrate_from or await self.count():
+            return
+        if not os.path.exists(self.migrate_from):
+            return
+        data = await asyncio.to_thread(TicketJournal(self.migrate_from, source=dict).load)
+        items = list(data.items())
+        for i in range(0, len(items), 1000):
+            pipe = self.redis.pipeline(transaction=False)
+            for t, row in items[i:i + 1000]:
+                self._queue_upsert(pipe, str(t), row)
+            await pipe.execute()
+        log.info(f"Migrated {len(items)} tickets from {self.migrate_from} into Redis")
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    def _queue_upsert(self, pipe, ticket: str, row: dict):
+        pipe.set(self._k("ticket", ticket), json.dumps(row, ensure_ascii=False))
+        pipe.sadd(self._k("tickets"), ticket)
+        if row.get("user_id") is not None:
+            pipe.sadd(self._k("user_tickets", row["user_id"]), ticket)
+        # старый статус не читаем: убираем из всех очередей и кладём в текущую
+        status = queue_status(row)
+        for s in STATUSES:
+            if s != status:
+                pipe.zrem(self._k("queue", s), ticket)
+        if status is not None:
+            pipe.zadd(self._k("queue", status), {ticket: _score(row.get("created_at"))})
+        for k in dedup_keys(row):
+            pipe.hsetnx(self._k("keys"), k, ticket)
+
+    async def get(self, ticket: str) -> dict | None:
+        raw = await self.redis.get(self._k("ticket", ticket))
+        return None if raw is None else json.loads(raw)
+
+    async def upsert(self, ticket: str, row: dict) -> None:
+        # MULTI/EXEC — запись и индексы видны другим репликам одновременно; старую запись
+        # читаем под WATCH: если у заявки сменился user_id, убираем её из набора прежнего
+        key = self._k("ticket", ticket)
+
+        async def write(pipe):
+            raw = await pipe.get(key)
+            old_user = None if raw is None else json.loads(raw).get("user_id")
+            pipe.multi()
+            if old_user is not None and old_user != row.get("user_id"):
+                pipe.srem(self._k("user_tickets", old_user), ticket)
+            self._queue_upsert(pipe, ticket, row)
+
+        await self.redis.transaction(write, key)
+
+    async def exists(self, ticket: str) -> bool:
+        return bool(await self.redis.exists(self._k("ticket", ticket)))
+
+    async def by_user(self, user_id: int) -> list[tuple[str, dict]]:
+        tickets = [t.decode() for t in await self.redis.smembers(self._k("user_tickets", user_id))]
+        if not tickets:
+            return []
+        raws = await self.redis.mget([self._k("ticket", t) for t in tickets])
+        # номера из аллокатора перемешаны — порядок, как у остальных бэкендов, по created_at
+        out = [(t, json.loads(r)) for t, r in zip(tickets, raws) if r is not None]
+        out.sort(key=lambda tr: (tr[1].get("created_at") or "", tr[0]))
+        return out
+
+    async def user_ticket(self, user_id: int, ticket: str) -> dict | None:
+        if not await self.redis.sismember(self._k("user_tickets", user_id), ticket):
+            return None
+        return await self.get(ticket)
+
+    async def by_status(
+        self, status: str, since: str | None = None, offset: int = 0, limit: int = 10
+    ) -> list[tuple[str, dict]]:
+        tickets = [
+            t.decode() for t in await self.redis.zrangebyscore(
+                self._k("queue", status), _score(since), "+inf", start=offset, num=limit
+            )
+        ]
+        if not tickets:
+            return []
+        raws = await self.redis.mget([self._k("ticket", t) for t in tickets])
+        return [(t, json.loads(r)) for t, r in zip(tickets, raws) if r is not None]
+
+    async def count_status(self, status: str, since: str | None = None) -> int:
+        return await self.redis.zcount(self._k("queue", status), _score(since), "+inf")
+
+    async def find_key(self, key: str) -> str | None:
+        raw = await self.redis.hget(self._k("keys"), key)
+        return None if raw is None else raw.decode()
+
+    async def iter_rows(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        user_id: int | None = None,
+        status: str | None = None,
+        chunk: int = 1000,
+    ) -> AsyncIterator[list[tuple[str, dict]]]:
+        # источник номеров: очередь статуса, множество пользователя или SSCAN по всем заявкам
+        if status is not None:
+            source = self.redis.zscan_iter(self._k("queue", status), count=chunk)
+        elif user_id is not None:
+            source = self.redis.sscan_iter(self._k("user_tickets", user_id), count=chunk)
+        else:
+            source = self.redis.sscan_iter(self._k("tickets"), count=chunk)
+        tickets: list[str] = []
+        async for item in source:
+            tickets.append((item[0] if isinstance(item, tuple) else item).decode())
+            if len(tickets) >= chunk:
+                batch = await self._fetch(tickets, since, until, user_id, status)
+                tickets = []
+                if batch:
+                    yield batch
+        if tickets:
+            batch = await self._fetch(tickets, since, until, user_id, status)
+            if batch:
+                yield batch
+
+    async def _fetch(self, tickets: list[str], *filters) -> list[tuple[str, dict]]:
+        raws = await self.redis.mget([self._k("ticket", t) for t in tickets])
+        rows = ((t, json.loads(r)) for t, r in zip(tickets, raws) if r is not None)
+        return [(t, row) for t, row in rows if row_matches(row, *filters)]
+
+    async def count(self) -> int:
+        return await self.redis.scard(self._k("tickets"))
+
+    async def reserve_ids(self, n: int) -> int:
+        return await self.redis.incrby(self._k("ticket_seq"), n) - n
+
+
+def make_store(kind: str, path: str, **opts) -> TicketStore:
+    kind = (kind or "json").strip().lower()
+    if kind == "json":
+        return JsonTicketStore(path)
+    if kind == "journal":
+        return JournalTicketStore(
+            path,
+            compact_every=opts.get("compact_every", 5000),
+            compact_interval=opts.get("compact_interval", 600.0),
+        )
+    if kind == "columnar":
+        return ColumnarTicketStore(
+            path,
+            compact_every=opts.get("compact_every", 5000),
+            compact_interval=opts.get("compact_interval", 600.0),
+        )
+    if kind == "sqlite":
+        return SqliteTicketStore(opts.get("sqlite_path") or path + ".sqlite3", migrate_from=path)
+    if kind == "redis":
+        return RedisTicketStore(opts["redis"], prefix=opts.get("redis_prefix", "vsrap:"), migrate_from=path)
+    raise ValueError(f"Unknown TICKETS_STORAGE: {kind}")
+
+
+# =======================
+#   CLI
+# =======================
+
+async def _migrate(src: str, dst: str):
+    store = SqliteTicketStore(dst, migrate_from=src)
+    await store.load()
+    log.info(f"{dst}: {await store.count()} tickets")
+    await store.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Одноразовая миграция tickets.json в SQLite")
+    ap.add_argument("src", help="tickets.json")
+    ap.add_argument("dst", help="tickets.sqlite3")
+    args = ap.parse_args()
+    asyncio.run(_migrate(args.src, args.dst))
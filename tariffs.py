@@ -0,0 +1,56 @@
+# =======================
+#   TARIFFS
+# =======================
+# Единственный источник тарифов: по этим таблицам считает payouts.py
+# и из них же собирается RATES_TEXT в main.py.
+
+# площадка -> (название в тексте, единица просмотров, [(порог, выплата ₽), ...] по возрастанию порога)
+VIDEO_TIERS: dict[str, tuple[str, str, tuple[tuple[int, int], ...]]] = {
+    "tiktok": ("TikTok", "просмотров", (
+        (100_000, 500),
+        (200_000, 1_000),
+        (1_000_000, 4_000),
+    )),
+    "youtube": ("YouTube Shorts", "вовлечённых", (
+        (100_000, 700),
+    )),
+    "other": ("Другие площадки", "", (
+        (100_000, 500),
+    )),
+}
+
+# месячное вознаграждение аккаунта: суммарные просмотры за календарный месяц -> ₽
+MONTHLY_TIERS: tuple[tuple[int, int], ...] = (
+    (500_000, 1_000),
+    (1_000_000, 3_000),
+    (3_000_000, 5_000),
+    (5_000_000, 10_000),
+)
+MONTHLY_MIN_VIDEOS = 5
+
+# ключ площадки из links.canonical_video -> строка VIDEO_TIERS
+PLATFORM_OF_LINK = {
+    "tiktok": "tiktok",
+    "tiktok-short": "tiktok",
+    "youtube": "youtube",
+}
+
+
+def fmt_num(n: int) -> str:
+    return f"{n:,}".replace(",", " ")
+
+
+def video_tier_lines() -> list[str]:
+    lines = []
+    for title, unit, tiers in VIDEO_TIERS.values():
+        for threshold, amount in tiers:
+            views = f"{fmt_num(threshold)} {unit}".rstrip()
+            lines.append(f"• {title} от {views} — {fmt_num(amount)} ₽")
+    return lines
+
+
+def monthly_tier_lines() -> list[str]:
+    return [
+        f"• от {fmt_num(threshold)} суммарных просмотров за месяц — {fmt_num(amount)} ₽"
+        for threshold, amount in MONTHLY_TIERS
+    ]
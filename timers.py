@@ -0,0 +1,202 @@
+import math
+import time
+import heapq
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+log = logging.getLogger("vsrap-bot.timers")
+
+Handler = Callable[[str, Any], Awaitable[Any]]
+
+
+class _Slot(dict):
+    """key -> (kind, data, tick); id слота — в самом слоте, чтобы таймер ссылался на общий объект."""
+
+    __slots__ = ("id",)
+
+    def __init__(self, sid: int):
+        super().__init__()
+        self.id = sid
+
+
+class TimerWheel:
+    """Отложенные задачи по ключу: иерархическое колесо с шагом tick секунд.
+
+    Уровень L — слоты шириной 64**L шагов; таймер кладётся на самый мелкий уровень, где
+    до срока меньше 64 его слотов: ближайшая минута — посекундно, дальние сроки — в общие
+    крупные слоты. Когда крупный слот наступает, его таймеры спускаются уровнем ниже,
+    так что каждый переезжает не больше числа уровней раз. Слот — словарь
+    key -> (kind, data, tick); в heap лежат только id непустых слотов (начало << 3 | уровень),
+    их на порядки меньше, чем таймеров. schedule и cancel — операции со словарями,
+    повторный schedule того же ключа переносит таймер.
+
+    Одна задача спит до ближайшего слота: сколько бы таймеров ни ждало, цикл событий
+    просыпается не чаще раза в tick. Время — time.time(), чтобы сроки можно было хранить
+    в заявках и состоянии и заводить таймеры заново после рестарта.
+
+    Обработчик вызывается как handler(key, data) по kind таймера; одновременно — не
+    больше concurrency, остальные ждут (после простоя может сработать много сразу).
+    """
+
+    BITS = 6
+
+    def __init__(self, tick: float = 1.0, concurrency: int = 32):
+        self.tick = tick
+        self._slots: dict[int, _Slot] = {}
+        self._slot_of: dict[str, _Slot] = {}
+        self._heap: list[int] = []
+        self._queued: set[int] = set()
+        self._handlers: dict[str, Handler] = {}
+        self._sem = asyncio.Semaphore(concurrency)
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        # до какого шага сейчас спит _run — более ранний новый слот будит его
+        self._sleep_until = math.inf
+
+        self.fired = 0
+        self.failed = 0
+        self.late_max = 0.0
+
+    # ---------- API ----------
+
+    def on(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    def schedule(self, key: str, at: float, kind: str, data: Any = None):
+        """Завести (или перенести) таймер key на момент at (unix time)."""
+        self.cancel(key)
+        self._place(key, math.ceil(at / self.tick), kind, data, math.floor(time.time() / self.tick))
+
+    def _place(self, key: str, tick: int, kind: str, data: Any, now: int):
+        level, span = 0, 1 << self.BITS
+        while tick - now >= span:
+            level += 1
+            span <<= self.BITS
+        shift = self.BITS * level
+        start = tick >> shift << shift
+        sid = start << 3 | level
+        bucket = self._slots.get(sid)
+        if bucket is None:
+            bucket = self._slots[sid] = _Slot(sid)
+            if sid not in self._queued:
+                self._queued.add(sid)
+                heapq.heappush(self._heap, sid)
+            if start < self._sleep_until and self._wakeup is not None:
+                self._wakeup.set()
+        bucket[key] = (kind, data, tick)
+        self._slot_of[key] = bucket
+
+    def cancel(self, key: str) -> bool:
+        bucket = self._slot_of.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        if not bucket:
+            # номер слота остаётся в heap и будет пропущен, когда до него дойдёт очередь
+            del self._slots[bucket.id]
+        return True
+
+    def every(self, kind: str, interval: float, job: Callable[[], Awaitable[Any]]):
+        """Периодическая задача: следующий запуск — через interval после конца предыдущего."""
+        key = f"every:{kind}"
+
+        async def run(_key: str, _data: Any):
+            try:
+                await job()
+            finally:
+                self.schedule(key, time.time() + interval, kind)
+
+        self.on(kind, run)
+        self.schedule(key, time.time() + interval, kind)
+
+    def due_at(self, key: str) -> float | None:
+        bucket = self._slot_of.get(key)
+        return None if bucket is None else bucket[key][2] * self.tick
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._slot_of
+
+    def pop_due(self, now: float) -> list[tuple[str, str, Any]]:
+        """Снять все таймеры со сроком не позже now: [(key, kind, data)] по возрастанию срока."""
+        out = []
+        limit = math.floor(now / self.tick)
+        while self._heap and self._heap[0] >> 3 <= limit:
+            sid = heapq.heappop(self._heap)
+            self._queued.discard(sid)
+            bucket = self._slots.pop(sid, None)
+            if not bucket:
+                continue
+            if sid & 7:
+                # крупный слот наступил — его таймеры спускаются в слоты помельче
+                for key, (kind, data, tick) in bucket.items():
+                    self._place(key, tick, kind, data, limit)
+                continue
+            for key, (kind, data, _) in bucket.items():
+                del self._slot_of[key]
+                out.append((key, kind, data))
+            self.late_max = max(self.late_max, now - (sid >> 3) * self.tick)
+        return out
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "pending": len(self._slot_of),
+            "slots": len(self._slots),
+            "running": len(self._running),
+            "fired": self.fired,
+            "failed": self.failed,
+            "late_max": self.late_max,
+        }
+
+    # ---------- loop ----------
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for t in list(self._running):
+            t.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for key, kind, data in self.pop_due(now):
+                self._fire(key, kind, data)
+            self._wakeup.clear()
+            self._sleep_until = self._heap[0] >> 3 if self._heap else math.inf
+            timeout = None if not self._heap else max((self._heap[0] >> 3) * self.tick - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire(self, key: str, kind: str, data: Any):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            log.warning(f"No handler for timer {key} ({kind})")
+            return
+        task = asyncio.create_task(self._call(handler, key, data))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _call(self, handler: Handler, key: str, data: Any):
+        async with self._sem:
+            try:
+                await handler(key, data)
+                self.fired += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                log.exception(f"Timer {key} failed")
@@ -0,0 +1,197 @@
+import os
+import json
+import bisect
+import asyncio
+import logging
+from typing import Iterable
+
+from storage import _write_snapshot
+
+log = logging.getLogger("vsrap-bot.users")
+
+
+class UserRegistry:
+    """Все, кто писал боту (chat_id личного чата), без повторов — для рассылок.
+
+    Обход — по возрастанию chat_id (page(after, limit)), поэтому курсор рассылки —
+    просто последний обработанный id. Здесь же хранится состояние идущей рассылки.
+    """
+
+    name = "base"
+
+    async def load(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def add(self, chat_id: int) -> bool:
+        """True, если пользователь новый."""
+        raise NotImplementedError
+
+    async def add_many(self, chat_ids: Iterable[int]) -> int:
+        added = 0
+        for chat_id in chat_ids:
+            added += await self.add(chat_id)
+        return added
+
+    async def remove(self, chat_id: int) -> None:
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def page(self, after: int | None, limit: int) -> list[int]:
+        """До limit chat_id строго больше after, по возрастанию."""
+        raise NotImplementedError
+
+    async def get_job(self) -> dict | None:
+        raise NotImplementedError
+
+    async def save_job(self, job: dict | None) -> None:
+        raise NotImplementedError
+
+
+class FileUserRegistry(UserRegistry):
+    """Отсортированный список в памяти + JSONL-лог ["add"|"del", chat_id]; при старте лог сжимается.
+
+    Рассылка — отдельным JSON рядом (path + ".broadcast"), переписывается атомарно.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.job_path = path + ".broadcast"
+        self.ids: list[int] = []
+        self.known: set[int] = set()
+        self._fh = None
+
+    async def load(self) -> None:
+        known: set[int] = set()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op, chat_id = json.loads(line)
+                    except Exception:
+                        continue
+                    if op == "add":
+                        known.add(chat_id)
+                    else:
+                        known.discard(chat_id)
+        except FileNotFoundError:
+            pass
+        self.known = known
+        self.ids = sorted(known)
+        await asyncio.to_thread(self._rewrite)
+        if known:
+            log.info(f"Loaded {len(known)} users from {self.path}")
+
+    def _rewrite(self):
+        if self._fh is not None:
+            self._fh.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(f'["add",{chat_id}]\n' for chat_id in self.ids)
+        os.replace(tmp, self.path)
+        self._fh = open(self.path, "a", encoding="utf-8")
+
+    def _write(self, op: str, chat_id: int):
+        try:
+            self._fh.write(f'["{op}",{chat_id}]\n')
+            self._fh.flush()
+        except Exception as e:
+            log.error(f"Failed to persist users to {self.path}: {e}")
+
+    async def add(self, chat_id: int) -> bool:
+        if chat_id in self.known:
+            return False
+        self.known.add(chat_id)
+        bisect.insort(self.ids, chat_id)
+        self._write("add", chat_id)
+        return True
+
+    async def remove(self, chat_id: int) -> None:
+        if chat_id not in self.known:
+            return
+        self.known.discard(chat_id)
+        del self.ids[bisect.bisect_left(self.ids, chat_id)]
+        self._write("del", chat_id)
+
+    async def count(self) -> int:
+        return len(self.ids)
+
+    async def page(self, after: int | None, limit: int) -> list[int]:
+        start = 0 if after is None else bisect.bisect_right(self.ids, after)
+        return self.ids[start:start + limit]
+
+    async def get_job(self) -> dict | None:
+        try:
+            with open(self.job_path, "r", encoding="utf-8") as f:
+                return json.load(f) or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error(f"Failed to read {self.job_path}: {e}")
+            return None
+
+    async def save_job(self, job: dict | None) -> None:
+        if job is None:
+            try:
+                os.remove(self.job_path)
+            except FileNotFoundError:
+                pass
+            return
+        await asyncio.to_thread(_write_snapshot, self.job_path, job)
+
+    async def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class RedisUserRegistry(UserRegistry):
+    """Sorted set {prefix}users со score = chat_id — общий для всех реплик."""
+
+    name = "redis"
+
+    def __init__(self, redis, prefix: str = "vsrap:"):
+        self.redis = redis
+        self.key = prefix + "users"
+        self.job_key = prefix + "broadcast"
+
+    async def add(self, chat_id: int) -> bool:
+        return bool(await self.redis.zadd(self.key, {str(chat_id): chat_id}, nx=True))
+
+    async def add_many(self, chat_ids: Iterable[int]) -> int:
+        added, batch = 0, {}
+        for chat_id in chat_ids:
+            batch[str(chat_id)] = chat_id
+            if len(batch) >= 1000:
+                added += await self.redis.zadd(self.key, batch, nx=True)
+                batch = {}
+        if batch:
+            added += await self.redis.zadd(self.key, batch, nx=True)
+        return added
+
+    async def remove(self, chat_id: int) -> None:
+        await self.redis.zrem(self.key, str(chat_id))
+
+    async def count(self) -> int:
+        return await self.redis.zcard(self.key)
+
+    async def page(self, after: int | None, limit: int) -> list[int]:
+        low = "-inf" if after is None else f"({after}"
+        raw = await self.redis.zrangebyscore(self.key, low, "+inf", start=0, num=limit)
+        return [int(r) for r in raw]
+
+    async def get_job(self) -> dict | None:
+        raw = await self.redis.get(self.job_key)
+        return None if raw is None else json.loads(raw)
+
+    async def save_job(self, job: dict | None) -> None:
+        if job is None:
+            await self.redis.delete(self.job_key)
+        else:
+            await self.redis.set(self.job_key, json.dumps(job, ensure_ascii=False))
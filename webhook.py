@@ -0,0 +1,108 @@
+import hmac
+import signal
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+log = logging.getLogger("vsrap-bot.webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookIngest:
+    """Принимает апдейты от Telegram, сразу отвечает 200 и обрабатывает их в фоне."""
+
+    def __init__(self, bot: Bot, dp: Dispatcher, secret: str | None = None, concurrency: int = 64):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret or None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret is not None:
+            got = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(got, self.secret):
+                self.rejected += 1
+                return web.Response(status=401)
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except Exception as e:
+            log.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        self.received += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        async with self._slots:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                log.error(f"Update {update.update_id} failed: {e}")
+
+    def backlog(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    url: str,
+    path: str = "/webhook",
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    secret: str | None = None,
+    concurrency: int = 64,
+    register: bool = True,
+):
+    ingest = WebhookIngest(bot, dp, secret=secret, concurrency=concurrency)
+    runner = web.AppRunner(ingest.app(path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f"Webhook listening on {host}:{port}{path}")
+
+    await dp.emit_startup(bot=bot)
+    if register:
+        await bot.set_webhook(
+            url.rstrip("/") + path,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    # как start_polling: SIGTERM/SIGINT завершают штатно, и вызывающий успевает закрыться
+    # (отпустить аренду рассылки, дописать журналы), а не умирает посреди работы
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    try:
+        for sig in signals:
+            loop.add_signal_handler(sig, stopping.set)
+    except NotImplementedError:  # Windows
+        signals = ()
+    try:
+        await stopping.wait()
+        log.info("Webhook stopping")
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()
+        await ingest.drain()
+        await dp.emit_shutdown(bot=bot)